@@ -1,14 +1,158 @@
+import atexit
 import logging
+import os
+from functools import partial
 
 from flask import Flask, json
 
+import tasks
+from ssh_manager_backend.app.middlewares.auth import Auth
+from ssh_manager_backend.app.models import (
+    AccessControlModel,
+    Hosts,
+    Roles,
+    Sessions,
+)
+from ssh_manager_backend.app.services import (
+    change_listener,
+    grant_coalescer,
+    grant_index,
+    host_index,
+    revocations,
+    role_resolver,
+    rsa,
+    signed_tokens,
+    ssh_ca,
+    x25519,
+)
+from ssh_manager_backend.app.services.key_store import DatabaseKeyStore, FileKeyStore
 from ssh_manager_backend.config import routes
-from ssh_manager_backend.db.database import db_session
+from ssh_manager_backend.db.database import db_session, engine
 
 app = Flask(__name__)
+app.wsgi_app = Auth(app.wsgi_app)
 
 app.register_blueprint(routes.rsa_)
 app.register_blueprint(routes.users_)
+app.register_blueprint(routes.metrics_)
+app.register_blueprint(routes.acl_)
+
+# The transport keys are shared by all the workers of this node. Use DatabaseKeyStore to share them across nodes.
+key_store = FileKeyStore()
+rsa.key_store = key_store
+x25519.key_store = key_store
+signed_tokens.key_store = key_store
+# The hosts trust the SSH certificate authority until it changes, so its key is kept in the database, encrypted with
+# SSH_CA_PASSPHRASE. The certificate endpoints are disabled until the passphrase is set.
+if os.environ.get("SSH_CA_PASSPHRASE"):
+    ssh_ca.key_store = DatabaseKeyStore()
+    ssh_ca.passphrase = os.environ["SSH_CA_PASSPHRASE"].encode()
+    ssh_ca.enabled = True
+x25519.ensure_key_pair()
+rsa.start_rotation()
+
+
+def revoked_token_hashes():
+    """
+    Loads the revoked signed access tokens on the thread of the revocation filter.
+    """
+
+    try:
+        return Sessions().revoked_token_hashes()
+    finally:
+        db_session.remove()
+
+
+def all_grants():
+    """
+    Loads the grants on the thread of the grant index.
+    """
+
+    try:
+        return AccessControlModel().all_grants()
+    finally:
+        db_session.remove()
+
+
+def all_hosts():
+    """
+    Loads the host registry on the thread of the host index.
+    """
+
+    try:
+        return Hosts().all_hosts()
+    finally:
+        db_session.remove()
+
+
+def all_group_grants():
+    """
+    Loads the group grants on the thread of the host index.
+    """
+
+    try:
+        return AccessControlModel().all_group_grants()
+    finally:
+        db_session.remove()
+
+
+def role_snapshot():
+    """
+    Loads the roles on the thread of the role resolver.
+    """
+
+    try:
+        return Roles().snapshot()
+    finally:
+        db_session.remove()
+
+
+def listener_connection():
+    """
+    Opens the dedicated connection of the change listener, outside of the connection pool.
+    """
+
+    connection = engine.raw_connection()
+    connection.detach()
+    return connection.connection
+
+
+# The listener starts before the indexes, which are only used while it is connected.
+change_listener.connect = listener_connection
+change_listener.start_listening()
+
+grant_index.source = all_grants
+grant_index.version_source = partial(change_listener.version, "grants")
+grant_index.start_sync()
+host_index.hosts_source = all_hosts
+host_index.grants_source = all_group_grants
+host_index.version_source = partial(change_listener.version, "hosts")
+host_index.start_sync()
+role_resolver.source = role_snapshot
+role_resolver.version_source = partial(change_listener.version, "roles")
+role_resolver.start_sync()
+
+
+def dispatch_batch(operation, ssh_key, remote_user, items):
+    """
+    Enqueues a batch of grants or revocations coalesced by the grant coalescer.
+    """
+
+    task = (
+        tasks.grant_access_batch if operation == "grant" else tasks.revoke_access_batch
+    )
+    task.delay(ssh_key, remote_user, items)
+
+
+grant_coalescer.dispatch = dispatch_batch
+grant_coalescer.start_flush()
+# The pending batches are only in memory, dispatch them before the process exits.
+atexit.register(grant_coalescer.close)
+
+# Signed access tokens are opt-in, set signed_tokens.enabled to issue them on login. The revocations are synced either
+# way, as the flag may be set after this module is imported and the tokens issued until then must stay revocable.
+revocations.source = revoked_token_hashes
+revocations.start_sync()
 
 
 @app.teardown_appcontext
@@ -0,0 +1,104 @@
+import base64
+import json
+import os
+import sys
+import timeit
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, x25519
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from ssh_manager_backend.app.services import envelope, rsa, session_keys  # noqa: E402
+from ssh_manager_backend.app.services import x25519 as server_x25519  # noqa: E402
+from ssh_manager_backend.app.services.aes import AES, AESGCM  # noqa: E402
+
+
+"""
+Compares the server side cost of one request round trip (opening the request and sealing the response) for the v1
+and v2 envelopes, and for the v2 envelope over the X25519 transport.
+
+Usage: python benchmarks/envelope_benchmark.py [iterations]
+"""
+
+PAYLOAD = json.dumps(
+    {"username": "test_username", "password": "test_password", "name": "test_user"}
+)
+
+
+def wrap(plaintext: bytes) -> str:
+    ciphertext: bytes = rsa._public_key.encrypt(
+        plaintext,
+        padding.OAEP(
+            mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+        ),
+    )
+    return base64.encodebytes(ciphertext).decode()
+
+
+def v1_body() -> dict:
+    key: bytes = os.urandom(32)
+    iv: bytes = os.urandom(16)
+    return {
+        "key": wrap(key),
+        "iv": wrap(iv),
+        "data": base64.encodebytes(AES(key=key, iv=iv).encrypt(PAYLOAD)).decode(),
+    }
+
+
+def v2_body() -> dict:
+    key: bytes = os.urandom(32)
+    nonce, ciphertext = AESGCM(key=key).encrypt(
+        plaintext=PAYLOAD, associated_data=envelope.REQUEST_AAD
+    )
+    return {
+        "version": 2,
+        "key": wrap(key),
+        "nonce": base64.encodebytes(nonce).decode(),
+        "data": base64.encodebytes(ciphertext).decode(),
+    }
+
+
+def x25519_body() -> dict:
+    client_public_key: bytes = (
+        x25519.X25519PrivateKey.generate()
+        .public_key()
+        .public_bytes(
+            encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+        )
+    )
+    key: bytes = server_x25519.derive_key(peer_public_key=client_public_key)
+    nonce, ciphertext = AESGCM(key=key).encrypt(
+        plaintext=PAYLOAD, associated_data=envelope.REQUEST_AAD
+    )
+    return {
+        "version": 2,
+        "ephemeral_public_key": base64.encodebytes(client_public_key).decode(),
+        "nonce": base64.encodebytes(nonce).decode(),
+        "data": base64.encodebytes(ciphertext).decode(),
+    }
+
+
+def round_trip(body: dict) -> None:
+    data, key, iv = envelope.open_request(body=body)
+    envelope.seal_response(data={"success": True}, key=key, iv=iv)
+
+
+def main(iterations: int) -> None:
+    rsa.generate_key_pair()
+    server_x25519.generate_key_pair()
+    session_keys.enabled = False
+
+    for name, body in (
+        ("v1", v1_body()),
+        ("v2", v2_body()),
+        ("v2 x25519", x25519_body()),
+    ):
+        seconds: float = min(
+            timeit.repeat(lambda: round_trip(body), number=iterations, repeat=3)
+        )
+        print(f"{name}: {seconds / iterations * 1000:.3f} ms per request")
+
+
+if __name__ == "__main__":
+    main(iterations=int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from tasks import executors  # noqa: E402
+from tasks.executors import AnsibleExecutor, AsyncSSHExecutor  # noqa: E402
+from tests.fake_ssh import FakeSSHServer  # noqa: E402
+
+
+"""
+Measures how many hosts per second the executors push a grant to.
+
+With --fake, the asyncio executor runs against an in-process stand-in of the hosts, where every connection and command
+takes --latency seconds, with a throwaway CA key. Otherwise both executors push to the hosts of --hosts-file(one per line), connecting as
+--remote-user with the private key of --key; the grant installs the CA key ssh_ca/<--ca-name>.pub, which is revoked at
+the end.
+
+Usage: python benchmarks/executor_benchmark.py --fake --hosts 100 1000 --latency 0.05 --max-in-flight 100
+       python benchmarks/executor_benchmark.py --hosts-file hosts.txt --key admin.pem --remote-user ubuntu
+"""
+
+
+def measure(name: str, executor, ssh_key, remote_user: str, host_vars) -> None:
+    for operation in ("grant", "grant", "revoke"):
+        start = time.perf_counter()
+        results = executor.push(operation, ssh_key, remote_user, host_vars)
+        elapsed = time.perf_counter() - start
+        failed = sum(not result.ok for result in results.values())
+        print(
+            f"{name:>8} {operation:>6} {len(host_vars):>6} hosts: {elapsed:8.2f}s "
+            f"{len(host_vars) / elapsed:10.1f} hosts/s, {failed} failed"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fake", action="store_true")
+    parser.add_argument("--hosts", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--hosts-file")
+    parser.add_argument("--key")
+    parser.add_argument("--remote-user", default="ubuntu")
+    parser.add_argument("--ca-name", default="admin_benchmark")
+    parser.add_argument("--max-in-flight", type=int, default=100)
+    arguments = parser.parse_args()
+
+    if arguments.fake:
+        executors.SSH_CA_DIR = tempfile.mkdtemp()
+        with open(
+            os.path.join(executors.SSH_CA_DIR, f"{arguments.ca_name}.pub"), "w"
+        ) as public_key_file:
+            public_key_file.write("ssh-ed25519 AAAA benchmark\n")
+
+        for count in arguments.hosts:
+            server = FakeSSHServer(latency=arguments.latency)
+            executor = AsyncSSHExecutor(
+                connect=server.connect, max_in_flight=arguments.max_in_flight
+            )
+            host_vars = {
+                f"10.{i // 65536}.{i // 256 % 256}.{i % 256}": {
+                    "ca_name": arguments.ca_name
+                }
+                for i in range(count)
+            }
+            measure("asyncio", executor, b"", arguments.remote_user, host_vars)
+            executor.close()
+        return
+
+    with open(arguments.hosts_file) as hosts_file:
+        hosts = [line.strip() for line in hosts_file if line.strip()]
+    with open(arguments.key, "rb") as key_file:
+        ssh_key = key_file.read()
+    host_vars = {host: {"ca_name": arguments.ca_name} for host in hosts}
+
+    measure("ansible", AnsibleExecutor(), ssh_key, arguments.remote_user, host_vars)
+    executor = AsyncSSHExecutor(max_in_flight=arguments.max_in_flight)
+    measure("asyncio", executor, ssh_key, arguments.remote_user, host_vars)
+    executor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from ssh_manager_backend.app.models import AccessControlModel  # noqa: E402
+from ssh_manager_backend.db import AccessGrant, User  # noqa: E402
+from ssh_manager_backend.db.database import db_session  # noqa: E402
+
+
+"""
+Compares checking many (username, host) pairs one query per pair(has_access) with checking them in a single query
+(has_access_batch), against the database configured in ssh_manager_backend.db.database.
+
+The benchmark creates bench_user_* users with grants to random hosts and deletes them at the end.
+
+Usage: python benchmarks/has_access_benchmark.py --users 1000 --hosts-per-user 100 --pairs 1000 5000
+"""
+
+USERNAME_PREFIX = "bench_user_"
+
+
+def populate(users: int, hosts_per_user: int) -> None:
+    session = db_session()
+    session.execute(
+        User.__table__.insert(),
+        [
+            {
+                "name": f"{USERNAME_PREFIX}{i}",
+                "username": f"{USERNAME_PREFIX}{i}",
+                "admin": False,
+                **{
+                    column: os.urandom(16)
+                    for column in [
+                        "password",
+                        "encrypted_dek",
+                        "iv_for_dek",
+                        "salt_for_dek",
+                        "iv_for_kek",
+                        "salt_for_kek",
+                        "salt_for_password",
+                    ]
+                },
+            }
+            for i in range(users)
+        ],
+    )
+    user_ids = [
+        row.id
+        for row in session.query(User.id).filter(
+            User.username.like(f"{USERNAME_PREFIX}%")
+        )
+    ]
+    session.execute(
+        AccessGrant.__table__.insert(),
+        [
+            {
+                "user_id": user_id,
+                "host": f"10.0.{i // 256}.{i % 256}",
+                "remote_user": "",
+            }
+            for user_id in user_ids
+            for i in random.sample(range(65536), hosts_per_user)
+        ],
+    )
+    session.commit()
+
+
+def cleanup() -> None:
+    session = db_session()
+    user_ids = session.query(User.id).filter(User.username.like(f"{USERNAME_PREFIX}%"))
+    session.query(AccessGrant).filter(
+        AccessGrant.user_id.in_(user_ids.subquery())
+    ).delete(synchronize_session=False)
+    session.query(User).filter(User.username.like(f"{USERNAME_PREFIX}%")).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--hosts-per-user", type=int, default=100)
+    parser.add_argument("--pairs", type=int, nargs="+", default=[100, 1000, 5000])
+    arguments = parser.parse_args()
+
+    cleanup()
+    populate(users=arguments.users, hosts_per_user=arguments.hosts_per_user)
+    acl = AccessControlModel()
+
+    try:
+        for size in arguments.pairs:
+            pairs = [
+                (
+                    f"{USERNAME_PREFIX}{random.randrange(arguments.users)}",
+                    f"10.0.{random.randrange(256)}.{random.randrange(256)}",
+                )
+                for _ in range(size)
+            ]
+
+            start = time.perf_counter()
+            looped = [
+                acl.has_access(username=username, ip_address=host)
+                for username, host in pairs
+            ]
+            loop_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            batched = acl.has_access_batch(pairs=pairs)
+            batch_time = time.perf_counter() - start
+
+            assert looped == batched
+            print(
+                f"{size:>6} pairs: per pair loop {loop_time * 1000:.1f} ms, "
+                f"batch {batch_time * 1000:.1f} ms ({loop_time / batch_time:.1f}x)"
+            )
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+
+
+"""
+Measures the latency of validating an access token as the sessions table grows, comparing the single indexed lookup
+on the token hash(Sessions.validate) with the previous path of separate, unindexed queries by username(exists,
+is_active, user_access_token).
+
+The benchmark creates its own bench_users and bench_sessions tables with the same columns and indexes as the users and
+sessions tables, fills them with generate_series and drops them at the end.
+
+Usage: python benchmarks/session_validation_benchmark.py --db-uri postgresql+psycopg2://... --sizes 10000 1000000
+"""
+
+SETUP = """
+DROP TABLE IF EXISTS bench_sessions;
+DROP TABLE IF EXISTS bench_users;
+CREATE TABLE bench_users (id SERIAL PRIMARY KEY, username VARCHAR UNIQUE, admin BOOLEAN);
+CREATE TABLE bench_sessions (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR REFERENCES bench_users (username),
+    access_token VARCHAR,
+    token_hash VARCHAR(64),
+    active BOOLEAN,
+    expires_at TIMESTAMP
+);
+"""
+
+POPULATE = """
+INSERT INTO bench_users (username, admin)
+SELECT 'user_' || i, false FROM generate_series(:start, :stop) AS i;
+INSERT INTO bench_sessions (username, access_token, token_hash, active, expires_at)
+SELECT 'user_' || i, 'token_' || i, encode(sha256(('token_' || i)::bytea), 'hex'), true,
+       now() + interval '1 day'
+FROM generate_series(:start, :stop) AS i;
+"""
+
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS bench_sessions_token_hash ON bench_sessions (token_hash);
+ANALYZE bench_users;
+ANALYZE bench_sessions;
+"""
+
+VALIDATE = text(
+    "SELECT bench_users.id, bench_users.username, bench_users.admin, bench_sessions.active, "
+    "bench_sessions.expires_at FROM bench_sessions JOIN bench_users "
+    "ON bench_users.username = bench_sessions.username "
+    "WHERE bench_sessions.token_hash = encode(sha256(CAST(:token AS bytea)), 'hex')"
+)
+
+LEGACY = [
+    text("SELECT id FROM bench_sessions WHERE username = :username LIMIT 1"),
+    text("SELECT active FROM bench_sessions WHERE username = :username LIMIT 1"),
+    text("SELECT access_token FROM bench_sessions WHERE username = :username LIMIT 1"),
+    text("SELECT * FROM bench_users WHERE username = :username LIMIT 1"),
+]
+
+
+def measure(connection, statements, parameters, lookups: int) -> float:
+    """
+    Returns the median latency(in milliseconds) of running the statements for random existing rows.
+    """
+
+    latencies = []
+    for _ in range(lookups):
+        row_parameters = parameters()
+        start = time.perf_counter()
+        for statement in statements:
+            connection.execute(statement, row_parameters).fetchall()
+        latencies.append(time.perf_counter() - start)
+
+    return statistics.median(latencies) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db-uri", required=True)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000, 5000000]
+    )
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--legacy", action="store_true", help="also time the old path")
+    arguments = parser.parse_args()
+
+    engine = create_engine(arguments.db_uri)
+    with engine.connect() as connection:
+        connection.execute(text(SETUP))
+
+        populated = 0
+        for size in sorted(arguments.sizes):
+            connection.execute(text(POPULATE), {"start": populated + 1, "stop": size})
+            connection.execute(text(INDEXES))
+            populated = size
+
+            def token_parameters():
+                return {"token": f"token_{random.randint(1, size)}"}
+
+            def username_parameters():
+                return {"username": f"user_{random.randint(1, size)}"}
+
+            result = (
+                f"{size:>10} sessions: validate "
+                f"{measure(connection, [VALIDATE], token_parameters, arguments.lookups):.3f} ms"
+            )
+            if arguments.legacy:
+                legacy_lookups = max(1, arguments.lookups // 10)
+                result += (
+                    ", legacy "
+                    f"{measure(connection, LEGACY, username_parameters, legacy_lookups):.3f} ms"
+                )
+
+            print(result)
+
+        connection.execute(text("DROP TABLE bench_sessions; DROP TABLE bench_users;"))
+
+
+if __name__ == "__main__":
+    main()
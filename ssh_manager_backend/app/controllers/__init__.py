@@ -1,4 +1,5 @@
 from ssh_manager_backend.app.controllers import api_controller
+from ssh_manager_backend.app.controllers.acl import AclController
 
 # from ssh_manager_backend.app.controllers.key import Key
 from ssh_manager_backend.app.controllers.secrets import Secrets
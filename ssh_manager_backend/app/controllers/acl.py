@@ -1,26 +1,88 @@
-import base64
-from typing import Dict, List
+import ipaddress
+import re
+from typing import Dict, List, Set, Tuple, Union
 
 from flask import Response
 
 import tasks
 from ssh_manager_backend.app.controllers import api_controller as api
-from ssh_manager_backend.app.models import AccessControlModel, UserModel
-from ssh_manager_backend.app.services import AES, utils
-from ssh_manager_backend.db import Key, User
+from ssh_manager_backend.app.controllers.secrets import unlock_dek
+from ssh_manager_backend.app.models import (
+    AccessControlModel,
+    Hosts,
+    PrivateKeys,
+    Roles,
+    Users,
+)
+from ssh_manager_backend.app.models.access_control import Cursor
+from ssh_manager_backend.app.services import (
+    crypto_executor,
+    grant_coalescer,
+    ssh_ca,
+    utils,
+)
+from ssh_manager_backend.app.services.grant_index import is_valid_host, normalize_host
+from ssh_manager_backend.app.services.host_index import canonical_selector
+from ssh_manager_backend.app.services.principal_cache import Principal
+from ssh_manager_backend.db import PrivateKey, User
+
+# A login user of the hosts, as accepted by useradd
+LOGIN_USER = re.compile(r"^[a-z_][a-z0-9_.-]{0,31}$")
 
 
 class AclController:
+    max_hosts = 1000  # maximum number of hosts per reverse lookup
+    max_page_size = 1000  # maximum number of users per host and page
+    max_network_size = 65536  # maximum number of addresses of a granted network
+    max_principals = 256  # maximum number of "remote_user@host" in a certificate
+
     def __init__(self, access_token: str):
-        access_token = base64.decodebytes(
-            bytes(access_token, encoding="utf-8")
-        ).decode()
-        self.admin_username = access_token.split("+")[-1]
-        self.admin_user: User = UserModel().get_user(username=self.username)
+        self.principal: Principal = api.get_principal(access_token=access_token)
+        self.admin_username: str = self.principal.username
+        self._admin_user: Union[User, None] = None
+
+    @property
+    def admin_user(self) -> User:
+        """
+        Loads the full user row of the admin, which is only needed for decrypting the admin's SSH key.
+        """
+
+        if self._admin_user is None:
+            self._admin_user = Users().get_user(username=self.admin_username)
+
+        return self._admin_user
+
+    def parse_connection_string(self, connection_string: str) -> Tuple[str, str]:
+        """
+        Parses a "remote_user@host" connection string, where the host may be an ip address, a hostname or a network
+        in CIDR notation of at most max_network_size addresses. Both end up in the inventory of the hosts, so the
+        remote user must be a login user and the host an RFC 1123 hostname if it is not an address.
+
+        :param connection_string:
+        :return: (normalized host, remote user)
+        :raises ValueError: If the connection string is malformed or the network is too large
+        """
+
+        remote_username, separator, host = str(connection_string).rpartition("@")
+        if (
+            not separator
+            or not LOGIN_USER.match(remote_username)
+            or not is_valid_host(host)
+        ):
+            raise ValueError(f"Invalid connection string {connection_string}")
+
+        if "/" in host:
+            network = ipaddress.ip_network(host, strict=False)
+            if network.num_addresses > self.max_network_size:
+                raise ValueError(
+                    f"Networks can have at most {self.max_network_size} addresses"
+                )
+
+        return normalize_host(host), remote_username
 
     def grant_access(self, body: Dict[str, any]) -> Response:
         """
-        Grants access to the given ip addresses.
+        Grants access to the given ip addresses or networks(CIDR blocks). A network is stored as a single grant.
 
         Args:
             body (Dict[str, any]):
@@ -30,9 +92,18 @@ class AclController:
         grantee_username: str = data["username"]
         admin_password: str = data["password"]
         connection_strings: List[str] = data["connection_strings"]
-        ip_addresses: List[str] = [
-            connection_string.split("@")[1] for connection_string in connection_strings
-        ]
+
+        try:
+            grants: List[Tuple[str, str]] = [
+                self.parse_connection_string(connection_string)
+                for connection_string in connection_strings
+            ]
+        except ValueError as error:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message=str(error), status_code=400, key=key, iv=iv
+            )
+
         admin_ssh_key: bytes = self.get_ssh_key(password=admin_password)
 
         if admin_ssh_key == b"":
@@ -45,7 +116,7 @@ class AclController:
                 iv=iv,
             )
 
-        grantee_user: User = UserModel().get_user(username=grantee_username)
+        grantee_user: User = Users().get_user(username=grantee_username)
 
         if grantee_user is None:
             data = {"success": False}
@@ -57,8 +128,10 @@ class AclController:
                 iv=iv,
             )
 
-        current_ips: List[str] = grantee_user.access_control.ip_addresses
-        if ip_addresses in current_ips:
+        current_grants: Set[Tuple[str, str]] = set(
+            AccessControlModel().get_grants(username=grantee_username)
+        )
+        if all(grant in current_grants for grant in grants):
             data = {"success": False}
             return api.response_data(
                 data=data,
@@ -68,35 +141,48 @@ class AclController:
                 iv=iv,
             )
 
-        for connection_string in connection_strings:
-            ip_address = connection_string.split("@")[1]
-            remote_username = connection_string.split("@")[0]
-            if ip_address not in current_ips:
-                tasks.grant_access.delay(
-                    grantee_username, admin_ssh_key, ip_address, remote_username
+        # The grants are coalesced with the other pending ones of the same admin key and remote user, and pushed in a
+        # single multi-host run.
+        for ip_address, remote_username in grants:
+            if (ip_address, remote_username) not in current_grants:
+                grant_coalescer.submit(
+                    operation="grant",
+                    ssh_key=admin_ssh_key,
+                    remote_user=remote_username,
+                    username=grantee_username,
+                    host=ip_address,
                 )
 
         return api.response_data(
             data=data, message="Access will be granted", status_code=200, key=key, iv=iv
         )
 
-    def revoke_access(body: Dict[str, any]) -> Response:
+    def revoke_access(self, body: Dict[str, any]) -> Response:
         """
-        Revokes access to the list of IP addresses to the specifies username,
+        Revokes access to the given ip addresses or networks. The revocations of each remote user are enqueued as one
+        task, which works on all the hosts in parallel.
 
-        :param body:
-        :param access_token:
-        :return:
+        Args:
+            body (Dict[str, any]): username, password and connection_strings
         """
 
         data, key, iv = api.decrypt_request_data(body=body)
         grantee_username: str = data["username"]
         admin_password: str = data["password"]
         connection_strings: List[str] = data["connection_strings"]
-        ip_addresses: List[str] = [
-            connection_string.split("@")[1] for connection_string in connection_strings
-        ]
-        admin_ssh_key: bytes = get_ssh_key(password=admin_password)
+
+        try:
+            revocations: List[Tuple[str, str]] = [
+                self.parse_connection_string(connection_string)
+                for connection_string in connection_strings
+            ]
+        except ValueError as error:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message=str(error), status_code=400, key=key, iv=iv
+            )
+
+        admin_ssh_key: bytes = self.get_ssh_key(password=admin_password)
 
         if admin_ssh_key == b"":
             data = {"success": False}
@@ -108,9 +194,7 @@ class AclController:
                 iv=iv,
             )
 
-        grantee_user: User = UserModel().get_user(username=grantee_username)
-
-        if grantee_user is None:
+        if Users().get_user(username=grantee_username) is None:
             data = {"success": False}
             return api.response_data(
                 data=data,
@@ -120,53 +204,301 @@ class AclController:
                 iv=iv,
             )
 
-        current_ips: List[str] = grantee_user.access_control.ip_addresses
-        if ip_addresses not in current_ips:
+        current_grants: Set[Tuple[str, str]] = set(
+            AccessControlModel().get_grants(username=grantee_username)
+        )
+        revocations = [grant for grant in revocations if grant in current_grants]
+        if not revocations:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="The user already does not have access.",
+                status_code=409,
+                key=key,
+                iv=iv,
+            )
+
+        self.enqueue_revocations(
+            username=grantee_username, ssh_key=admin_ssh_key, grants=revocations
+        )
+
+        data = {"success": True}
+        return api.response_data(
+            data=data, message="Access will be revoked", status_code=200, key=key, iv=iv
+        )
+
+    def revoke_all(self, body: Dict[str, any]) -> Response:
+        """
+        Revokes all the grants of the given user, e.g. when offboarding. The group grants and the role memberships of
+        the user are deleted right away, and the CA key files of the group grants are then removed from the members of
+        the groups; the grants to hosts are revoked on the hosts first. The role grants are not installed on the hosts.
+
+        Args:
+            body (Dict[str, any]): username and password
+        """
+
+        data, key, iv = api.decrypt_request_data(body=body)
+        grantee_username: str = data["username"]
+        admin_password: str = data["password"]
+
+        admin_ssh_key: bytes = self.get_ssh_key(password=admin_password)
+
+        if admin_ssh_key == b"":
             data = {"success": False}
             return api.response_data(
                 data=data,
-                message="The user already does not has access.",
+                message="You haven't generated your key pair",
                 status_code=409,
                 key=key,
                 iv=iv,
             )
 
-        if current_ips is None:
+        if Users().get_user(username=grantee_username) is None:
             data = {"success": False}
             return api.response_data(
                 data=data,
-                message="Username does not exist",
+                message="The user you are trying to revoke access from does not exist",
                 status_code=404,
                 key=key,
                 iv=iv,
             )
 
-        for connection_string in connection_strings:
-            ip_address = connection_string.split("@")[1]
-            remote_username = connection_string.split("@")[0]
-            if ip_address in current_ips:
-                tasks.revoke_access.delay(
-                    grantee_username, admin_ssh_key, ip_address, remote_username
-                )
+        group_grants: List[Tuple[str, str]] = AccessControlModel().get_group_grants(
+            username=grantee_username
+        )
+        if not AccessControlModel().revoke_all_group_access(
+            username=grantee_username
+        ) or not Roles().remove_all_memberships(username=grantee_username):
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="Could not revoke the group grants and roles",
+                status_code=500,
+                key=key,
+                iv=iv,
+            )
+
+        # The key file of a selector is shared by its remote users, it is removed once.
+        remote_user_of_selector: Dict[str, str] = {}
+        for selector, remote_username in group_grants:
+            remote_user_of_selector.setdefault(selector, remote_username)
+        for selector, remote_username in remote_user_of_selector.items():
+            tasks.revoke_group_access.delay(
+                grantee_username, admin_ssh_key, selector, remote_username
+            )
+
+        self.enqueue_revocations(
+            username=grantee_username,
+            ssh_key=admin_ssh_key,
+            grants=AccessControlModel().get_grants(username=grantee_username),
+        )
 
         data = {"success": True}
         return api.response_data(
             data=data, message="Access will be revoked", status_code=200, key=key, iv=iv
         )
 
-    def revoke_all(body: Dict[str, any], access_token: str) -> Response:
+    @staticmethod
+    def enqueue_revocations(
+        username: str, ssh_key: bytes, grants: List[Tuple[str, str]]
+    ) -> None:
+        """
+        Enqueues one revocation task per remote user, for all the hosts of that remote user at once. Revocations skip
+        the grant coalescer's window, as they are latency sensitive.
+
+        Args:
+            username:
+            ssh_key:
+            grants: list of (ip address, remote user)
+        """
+
+        ip_addresses_of_remote_user: Dict[str, List[str]] = {}
+        for ip_address, remote_username in grants:
+            ip_addresses_of_remote_user.setdefault(remote_username, []).append(
+                ip_address
+            )
+
+        for remote_username, ip_addresses in ip_addresses_of_remote_user.items():
+            tasks.revoke_access.delay(username, ssh_key, ip_addresses, remote_username)
+
+    def users_with_access(self, body: Dict[str, any]) -> Response:
+        """
+        Returns the users who can reach each of the given hosts, with one page of users per host. A host with more
+        users gets a cursor, which is sent back in "cursors" to get the next page.
+
+        Args:
+            body (Dict[str, any]): hosts, limit(optional) and cursors(optional, host to cursor)
+        """
+
+        data, key, iv = api.decrypt_request_data(body=body)
+
+        if not self.principal.admin:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message="Unauthorized", status_code=401, key=key, iv=iv
+            )
+
+        hosts: List[str] = data.get("hosts") or []
+        try:
+            limit: int = min(int(data.get("limit", 100)), self.max_page_size)
+            cursors: Dict[str, Cursor] = {
+                host: (int(cursor.split(":", 1)[0]), cursor.split(":", 1)[1])
+                for host, cursor in (data.get("cursors") or {}).items()
+            }
+        except (AttributeError, IndexError, TypeError, ValueError):
+            limit = 0
+            cursors = {}
+
+        if len(hosts) > self.max_hosts or limit < 1:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message=f"Send at most {self.max_hosts} hosts, a positive limit and valid cursors",
+                status_code=400,
+                key=key,
+                iv=iv,
+            )
+
+        pages = AccessControlModel().users_with_access(
+            hosts=hosts, limit=limit, cursors=cursors
+        )
+        if pages is None:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message="Lookup failed", status_code=500, key=key, iv=iv
+            )
+
+        data = {
+            "success": True,
+            "hosts": {
+                host: {
+                    "users": [
+                        {"username": username, "remote_user": remote_user}
+                        for username, remote_user in users
+                    ],
+                    "next_cursor": f"{next_cursor[0]}:{next_cursor[1]}"
+                    if next_cursor is not None
+                    else None,
+                }
+                for host, (users, next_cursor) in pages.items()
+            },
+        }
+        return api.response_data(data=data, message="", status_code=200, key=key, iv=iv)
+
+    def has_access(self, body: Dict[str, any]) -> Response:
+        """
+        Checks a batch of (username, host) pairs and returns whether each user can reach the host, in the order of the
+        pairs.
+
+        Args:
+            body (Dict[str, any]): pairs, list of [username, host]
+        """
+
+        data, key, iv = api.decrypt_request_data(body=body)
+
+        if not self.principal.admin:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message="Unauthorized", status_code=401, key=key, iv=iv
+            )
+
+        acl = AccessControlModel()
+        try:
+            pairs: List[Tuple[str, str]] = [
+                (str(username), str(host)) for username, host in data["pairs"]
+            ]
+            results: Union[List[bool], None] = acl.has_access_batch(pairs=pairs)
+        except (KeyError, TypeError, ValueError):
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message=f"Send at most {acl.max_batch_size} [username, host] pairs",
+                status_code=400,
+                key=key,
+                iv=iv,
+            )
+
+        if results is None:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message="Check failed", status_code=500, key=key, iv=iv
+            )
+
+        data = {"success": True, "results": results}
+        return api.response_data(data=data, message="", status_code=200, key=key, iv=iv)
+
+    def register_host(self, body: Dict[str, any]) -> Response:
+        """
+        Registers a host with its labels and zone, or updates them. The group grants matching the new labels apply to
+        the host from then on.
+
+        Args:
+            body (Dict[str, any]): address, labels(optional, label to value) and zone(optional)
+        """
+
+        data, key, iv = api.decrypt_request_data(body=body)
+
+        if not self.principal.admin:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message="Unauthorized", status_code=401, key=key, iv=iv
+            )
+
+        address: str = str(data.get("address") or "").strip()
+        labels: Dict[str, str] = data.get("labels") or {}
+        if not is_valid_host(address) or not isinstance(labels, dict):
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="Send an ip address or hostname and a map of labels",
+                status_code=400,
+                key=key,
+                iv=iv,
+            )
+
+        if not Hosts().register(address=address, labels=labels, zone=data.get("zone")):
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="Host registration failed",
+                status_code=500,
+                key=key,
+                iv=iv,
+            )
+
+        data = {"success": True}
+        return api.response_data(
+            data=data, message="Host registered", status_code=200, key=key, iv=iv
+        )
+
+    def grant_group_access(self, body: Dict[str, any]) -> Response:
         """
-        Revokes all access of the specified user.
+        Grants access to every host matching a label selector such as "env=prod, role=db", stored as a single grant.
 
-        :param body:
-        :param access_token:
-        :return:
+        Args:
+            body (Dict[str, any]): username, password, selector and remote_user
         """
 
         data, key, iv = api.decrypt_request_data(body=body)
         grantee_username: str = data["username"]
         admin_password: str = data["password"]
-        ssh_key: bytes = get_ssh_key(password=admin_password)
+        remote_username: str = data.get("remote_user") or ""
+
+        try:
+            selector: str = canonical_selector(data["selector"])
+            if remote_username and not LOGIN_USER.match(remote_username):
+                raise ValueError(f"Invalid remote user {remote_username}")
+        except (KeyError, ValueError):
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="Send a label selector such as env=prod, role=db and a valid remote user",
+                status_code=400,
+                key=key,
+                iv=iv,
+            )
+
+        admin_ssh_key: bytes = self.get_ssh_key(password=admin_password)
 
         if admin_ssh_key == b"":
             data = {"success": False}
@@ -178,35 +510,279 @@ class AclController:
                 iv=iv,
             )
 
-        grantee_user: User = UserModel().get_user(username=grantee_username)
-
-        if grantee_user is None:
+        if Users().get_user(username=grantee_username) is None:
             data = {"success": False}
             return api.response_data(
                 data=data,
-                message="The user you are trying to revoke access from does not exist",
+                message="The user you are trying to give access does not exist",
                 status_code=404,
                 key=key,
                 iv=iv,
             )
 
-        current_ips = AccessControlModel().get_all_ips(username=username)
-        if current_ips is None:
+        if (selector, remote_username) in AccessControlModel().get_group_grants(
+            username=grantee_username
+        ):
             data = {"success": False}
             return api.response_data(
                 data=data,
-                message="Username does not exist",
-                status_code=404,
+                message="The user already has access.",
+                status_code=409,
                 key=key,
                 iv=iv,
             )
 
-        for ip_address in current_ips:
-            tasks.revoke_access.delay(username, ssh_key, ip_address)
+        tasks.grant_group_access.delay(
+            grantee_username, admin_ssh_key, selector, remote_username
+        )
 
         data = {"success": True}
         return api.response_data(
-            data=data, message="Access will be revoked", status_code=200, key=key, iv=iv
+            data=data, message="Access will be granted", status_code=200, key=key, iv=iv
+        )
+
+    def issue_certificate(self, body: Dict[str, any]) -> Response:
+        """
+        Signs the public key of the user into a short-lived SSH certificate, whose principals are "remote_user@host"
+        for the given connection strings, each of which the user must be granted, or for all the grants of the user. No
+        host is contacted: the hosts trust the certificate authority(see trust_certificate_authority).
+
+        Args:
+            body (Dict[str, any]): validity(optional, in seconds), connection_strings(optional)
+        """
+
+        data, key, iv = api.decrypt_request_data(body=body)
+
+        if not ssh_ca.enabled:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="The certificate authority is not configured",
+                status_code=503,
+                key=key,
+                iv=iv,
+            )
+
+        try:
+            validity: Union[int, None] = (
+                int(data["validity"]) if data.get("validity") is not None else None
+            )
+        except (TypeError, ValueError):
+            validity = 0
+
+        if validity is not None and validity < 1:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="The validity must be a positive number of seconds",
+                status_code=400,
+                key=key,
+                iv=iv,
+            )
+
+        user: Union[User, None] = Users().get_user(username=self.admin_username)
+        if user is None or not user.public_key:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="You haven't generated your key pair",
+                status_code=409,
+                key=key,
+                iv=iv,
+            )
+
+        acl = AccessControlModel()
+        connection_strings: List[str] = data.get("connection_strings") or []
+        if connection_strings:
+            try:
+                hosts: List[Tuple[str, str]] = [
+                    self.parse_connection_string(connection_string)
+                    for connection_string in connection_strings
+                ]
+            except ValueError as error:
+                data = {"success": False}
+                return api.response_data(
+                    data=data, message=str(error), status_code=400, key=key, iv=iv
+                )
+
+            if any("/" in host for host, _ in hosts):
+                data = {"success": False}
+                return api.response_data(
+                    data=data,
+                    message="Certificates are issued for hosts, not networks",
+                    status_code=400,
+                    key=key,
+                    iv=iv,
+                )
+
+            for host, remote_username in hosts:
+                granted: Union[bool, None] = acl.has_access(
+                    username=self.admin_username,
+                    ip_address=host,
+                    remote_user=remote_username,
+                )
+                if granted is None:
+                    data = {"success": False}
+                    return api.response_data(
+                        data=data,
+                        message="Lookup failed",
+                        status_code=500,
+                        key=key,
+                        iv=iv,
+                    )
+                if not granted:
+                    data = {"success": False}
+                    return api.response_data(
+                        data=data,
+                        message=f"You have no access to {remote_username}@{host}",
+                        status_code=401,
+                        key=key,
+                        iv=iv,
+                    )
+
+            principals: Union[List[str], None] = sorted(
+                {f"{remote_username}@{host}" for host, remote_username in hosts}
+            )
+        else:
+            principals = acl.certificate_principals(
+                username=self.admin_username, limit=self.max_principals
+            )
+            if principals is None:
+                data = {"success": False}
+                return api.response_data(
+                    data=data, message="Lookup failed", status_code=500, key=key, iv=iv
+                )
+
+        if not principals:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="You have no grants to a remote user",
+                status_code=409,
+                key=key,
+                iv=iv,
+            )
+
+        if len(principals) > self.max_principals:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message=f"A certificate can name at most {self.max_principals} hosts, give the connection_strings "
+                "of the ones you need",
+                status_code=400,
+                key=key,
+                iv=iv,
+            )
+
+        try:
+            certificate, expires_at = ssh_ca.issue(
+                public_key=user.public_key.public_key,
+                key_id=self.admin_username,
+                principals=principals,
+                validity=validity,
+            )
+        except ValueError as error:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message=str(error), status_code=409, key=key, iv=iv
+            )
+
+        data = {
+            "success": True,
+            "certificate": certificate,
+            "principals": principals,
+            "expires_at": expires_at,
+        }
+        return api.response_data(data=data, message="", status_code=200, key=key, iv=iv)
+
+    def trust_certificate_authority(self, body: Dict[str, any]) -> Response:
+        """
+        Installs the public key of the SSH certificate authority on the given hosts, which is only needed once per host
+        and again when the certificate authority changes. The hosts accept the certificates naming them for the
+        login users, which default to the remote user of each connection string.
+
+        Args:
+            body (Dict[str, any]): password, connection_strings and login_users(optional)
+        """
+
+        data, key, iv = api.decrypt_request_data(body=body)
+        admin_password: str = data["password"]
+        connection_strings: List[str] = data["connection_strings"]
+        login_users: List[str] = data.get("login_users") or []
+        if not isinstance(login_users, list):
+            login_users = [login_users]
+
+        if not ssh_ca.enabled:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="The certificate authority is not configured",
+                status_code=503,
+                key=key,
+                iv=iv,
+            )
+
+        try:
+            hosts: List[Tuple[str, str]] = [
+                self.parse_connection_string(connection_string)
+                for connection_string in connection_strings
+            ]
+        except ValueError as error:
+            data = {"success": False}
+            return api.response_data(
+                data=data, message=str(error), status_code=400, key=key, iv=iv
+            )
+
+        invalid: List[str] = [
+            login_user
+            for login_user in login_users + [remote_user for _, remote_user in hosts]
+            if not LOGIN_USER.match(str(login_user))
+        ]
+        if invalid:
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message=f"Invalid login users: {', '.join(map(str, invalid))}",
+                status_code=400,
+                key=key,
+                iv=iv,
+            )
+
+        admin_ssh_key: bytes = self.get_ssh_key(password=admin_password)
+
+        if admin_ssh_key == b"":
+            data = {"success": False}
+            return api.response_data(
+                data=data,
+                message="You haven't generated your key pair",
+                status_code=409,
+                key=key,
+                iv=iv,
+            )
+
+        ssh_ca.ensure_key_pair()
+        ip_addresses_of_remote_user: Dict[str, List[str]] = {}
+        for ip_address, remote_username in hosts:
+            ip_addresses_of_remote_user.setdefault(remote_username, []).append(
+                ip_address
+            )
+
+        for remote_username, ip_addresses in ip_addresses_of_remote_user.items():
+            tasks.trust_certificate_authority.delay(
+                admin_ssh_key,
+                ssh_ca.public_key,
+                ip_addresses,
+                remote_username,
+                login_users or [remote_username],
+            )
+
+        data = {"success": True, "ca_public_key": ssh_ca.public_key}
+        return api.response_data(
+            data=data,
+            message="The certificate authority will be trusted",
+            status_code=200,
+            key=key,
+            iv=iv,
         )
 
     def get_ssh_key(self, password: str) -> bytes:
@@ -217,18 +793,34 @@ class AclController:
             password (str):
         """
 
-        kek: bytes = utils.pbkdf(data=password, salt=self.admin_user.salt_for_password)
-        dek: bytes = AES(key=kek, iv=self.admin_user.iv_for_kek).decrypt(
-            self.admin_user.encrypted_dek
-        )
+        dek: bytes = unlock_dek(user=self.admin_user, password=password)
 
-        user_key: Key = self.admin_user.private_key
+        user_key: PrivateKey = self.admin_user.private_key
         if not user_key:
             return b""
 
-        encrypted_ssh_key: bytes = user_key.encrypted_private_key
-        dek_pbkdf: bytes = utils.pbkdf(data=dek, salt=self.admin_user.salt_for_dek)
-        aes = AES(key=dek_pbkdf, iv=self.admin_user.iv_for_dek)
-        ssh_key: bytes = aes.decrypt(ciphertext=encrypted_ssh_key)
+        ssh_key: bytes = crypto_executor.run(
+            utils.decrypt_with_dek,
+            ciphertext=user_key.encrypted_private_key,
+            dek=dek,
+            salt=self.admin_user.salt_for_dek,
+            iv=self.admin_user.iv_for_dek,
+            kdf_version=user_key.kdf_version,
+        )
+
+        # Migrated only if the key was decrypted with the right password(see PrivateKeyController.migrate).
+        if user_key.kdf_version != utils.CURRENT_KDF_VERSION and utils.matches_hash(
+            data=ssh_key, hashed=user_key.key_hash
+        ):
+            PrivateKeys().update_encrypted_key(
+                key_id=user_key.id,
+                encrypted_key=utils.encrypt_with_dek(
+                    plaintext=ssh_key,
+                    dek=dek,
+                    salt=self.admin_user.salt_for_dek,
+                    iv=self.admin_user.iv_for_dek,
+                ),
+                kdf_version=utils.CURRENT_KDF_VERSION,
+            )
 
         return ssh_key
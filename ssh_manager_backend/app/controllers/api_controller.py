@@ -1,14 +1,31 @@
-import base64
 import json
-from typing import Dict, Tuple
+import time
+from datetime import datetime, timezone
+from typing import Dict, Tuple, Union
 
-from flask import Response
+from flask import Response, has_request_context, request
 
-from ssh_manager_backend.app.services import AES, rsa
+from ssh_manager_backend.app.models import Sessions
+from ssh_manager_backend.app.services import (
+    envelope,
+    principal_cache,
+    revocations,
+    session_keys,
+    signed_tokens,
+)
+from ssh_manager_backend.app.services.principal_cache import Principal
+
+# Key of the WSGI environ under which the decrypted request (data, key, iv) is kept, so that the body is decrypted only
+# once per request even if both the Auth middleware and the controller ask for it.
+DECRYPTED_REQUEST = "ssh_manager.decrypted_request"
 
 
 def response_data(
-    data: Dict[str, any], message: str, status_code: int, key: bytes, iv: bytes
+    data: Dict[str, any],
+    message: str,
+    status_code: int,
+    key: bytes,
+    iv: Union[bytes, None],
 ) -> Response:
     """
 
@@ -17,59 +34,114 @@ def response_data(
         message: Response message.
         status_code:
         key: Key to be used for encrypting the response.
-        iv: Initialization vector.
+        iv: Initialization vector, None if the request used a v2 envelope.
 
     Returns: Response
 
     """
 
-    body: Dict[str, any] = {
-        "data": base64.encodebytes(
-            encrypt_response_data(data=data, key=key, iv=iv)
-        ).decode(),
-        "message": message,
-    }
+    body: Dict[str, any] = envelope.seal_response(data=data, key=key, iv=iv)
+    body["message"] = message
+
+    # A v1 key comes with a fixed iv, so only the v2 sessions are resumed.
+    if session_keys.enabled and iv is None:
+        body["session_key_id"] = session_keys.put(key=key)
 
     return Response(
         response=json.dumps(body), status=status_code, mimetype="application/json"
     )
 
 
-def encrypt_response_data(data: Dict[str, any], key: bytes, iv: bytes) -> bytes:
+def decrypt_request_data(
+    body: Dict[str, any]
+) -> Tuple[Dict[str, any], bytes, Union[bytes, None]]:
     """
-    Encrypts the response data using the given key and iv.
+    Decrypts the request data using the RSA private key. The result is kept in the WSGI environ and reused if the
+    request was already decrypted, for example by the Auth middleware.
+
+    If the body carries a session key id returned by an earlier response, the cached key and iv are used and no RSA
+    decryption is done. On a cache miss the RSA wrapped key and iv are used if the client sent them. See the
+    envelope module for the supported envelope versions.
 
     Args:
-        data: Data to be encrypted.
-        key: Key used for encryption
-        iv: Initialization vector
+        body: request body.
 
-    Returns: Encrypted data
+    Returns: decrypted request data
 
     """
 
-    aes = AES(key=key, iv=iv)
-    return aes.encrypt(json.dumps(data))
+    if has_request_context():
+        decrypted_request = request.environ.get(DECRYPTED_REQUEST)
+        if decrypted_request is not None:
+            return decrypted_request
+
+    decrypted_request = envelope.open_request(body=body)
+    if has_request_context():
+        request.environ[DECRYPTED_REQUEST] = decrypted_request
+
+    return decrypted_request
 
 
-def decrypt_request_data(body: Dict[str, any]) -> Tuple[Dict[str, any], bytes, bytes]:
+def get_principal(access_token: str) -> Union[Principal, None]:
     """
-    Decrypts the request data using the RSA private key.
+    Resolves the access token to the principal of the user, using the principal cache so that the session is looked
+    up only on a cache miss, with a single query on the token hash. The expiry of an active session slides forward
+    on use(see Sessions.refresh) and a cached principal never outlives its session.
+
+    Signed access tokens are resolved from their claims without any database access; they are inactive once expired
+    or revoked.
 
     Args:
-        body: request body.
+        access_token: access token of the user.
 
-    Returns: decrypted request data
+    Returns: Principal or None if the user does not exist
 
     """
 
-    encrypted_key: bytes = base64.decodebytes(bytes(body["key"], encoding="utf-8"))
-    encrypted_iv: bytes = base64.decodebytes(bytes(body["iv"], encoding="utf-8"))
-    encrypted_data: bytes = base64.decodebytes(bytes(body["data"], encoding="utf-8"))
+    if signed_tokens.is_signed(access_token):
+        claims: Union[Dict[str, any], None] = signed_tokens.verify(access_token)
+        if claims is None:
+            return None
+
+        return Principal(
+            user_id=claims["uid"],
+            username=claims["sub"],
+            admin=claims["adm"],
+            session_active=claims["exp"] > time.time()
+            and not revocations.is_revoked(access_token),
+        )
+
+    principal: Union[Principal, None] = principal_cache.get(access_token=access_token)
+    if principal is not None:
+        return principal
+
+    sessions = Sessions()
+    session = sessions.validate(access_token=access_token)
+    if session is None:
+        return None
+
+    expires_at: Union[datetime, None] = session.expires_at
+    session_active: bool = bool(session.active) and (
+        expires_at is None or expires_at > datetime.utcnow()
+    )
+    if session_active and sessions.refresh(
+        session_id=session.session_id, expires_at=expires_at
+    ):
+        expires_at = datetime.utcnow() + sessions.ttl
+
+    principal = Principal(
+        user_id=session.user_id,
+        username=session.username,
+        admin=bool(session.admin),
+        session_active=session_active,
+    )
+    # Inactive principals are cached for the full ttl, activating the session invalidates them.
+    cache_expires_at: Union[float, None] = None
+    if session_active and expires_at is not None:
+        cache_expires_at = expires_at.replace(tzinfo=timezone.utc).timestamp()
 
-    key: bytes = rsa.decrypt_cipher(encrypted_key)
-    iv: bytes = rsa.decrypt_cipher(encrypted_iv)
+    principal_cache.put(
+        access_token=access_token, principal=principal, expires_at=cache_expires_at
+    )
 
-    aes = AES(key=key, iv=iv)
-    data: str = aes.decrypt(encrypted_data).decode("utf-8")
-    return json.loads(data), key, iv
+    return principal
@@ -4,8 +4,9 @@ from typing import Dict, Union
 from flask import Response
 
 from ssh_manager_backend.app.controllers import api_controller as api
+from ssh_manager_backend.app.controllers.secrets import unlock_dek
 from ssh_manager_backend.app.models import PrivateKeys, PublicKeys, Users
-from ssh_manager_backend.app.services import AES, utils
+from ssh_manager_backend.app.services import crypto_executor, utils
 from ssh_manager_backend.db import User
 
 
@@ -40,34 +41,23 @@ class KeyCreationController:
         self.encrypted_dek = user.encrypted_dek
         self.iv_for_dek = user.iv_for_dek
         self.salt_for_dek = user.salt_for_dek
-        self.dek = self.decrypt_dek(password=self.password)
-
-    def decrypt_dek(self, password: str) -> bytes:
-        """
-        Decrypts the dek(See secrets module) using AES and the password of the user.
-
-        :param password: The password of the user
-        :return: decrypted decryption key
-        """
-
-        kek = utils.pbkdf(data=password, salt=self.salt_for_kek)
-        aes = AES(key=kek, iv=self.iv_for_kek)
-        dek = aes.decrypt(self.encrypted_dek)
-        return dek
+        self.dek = unlock_dek(user=user, password=self.password)
 
     def encrypt(self, plaintext: Union[str, bytes]) -> bytes:
         """
-        Encrypts the SSH key with the "dek" and salt for "dek".
+        Encrypts the SSH key with the "dek" and salt for "dek" using the current version of the key derivation.
 
         :param plaintext: The text to be encrypted
         :return: ciphertext
         """
 
-        dek_pbkdf = utils.pbkdf(data=self.dek, salt=self.salt_for_dek)
-        aes = AES(key=dek_pbkdf, iv=self.iv_for_dek)
-        ciphertext = aes.encrypt(plaintext=plaintext)
-
-        return ciphertext
+        return crypto_executor.run(
+            utils.encrypt_with_dek,
+            plaintext=plaintext,
+            dek=self.dek,
+            salt=self.salt_for_dek,
+            iv=self.iv_for_dek,
+        )
 
     def put_public_key(self, public_key: str, user_id: int):
         """
@@ -99,8 +89,9 @@ class KeyCreationController:
 
         PrivateKeys().create(
             encrypted_key=encrypted_private_key,
-            key_hash=key_hash.decode(),
+            key_hash=key_hash.hex(),
             user_id=user_id,
+            kdf_version=utils.CURRENT_KDF_VERSION,
         )
 
     def put_keys(self, body: Dict[str, any]) -> Response:
@@ -142,8 +133,8 @@ class KeyCreationController:
             )
 
         self.set_user_secrets(user=user)
-        self.put_public_key(public_key=public_key)
-        self.put_private_key(private_key=private_key)
+        self.put_public_key(public_key=public_key, user_id=user.id)
+        self.put_private_key(private_key=private_key, user_id=user.id)
 
         data = {"success": True}
         return api.response_data(
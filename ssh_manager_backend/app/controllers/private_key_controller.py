@@ -4,8 +4,9 @@ from typing import Dict, Union
 from flask import Response
 
 from ssh_manager_backend.app.controllers import api_controller as api
+from ssh_manager_backend.app.controllers.secrets import unlock_dek
 from ssh_manager_backend.app.models import PrivateKeys, Users
-from ssh_manager_backend.app.services import AES, utils
+from ssh_manager_backend.app.services import crypto_executor, utils
 from ssh_manager_backend.db import PrivateKey, User
 
 
@@ -49,34 +50,51 @@ class PrivateKeyController:
         self.encrypted_dek = user.encrypted_dek
         self.iv_for_dek = user.iv_for_dek
         self.salt_for_dek = user.salt_for_dek
-        self.dek = self.decrypt_dek(password=self.password)
+        self.dek = unlock_dek(user=user, password=self.password)
 
-    def decrypt_dek(self, password: str) -> bytes:
+    def decrypt(self, ciphertext, kdf_version: Union[int, None]):
         """
-        Decrypts the dek(See secrets module) using AES and the password of the user.
+        Decrypts the SSH key using "dek" and salt for "dek" and AES algorithm.
 
-        :param password: The password of the user
-        :return: decrypted decryption key
+        :param ciphertext: The text which is to be decrypted
+        :param kdf_version: The version of the key derivation the key was encrypted with
+        :return:
         """
 
-        kek = utils.pbkdf(data=password, salt=self.salt_for_kek)
-        aes = AES(key=kek, iv=self.iv_for_kek)
-        dek = aes.decrypt(self.encrypted_dek)
-        return dek
+        return crypto_executor.run(
+            utils.decrypt_with_dek,
+            ciphertext=ciphertext,
+            dek=self.dek,
+            salt=self.salt_for_dek,
+            iv=self.iv_for_dek,
+            kdf_version=kdf_version,
+        )
 
-    def decrypt(self, ciphertext):
+    def migrate(self, user_key: PrivateKey) -> None:
         """
-        Decrypts the SSH key using "dek" and salt for "dek" and AES algorithm.
+        Re-encrypts the decrypted SSH key with the current version of the key derivation if it was stored with an
+        older one, so that the next access uses the cheaper derivation. Nothing is written unless the decrypted key
+        matches the hash of the stored key, as a wrong password would otherwise overwrite the key.
 
-        :param ciphertext: The text which is to be decrypted
-        :return:
+        :param user_key: The stored key
+        :return: None
         """
 
-        dek_pbkdf = utils.pbkdf(data=self.dek, salt=self.salt_for_dek)
-        aes = AES(key=dek_pbkdf, iv=self.iv_for_dek)
-        plaintext = aes.decrypt(ciphertext=ciphertext)
-
-        return plaintext
+        if user_key.kdf_version == utils.CURRENT_KDF_VERSION or not utils.matches_hash(
+            data=self.ssh_key, hashed=user_key.key_hash
+        ):
+            return
+
+        self.key.update_encrypted_key(
+            key_id=user_key.id,
+            encrypted_key=utils.encrypt_with_dek(
+                plaintext=self.ssh_key,
+                dek=self.dek,
+                salt=self.salt_for_dek,
+                iv=self.iv_for_dek,
+            ),
+            kdf_version=utils.CURRENT_KDF_VERSION,
+        )
 
     def get_private_key(self, body: Dict[str, any]) -> Response:
         """
@@ -110,9 +128,12 @@ class PrivateKeyController:
             )
 
         self.password = request_data["password"]
-        self.set_user_secrets()
+        self.set_user_secrets(user=user)
         self.ssh_encrypted_key = user_key.encrypted_private_key
-        self.ssh_key = self.decrypt(ciphertext=self.ssh_encrypted_key)
+        self.ssh_key = self.decrypt(
+            ciphertext=self.ssh_encrypted_key, kdf_version=user_key.kdf_version
+        )
+        self.migrate(user_key=user_key)
 
         data = {"success": False, "ssh_key": self.ssh_key}
 
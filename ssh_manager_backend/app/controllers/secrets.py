@@ -1,9 +1,11 @@
+import hmac
 import os
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from ssh_manager_backend.app.services import crypto_executor, dek_cache, utils
 from ssh_manager_backend.app.services.aes import AES
 
 
@@ -99,3 +101,44 @@ class Secrets:
         self.iv_for_kek = self.generate_secure_random(self.__ivlength__)
         self.kek = self.generate_kek(password)
         self.dek = self.encrypt_dek()
+
+
+def verify_password(user, password: str) -> bool:
+    """
+    Checks the password against the password hash of the user.
+
+    :param user: The User object
+    :param password: The password to be checked
+    :return: True if the password is the password of the user
+    """
+
+    password_hash: bytes = utils.hash_data(data=password, salt=user.salt_for_password)
+    return hmac.compare_digest(password_hash, user.password)
+
+
+def unlock_dek(user, password: str) -> bytes:
+    """
+    Decrypts the dek of the user using the kek derived from the password. The unlocked dek is taken from and put in the
+    dek cache, so that only the first request of a burst pays for the key derivation. Only the dek unlocked with the
+    password of the user is cached, as a wrong password may still decrypt the dek to garbage.
+
+    :param user: The User object
+    :param password: The password of the user
+    :return: decrypted dek
+    """
+
+    dek = dek_cache.get(
+        user_id=user.id, password=password, wrapped_dek=user.encrypted_dek
+    )
+    if dek is not None:
+        return dek
+
+    kek: bytes = crypto_executor.run(utils.pbkdf, data=password, salt=user.salt_for_kek)
+    dek = AES(key=kek, iv=user.iv_for_kek).decrypt(user.encrypted_dek)
+
+    if dek and verify_password(user=user, password=password):
+        dek_cache.put(
+            user_id=user.id, password=password, wrapped_dek=user.encrypted_dek, dek=dek
+        )
+
+    return dek
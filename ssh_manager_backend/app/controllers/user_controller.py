@@ -1,5 +1,6 @@
 import base64
 import uuid
+from datetime import datetime
 from typing import Dict, Union
 
 from flask import Response
@@ -7,18 +8,26 @@ from flask import Response
 from ssh_manager_backend.app.controllers import api_controller as api
 from ssh_manager_backend.app.controllers.secrets import Secrets
 from ssh_manager_backend.app.models import Sessions, Users
-from ssh_manager_backend.app.services import utils
+from ssh_manager_backend.app.services import (
+    crypto_executor,
+    dek_cache,
+    revocations,
+    signed_tokens,
+    utils,
+)
+from ssh_manager_backend.app.services.principal_cache import Principal
 from ssh_manager_backend.db import User
 
 
 class UserController:
     def __init__(self, access_token: Union[str, None] = None):
         self.username: str = ""
+        self.access_token: Union[str, None] = access_token
+        self.principal: Union[Principal, None] = None
         if access_token is not None:
-            access_token = base64.decodebytes(
-                bytes(access_token, encoding="utf-8")
-            ).decode()
-            self.username = access_token.split("+")[-1]
+            self.principal = api.get_principal(access_token=access_token)
+            if self.principal is not None:
+                self.username = self.principal.username
         self.secrets = Secrets()
         self.__password: str = ""
         self.name: str = ""
@@ -59,7 +68,9 @@ class UserController:
                 data=data, message="Username is taken", status_code=409, key=key, iv=iv
             )
 
-        self.secrets.generate_secrets(password=str(self.__password))
+        crypto_executor.run(
+            self.secrets.generate_secrets, password=str(self.__password)
+        )
         self.__password = utils.hash_data(
             self.__password, self.secrets.salt_for_password
         )
@@ -86,6 +97,18 @@ class UserController:
             data=data, message="User created", status_code=200, key=key, iv=iv
         )
 
+    def legacy_access_token(self) -> str:
+        """
+        Returns a new random access token of the user, which is resolved to the user by its session.
+
+        :return: access token
+        """
+
+        access_token: str = uuid.uuid4().hex + "+" + self.username
+        return (
+            base64.encodebytes(bytes(access_token, encoding="utf-8")).decode().strip()
+        )
+
     def login(self, body: Dict[str, any]) -> Response:
         """
         Handles user login.
@@ -128,19 +151,27 @@ class UserController:
         if user_data.password == utils.hash_data(
             data=self.__password, salt=self.secrets.salt_for_password
         ):
-            access_token: str = uuid.uuid4().hex + "+" + self.username
-            access_token = (
-                base64.encodebytes(bytes(access_token, encoding="utf-8"))
-                .decode()
-                .strip()
-            )
             session = Sessions()
 
-            res = True
-            if not session.exists(username=self.username):
+            if signed_tokens.enabled:
+                # Every login gets its own session row, so that logging out revokes all the tokens of the user.
+                access_token, expires_at = signed_tokens.issue(
+                    user_id=user_data.id, username=self.username, admin=user_data.admin
+                )
+                res = session.create(
+                    username=self.username,
+                    access_token=access_token,
+                    expires_at=datetime.utcfromtimestamp(expires_at),
+                )
+            elif not session.exists(username=self.username):
+                access_token: str = self.legacy_access_token()
                 res = session.create(username=self.username, access_token=access_token)
             else:
-                res = session.activate_session(username=self.username)
+                access_token: str = self.legacy_access_token()
+                # The session may have been swept or logged out since it was checked.
+                res = session.replace_token(
+                    username=self.username, access_token=access_token
+                ) or session.create(username=self.username, access_token=access_token)
 
             if res:
                 data = {"success": True, "access_token": access_token}
@@ -191,6 +222,9 @@ class UserController:
                 )
             else:
                 if session.deactivate_session(username=self.username):
+                    if self.access_token and signed_tokens.is_signed(self.access_token):
+                        revocations.revoke(access_token=self.access_token)
+                    dek_cache.invalidate(user_id=self.principal.user_id)
                     data = {"success": True}
                     return api.response_data(
                         data=data,
@@ -223,18 +257,18 @@ class UserController:
 
         data, key, iv = api.decrypt_request_data(body=body)
 
-        user = self.user.get_user(username=self.username)
-
-        data = {"success": True, "is_admin": user is not None and user.admin}
+        data = {
+            "success": True,
+            "is_admin": self.principal is not None and self.principal.admin,
+        }
         return api.response_data(data=data, message="", status_code=200, key=key, iv=iv)
 
-    def is_logged_in(self, body: Dict[str, any], access_token: Union[str]) -> Response:
+    def is_logged_in(self, body: Dict[str, any]) -> Response:
         """
         Checks whether user is logged in or not.
 
         Args:
             body:
-            access_token:
 
         Returns:
 
@@ -242,7 +276,9 @@ class UserController:
 
         _, key, iv = api.decrypt_request_data(body=body)
 
-        session = Sessions()
-
-        data = {"Success": True, "is_logged_in": session.is_active(self.username)}
+        data = {
+            "Success": True,
+            "is_logged_in": self.principal is not None
+            and self.principal.session_active,
+        }
         return api.response_data(data=data, message="", status_code=200, key=key, iv=iv)
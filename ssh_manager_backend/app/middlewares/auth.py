@@ -1,33 +1,84 @@
-import base64
 import io
 import json
-from typing import Dict
+from typing import Dict, Union
 
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
 from werkzeug.wrappers import Request, Response
+from werkzeug.wsgi import get_input_stream
 
 from ssh_manager_backend.app.controllers import api_controller
+from ssh_manager_backend.app.controllers.secrets import verify_password
 from ssh_manager_backend.app.models import Users
-from ssh_manager_backend.app.services import utils
+from ssh_manager_backend.app.services.principal_cache import Principal
 from ssh_manager_backend.db import User
 
 
 class Auth:
-    def __init__(self, app):
+    __chunksize__ = 64 * 1024
+
+    def __init__(self, app, max_content_length: int = 1024 * 1024):
         self.app = app
+        self.max_content_length = max_content_length
+
+    def read_body(self, environ) -> bytes:
+        """
+        Reads the request body in chunks, stopping at the maximum content length, and puts a copy of it back in the
+        environ so that the application can read it again.
+
+        Args:
+            environ: WSGI environ
+
+        Returns: request body
+
+        """
+
+        content_length = environ.get("CONTENT_LENGTH")
+        if content_length and int(content_length) > self.max_content_length:
+            raise RequestEntityTooLarge()
+
+        stream = get_input_stream(environ)
+        body = io.BytesIO()
+
+        while True:
+            chunk: bytes = stream.read(self.__chunksize__)
+            if not chunk:
+                break
+
+            body.write(chunk)
+            if body.tell() > self.max_content_length:
+                raise RequestEntityTooLarge()
+
+        raw_body: bytes = body.getvalue()
+        environ["wsgi.input"] = io.BytesIO(raw_body)
+        environ["CONTENT_LENGTH"] = str(len(raw_body))
+        environ.pop("HTTP_TRANSFER_ENCODING", None)
+
+        return raw_body
 
     def __call__(self, environ, start_response):
         request = Request(environ)
-        request_endpoint = request.split(-1)
-        if request_endpoint in ["register", "login", "get_rsa_key"]:
+        request_endpoint = request.path.rstrip("/").split("/")[-1]
+        if request_endpoint in ["register", "login", "get_rsa_key", "metrics"]:
             return self.app(environ, start_response)
 
-        access_token: str = request.headers.get("access_token")
-        content_length = int(environ.get("CONTENT_LENGTH"))
-        request_body = environ["wsgi.input"].read(content_length).decode()
-        request_body: Dict[str, any] = json.loads(json.loads(request_body))
+        try:
+            request_body = self.read_body(environ).decode()
+            request_body: Dict[str, any] = json.loads(json.loads(request_body))
+        except HTTPException as error:
+            return error(environ, start_response)
+        except (TypeError, ValueError):
+            return BadRequest()(environ, start_response)
 
-        request_data, key, iv = api_controller.decrypt_request_data(body=request_body)
+        try:
+            decrypted_request = api_controller.decrypt_request_data(body=request_body)
+        except HTTPException as error:
+            return error(environ, start_response)
 
+        # The controllers get the decrypted request from the environ instead of decrypting the body again.
+        environ[api_controller.DECRYPTED_REQUEST] = decrypted_request
+        request_data, key, iv = decrypted_request
+
+        access_token: str = request.headers.get("access_token")
         if access_token is None:
             data = {"success": False}
             response = api_controller.response_data(
@@ -35,33 +86,36 @@ class Auth:
             )
             return response(environ, start_response)
 
-        access_token: str = base64.decodebytes(
-            bytes(access_token, encoding="utf-8")
-        ).decode()
-        username: str = access_token.split("+")[-1]
-        user: User = Users().get_user(username=username)
+        principal: Principal = api_controller.get_principal(access_token=access_token)
 
-        if user is None:
+        if principal is None or not (
+            principal.session_active or request_endpoint == "is_logged_in"
+        ):
             data = {"success": False}
             response = api_controller.response_data(
                 data=data, message="Unauthorized", status_code=401, key=key, iv=iv
             )
             return response(environ, start_response)
 
-        if request_endpoint in ["grant_access", "revoke_access"]:
-            if not user.admin:
+        if request_endpoint in [
+            "grant_access",
+            "revoke_access",
+            "revoke_all",
+            "grant_group_access",
+            "trust_certificate_authority",
+        ]:
+            if not principal.admin:
                 data = {"success": False}
                 response = api_controller.response_data(
                     data=data, message="Unauthorized", status_code=401, key=key, iv=iv
                 )
                 return response(environ, start_response)
 
-            user_password: str = request_data["password"]
-            password_hash: bytes = utils.hash_data(
-                data=user_password, salt=user.salt_for_password
-            )
-
-            if password_hash != user.password:
+            # The user may have been deleted while its signed access token is still valid.
+            user: Union[User, None] = Users().get_user(username=principal.username)
+            if user is None or not verify_password(
+                user=user, password=request_data["password"]
+            ):
                 data = {"success": False}
                 response = api_controller.response_data(
                     data=data,
@@ -1,7 +1,11 @@
-# from ssh_manager_backend.app.models.access_control import AccessControlModel
+from ssh_manager_backend.app.models.access_control import AccessControlModel
+from ssh_manager_backend.app.models.hosts import Hosts
+from ssh_manager_backend.app.models.index_changes import IndexChanges
 from ssh_manager_backend.app.models.private_keys import PrivateKeys
 from ssh_manager_backend.app.models.public_keys import PublicKeys
+from ssh_manager_backend.app.models.roles import Roles
 
 # from ssh_manager_backend.app.models.keys_mapping import KeyMappingModel
 from ssh_manager_backend.app.models.session import Sessions
+from ssh_manager_backend.app.models.transport_keys import TransportKeys
 from ssh_manager_backend.app.models.user import Users
@@ -1,131 +1,836 @@
-from typing import List, Union
+import ipaddress
+from typing import Dict, Iterable, List, Set, Tuple, Union
 
+from sqlalchemy import (
+    Integer,
+    String,
+    and_,
+    case,
+    cast,
+    delete,
+    false,
+    or_,
+    select,
+    text,
+    true,
+    tuple_,
+    union,
+)
+from sqlalchemy.dialects.postgresql import CIDR, INET, insert
 from sqlalchemy.exc import SQLAlchemyError
 
-from ssh_manager_backend.db import AccessControl, User
+from ssh_manager_backend.app.models.hosts import Hosts
+from ssh_manager_backend.app.models.index_changes import IndexChanges
+from ssh_manager_backend.app.services import grant_index, host_index, role_resolver
+from ssh_manager_backend.app.services.grant_index import normalize_host
+from ssh_manager_backend.app.services.host_index import (
+    canonical_selector,
+    host_labels,
+    parse_selector,
+)
+from ssh_manager_backend.db import (
+    AccessGrant,
+    GroupGrant,
+    Host,
+    RoleGrant,
+    RoleMember,
+    RoleParent,
+    User,
+)
 from ssh_manager_backend.db.database import db_session
 
 
+# A keyset cursor is the (user id, remote user) of the last grant of the previous page.
+Cursor = Tuple[int, str]
+
+# Matches the hosts stored as networks(see normalize_host), the only ones which can be cast to cidr.
+NETWORK_PATTERN = r"^[0-9a-fA-F:.]+/[0-9]+$"
+
+
+def ip_address_of(host: str) -> Union[str, None]:
+    """
+    Returns the normalized host if it is a single ip address, None for a network or a hostname.
+    """
+
+    try:
+        return str(ipaddress.ip_address(host))
+    except ValueError:
+        return None
+
+
+def network_contains(host, address):
+    """
+    Returns the SQL condition of a granted host being a network which contains the ip address. The CASE keeps the
+    hostnames from being cast to cidr.
+
+    :param host: column of the granted hosts
+    :param address: inet expression
+    """
+
+    return case(
+        [(host.op("~")(NETWORK_PATTERN), address.op("<<=")(cast(host, CIDR)))],
+        else_=false(),
+    )
+
+
 class AccessControlModel:
+    max_batch_size = 5000  # maximum number of pairs per has_access_batch call
+
     def __init__(self):
         self.session = db_session()
+        self.index_changes = IndexChanges()
+
+    def user_id(self, username: str) -> Union[int, None]:
+        """
+        Returns the id of the user.
+
+        :param username:
+        :return: user id, None if the user does not exist
+        """
+
+        row = self.session.query(User.id).filter(User.username == username).first()
+        return row.id if row is not None else None
+
+    def has_access(
+        self, username: str, ip_address: str, remote_user: str = None
+    ) -> Union[bool, None]:
+        """
+        Checks whether a user has access to the given ip address, as any remote user unless one is given. The grant
+        index answers the check when it has every committed grant; otherwise this is a lookup on the unique (user,
+        host, remote user) index, which also matches the grants to networks containing the ip address. The group
+        grants matching the labels of the host and the grants of the user's roles are checked next.
+
+        :param username:
+        :param ip_address:
+        :param remote_user:
+        :return: boolean value stating whether user has access or not.
+        """
+
+        if remote_user is None and self.index_changes.is_current(grant_index, "grants"):
+            granted = grant_index.has_access(username=username, host=ip_address)
+        else:
+            host: str = normalize_host(ip_address)
+            address: Union[str, None] = ip_address_of(host)
+            matches = AccessGrant.host == host
+            if address is not None:
+                matches = or_(
+                    matches, network_contains(AccessGrant.host, cast(address, INET))
+                )
+
+            try:
+                query = (
+                    self.session.query(AccessGrant.id)
+                    .join(User, User.id == AccessGrant.user_id)
+                    .filter(User.username == username, matches)
+                )
+                if remote_user is not None:
+                    query = query.filter(AccessGrant.remote_user == remote_user)
+
+                granted = self.session.query(query.exists()).scalar()
+            except SQLAlchemyError:
+                self.session.rollback()
+                return None
+
+        if granted:
+            return True
+
+        for check in (self.has_group_access, self.has_role_access):
+            results: Union[List[bool], None] = check(
+                pairs=[(username, ip_address)], remote_user=remote_user
+            )
+            if results is None:
+                return None
+            if results[0]:
+                return True
+
+        return False
+
+    def has_access_batch(self, pairs: List[Tuple[str, str]]) -> Union[List[bool], None]:
+        """
+        Checks a batch of (username, ip address) pairs against the grant index, or when it is stale, in a single query
+        where every pair is an EXISTS lookup on the unique (user, host, remote user) index. The pairs which
+        are not granted are then checked against the group grants, and those still not granted against the grants of
+        the users' roles. The results are returned in the order of the pairs.
+
+        :param pairs: list of (username, ip address)
+        :return: list of boolean values stating whether each user has access or not, None on failure.
+        :raises ValueError: If there are more than max_batch_size pairs
+        """
+
+        if len(pairs) > self.max_batch_size:
+            raise ValueError(f"At most {self.max_batch_size} pairs can be checked")
+
+        if not pairs:
+            return []
 
-    def create(self, username: str):
+        if self.index_changes.is_current(grant_index, "grants"):
+            results: List[bool] = [
+                grant_index.has_access(username=username, host=host)
+                for username, host in pairs
+            ]
+        else:
+            results = self._has_direct_access_batch(pairs=pairs)
+            if results is None:
+                return None
+
+        for check in (self.has_group_access, self.has_role_access):
+            ungranted: List[int] = [
+                position for position, granted in enumerate(results) if not granted
+            ]
+            if not ungranted:
+                break
+
+            check_results: Union[List[bool], None] = check(
+                pairs=[pairs[position] for position in ungranted]
+            )
+            if check_results is None:
+                return None
+
+            for position, granted in zip(ungranted, check_results):
+                results[position] = granted
+
+        return results
+
+    def _has_direct_access_batch(
+        self, pairs: List[Tuple[str, str]]
+    ) -> Union[List[bool], None]:
         """
-        Creates an entry in the access_control table for the given user.
+        Checks a batch of (username, ip address) pairs against the grants in a single query, including the grants to
+        networks containing the ip addresses.
 
-        :param username
-        :return: boolean value whether the entry is created or not.
+        :param pairs: list of (username, ip address)
+        :return: list of boolean values, None on failure.
         """
 
+        hosts: List[str] = [normalize_host(host) for _, host in pairs]
+        checks = (
+            text(
+                "SELECT * FROM unnest(CAST(:usernames AS VARCHAR[]), CAST(:hosts AS VARCHAR[]), "
+                "CAST(:addresses AS INET[])) WITH ORDINALITY AS checks(username, host, address, position)"
+            )
+            .bindparams(
+                usernames=[username for username, _ in pairs],
+                hosts=hosts,
+                addresses=[ip_address_of(host) for host in hosts],
+            )
+            .columns(username=String, host=String, address=INET, position=Integer)
+            .alias("checks")
+        )
+        granted = (
+            self.session.query(AccessGrant.id)
+            .join(User, User.id == AccessGrant.user_id)
+            .filter(
+                User.username == checks.c.username,
+                or_(
+                    AccessGrant.host == checks.c.host,
+                    and_(
+                        checks.c.address.isnot(None),
+                        network_contains(AccessGrant.host, checks.c.address),
+                    ),
+                ),
+            )
+            .exists()
+        )
+
         try:
-            acl_details: AccessControl = AccessControl(
-                username=username, ip_addresses=[]
+            rows = (
+                self.session.query(checks.c.position, granted.label("granted"))
+                .select_from(checks)
+                .order_by(checks.c.position)
+                .all()
             )
-            self.session.add(acl_details)
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        return [bool(row.granted) for row in rows]
+
+    def grant_access(
+        self, username: str, ip_addresses: List[str], remote_user: str = ""
+    ) -> bool:
+        """
+        Grants the user access to the ip addresses with a single insert. Existing grants are left as they are. An ip
+        address may also be a network in CIDR notation, which is stored as one grant.
+
+        :param username:
+        :param ip_addresses:
+        :param remote_user: The user on the remote hosts
+        :return: booleans value for success/failure.
+        """
+
+        hosts: List[str] = list({normalize_host(host) for host in ip_addresses})
+
+        try:
+            user_id: Union[int, None] = self.user_id(username=username)
+            if user_id is None:
+                return False
+
+            inserted = []
+            if hosts:
+                inserted = self.session.execute(
+                    insert(AccessGrant)
+                    .values(
+                        [
+                            {
+                                "user_id": user_id,
+                                "host": host,
+                                "remote_user": remote_user,
+                            }
+                            for host in hosts
+                        ]
+                    )
+                    .on_conflict_do_nothing(
+                        index_elements=["user_id", "host", "remote_user"]
+                    )
+                    .returning(AccessGrant.host)
+                ).fetchall()
+
+            if inserted:
+                self.index_changes.notify("grants")
             self.session.commit()
         except SQLAlchemyError:
             self.session.rollback()
             return False
 
+        grant_index.add(username=username, hosts=[row.host for row in inserted])
+
         return True
 
-    def has_access(self, username: str, ip_address: str) -> Union[bool, None]:
+    def revoke_access(
+        self,
+        username: str,
+        ip_addresses: List[str],
+        revoke_all: bool = False,
+        remote_user: str = None,
+    ) -> bool:
         """
-        Checks whether a user has access to the provided the list of ip addresses.
+        Revokes the access of the user to the ip addresses, or to all hosts, with a single delete.
 
         :param username:
-        :param ip_address:
-        :return: boolean value stating whether user has access or not.
+        :param ip_addresses:
+        :param revoke_all:
+        :param remote_user: Only revoke the grants of this remote user, defaults to all of them
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            user_id: Union[int, None] = self.user_id(username=username)
+            if user_id is None:
+                return False
+
+            statement = delete(AccessGrant).where(AccessGrant.user_id == user_id)
+            if not revoke_all:
+                statement = statement.where(
+                    AccessGrant.host.in_(
+                        [normalize_host(host) for host in ip_addresses]
+                    )
+                )
+            if remote_user is not None:
+                statement = statement.where(AccessGrant.remote_user == remote_user)
+
+            deleted = self.session.execute(
+                statement.returning(AccessGrant.host)
+            ).fetchall()
+            if deleted:
+                self.index_changes.notify("grants")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        grant_index.remove(username=username, hosts=[row.host for row in deleted])
+
+        return True
+
+    def revoke_access_batch(
+        self, revocations: List[Tuple[str, str]], remote_user: str = None
+    ) -> bool:
+        """
+        Revokes a batch of (username, ip address) grants of any number of users with a single delete.
+
+        :param revocations: list of (username, ip address or network)
+        :param remote_user: Only revoke the grants of this remote user, defaults to all of them
+        :return: booleans value for success/failure.
+        """
+
+        if not revocations:
+            return True
+
+        batch = (
+            text(
+                "SELECT * FROM unnest(CAST(:usernames AS VARCHAR[]), CAST(:hosts AS VARCHAR[])) "
+                "AS revocations(username, host)"
+            )
+            .bindparams(
+                usernames=[username for username, _ in revocations],
+                hosts=[normalize_host(host) for _, host in revocations],
+            )
+            .columns(username=String, host=String)
+            .alias("revocations")
+        )
+        statement = delete(AccessGrant).where(
+            and_(
+                User.id == AccessGrant.user_id,
+                User.username == batch.c.username,
+                AccessGrant.host == batch.c.host,
+            )
+        )
+        if remote_user is not None:
+            statement = statement.where(AccessGrant.remote_user == remote_user)
+
+        try:
+            deleted = self.session.execute(
+                statement.returning(User.username, AccessGrant.host)
+            ).fetchall()
+            if deleted:
+                self.index_changes.notify("grants")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        hosts_of_user: Dict[str, List[str]] = {}
+        for row in deleted:
+            hosts_of_user.setdefault(row.username, []).append(row.host)
+        for username, hosts in hosts_of_user.items():
+            grant_index.remove(username=username, hosts=hosts)
+
+        return True
+
+    def still_granted(
+        self, revocations: List[Tuple[str, str]], remote_user: str = None
+    ) -> Union[Set[Tuple[str, str]], None]:
+        """
+        Finds the revocations of a batch whose user keeps a grant of the same ip address for another remote user. The
+        CA key file of a user's grant of an ip address is shared by the remote users of that user and ip address(see
+        tasks.grant_access.key_name), so it can only be removed from the hosts once the user has none of them left. The
+        grants of the other users have files of their own and are not looked at.
+
+        :param revocations: list of (username, ip address or network)
+        :param remote_user: The remote user the grants are revoked for, defaults to all of them
+        :return: the (username, ip address) of the revocations, as given, None on failure.
         """
 
+        if not revocations or remote_user is None:
+            return set()
+
+        revocations_of: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for username, ip_address in revocations:
+            revocations_of.setdefault(
+                (username, normalize_host(ip_address)), []
+            ).append((username, ip_address))
+
         try:
-            acl_details: AccessControl = (
-                self.session.query(AccessControl)
-                .filter(AccessControl.username == username)
-                .first()
+            rows = (
+                self.session.query(User.username, AccessGrant.host)
+                .join(User, User.id == AccessGrant.user_id)
+                .filter(
+                    tuple_(User.username, AccessGrant.host).in_(list(revocations_of)),
+                    AccessGrant.remote_user != remote_user,
+                )
+                .distinct()
+                .all()
             )
-            return ip_address in acl_details.ip_addresses
-        except [AttributeError, SQLAlchemyError]:
+        except SQLAlchemyError:
+            self.session.rollback()
             return None
 
-    def grant_access(self, username: str, ip_addresses: List[str]) -> bool:
+        return {
+            revocation
+            for row in rows
+            for revocation in revocations_of[(row.username, row.host)]
+        }
+
+    def has_group_access(
+        self, pairs: List[Tuple[str, str]], remote_user: str = None
+    ) -> Union[List[bool], None]:
         """
-        Updates user access.
+        Checks a batch of (username, ip address) pairs against the group grants. The host index answers the checks
+        when it has every committed change and no remote user is given; otherwise the group grants of the users and the labels of the
+        hosts are read with one query each and matched here.
 
-        :param username:
-        :param ip_addresses:
-        :return: booleans value for success/failure.
+        :param pairs: list of (username, ip address)
+        :param remote_user: Only match the group grants of this remote user, defaults to all of them
+        :return: list of boolean values, None on failure.
         """
 
+        if remote_user is None and self.index_changes.is_current(host_index, "hosts"):
+            return [
+                host_index.has_access(username=username, host=normalize_host(host))
+                for username, host in pairs
+            ]
+
+        usernames: List[str] = list({username for username, _ in pairs})
+        addresses: List[str] = list({normalize_host(host) for _, host in pairs})
+
+        try:
+            query = (
+                self.session.query(User.username, GroupGrant.selector)
+                .join(User, User.id == GroupGrant.user_id)
+                .filter(User.username.in_(usernames))
+            )
+            if remote_user is not None:
+                query = query.filter(GroupGrant.remote_user == remote_user)
+            selectors: Dict[str, List[Dict[str, str]]] = {}
+            for row in query:
+                selectors.setdefault(row.username, []).append(
+                    parse_selector(row.selector)
+                )
+
+            labels: Dict[str, Dict[str, str]] = {}
+            if selectors:
+                labels = {
+                    row.address: host_labels(row.labels, row.zone)
+                    for row in self.session.query(
+                        Host.address, Host.labels, Host.zone
+                    ).filter(Host.address.in_(addresses))
+                }
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        return [
+            any(
+                all(
+                    labels.get(normalize_host(host), {}).get(key) == value
+                    for key, value in selector.items()
+                )
+                for selector in selectors.get(username, [])
+            )
+            for username, host in pairs
+        ]
+
+    def has_role_access(
+        self, pairs: List[Tuple[str, str]], remote_user: str = None
+    ) -> Union[List[bool], None]:
+        """
+        Checks a batch of (username, ip address) pairs against the grants of the users' roles, including the inherited
+        ones. The role resolver answers from the memoized grants of each user when it has every committed change and no
+        remote user is given; otherwise a single recursive query walks the roles of the users up to their ancestors and
+        reads their grants of the hosts and of the networks, which are matched here.
+
+        :param pairs: list of (username, ip address)
+        :param remote_user: Only match the role grants of this remote user, defaults to all of them
+        :return: list of boolean values, None on failure.
+        """
+
+        if remote_user is None and self.index_changes.is_current(
+            role_resolver, "roles"
+        ):
+            return [
+                role_resolver.has_access(username=username, host=host)
+                for username, host in pairs
+            ]
+
+        roles = (
+            select([User.username, RoleMember.role_id])
+            .select_from(RoleMember.__table__.join(User.__table__))
+            .where(User.username.in_(list({username for username, _ in pairs})))
+            .cte("user_roles", recursive=True)
+        )
+        roles = roles.union(
+            select([roles.c.username, RoleParent.parent_id]).where(
+                RoleParent.role_id == roles.c.role_id
+            )
+        )
+        query = (
+            select([roles.c.username, RoleGrant.host])
+            .select_from(roles.join(RoleGrant, RoleGrant.role_id == roles.c.role_id))
+            .where(
+                or_(
+                    RoleGrant.host.in_(
+                        list({normalize_host(host) for _, host in pairs})
+                    ),
+                    RoleGrant.host.op("~")(NETWORK_PATTERN),
+                )
+            )
+            .distinct()
+        )
+        if remote_user is not None:
+            query = query.where(RoleGrant.remote_user == remote_user)
+
         try:
-            acl_details: AccessControl = (
-                self.session.query(AccessControl, User)
-                .join(User)
-                .filter(AccessControl.username == username)
-                .first()
+            rows = self.session.execute(query).fetchall()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        granted: Set[Tuple[str, str]] = set()
+        networks: Dict[str, list] = {}
+        for row in rows:
+            if "/" in row.host:
+                networks.setdefault(row.username, []).append(
+                    ipaddress.ip_network(row.host)
+                )
+            else:
+                granted.add((row.username, row.host))
+
+        def has_access(username: str, host: str) -> bool:
+            if (username, host) in granted:
+                return True
+
+            address: Union[str, None] = ip_address_of(host)
+            return address is not None and any(
+                ipaddress.ip_address(address) in network
+                for network in networks.get(username, [])
             )
 
-            acl_details.ip_addresses += ip_addresses
-            acl_details.ip_addresses = list(set(acl_details.ip_addresses))
+        return [has_access(username, normalize_host(host)) for username, host in pairs]
 
-            self.session.query(AccessControl).filter(
-                AccessControl.username == username
-            ).update({"ip_addresses": acl_details.ip_addresses})
+    def grant_group_access(
+        self, username: str, selector: str, remote_user: str = ""
+    ) -> bool:
+        """
+        Grants the user access to every host matching the label selector, now and in the future, as a single row.
+
+        :param username:
+        :param selector: e.g. "env=prod, role=db"
+        :param remote_user: The user on the remote hosts
+        :return: booleans value for success/failure.
+        :raises ValueError: If the selector is malformed
+        """
 
+        selector = canonical_selector(selector)
+
+        try:
+            user_id: Union[int, None] = self.user_id(username=username)
+            if user_id is None:
+                return False
+
+            inserted = self.session.execute(
+                insert(GroupGrant)
+                .values(user_id=user_id, selector=selector, remote_user=remote_user)
+                .on_conflict_do_nothing(
+                    index_elements=["user_id", "selector", "remote_user"]
+                )
+                .returning(GroupGrant.selector)
+            ).fetchall()
+            if inserted:
+                self.index_changes.notify("hosts")
             self.session.commit()
-        except AttributeError:
-            return False
         except SQLAlchemyError:
             self.session.rollback()
             return False
 
+        host_index.add_group_grants(
+            username=username, selectors=[row.selector for row in inserted]
+        )
+
         return True
 
-    def revoke_access(
-        self, username: str, ip_addresses: List[str], revoke_all: bool = False
+    def revoke_group_access(
+        self, username: str, selector: str, remote_user: str = None
     ) -> bool:
         """
-        Updates user access.
+        Revokes a group grant of the user.
 
         :param username:
-        :param ip_addresses:
-        :param revoke_all:.
+        :param selector:
+        :param remote_user: Only revoke the grant of this remote user, defaults to all of them
         :return: booleans value for success/failure.
+        :raises ValueError: If the selector is malformed
         """
 
+        selector = canonical_selector(selector)
+
         try:
-            acl_details: AccessControl = (
-                self.session.query(AccessControl)
-                .join(User)
-                .filter(AccessControl.username == username)
-                .first()
-            )
+            user_id: Union[int, None] = self.user_id(username=username)
+            if user_id is None:
+                return False
 
-            if not revoke_all:
-                for ip in ip_addresses:
-                    try:
-                        acl_details.ip_addresses.remove(ip)
-                    except ValueError:
-                        continue
-
-                self.session.query(AccessControl).filter(
-                    AccessControl.username == username
-                ).update({"ip_addresses": acl_details.ip_addresses})
-            else:
-                self.session.query(AccessControl).filter(
-                    AccessControl.username == username
-                ).update({"ip_addresses": []})
+            statement = delete(GroupGrant).where(
+                and_(GroupGrant.user_id == user_id, GroupGrant.selector == selector)
+            )
+            if remote_user is not None:
+                statement = statement.where(GroupGrant.remote_user == remote_user)
 
+            deleted = self.session.execute(
+                statement.returning(GroupGrant.selector)
+            ).fetchall()
+            if deleted:
+                self.index_changes.notify("hosts")
             self.session.commit()
-        except AttributeError:
+        except SQLAlchemyError:
+            self.session.rollback()
             return False
+
+        host_index.remove_group_grants(
+            username=username, selectors=[row.selector for row in deleted]
+        )
+
+        return True
+
+    def revoke_all_group_access(self, username: str) -> bool:
+        """
+        Revokes all the group grants of the user with a single delete, e.g. when offboarding.
+
+        :param username:
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            deleted = self.session.execute(
+                delete(GroupGrant)
+                .where(
+                    and_(
+                        User.id == GroupGrant.user_id,
+                        User.username == username,
+                    )
+                )
+                .returning(GroupGrant.selector)
+            ).fetchall()
+            if deleted:
+                self.index_changes.notify("hosts")
+            self.session.commit()
         except SQLAlchemyError:
             self.session.rollback()
             return False
 
+        host_index.remove_group_grants(
+            username=username, selectors=[row.selector for row in deleted]
+        )
+
         return True
 
+    def get_group_grants(self, username: str) -> List[Tuple[str, str]]:
+        """
+        Gets all the group grants of the given user.
+
+        :param username:
+        :return: list of (selector, remote user)
+        """
+
+        try:
+            rows = (
+                self.session.query(GroupGrant.selector, GroupGrant.remote_user)
+                .join(User, User.id == GroupGrant.user_id)
+                .filter(User.username == username)
+                .order_by(GroupGrant.selector, GroupGrant.remote_user)
+                .all()
+            )
+            return [(row.selector, row.remote_user) for row in rows]
+        except SQLAlchemyError:
+            self.session.rollback()
+            return []
+
+    def all_group_grants(self) -> List[Tuple[str, str]]:
+        """
+        Returns every group grant, for loading the host index.
+
+        :return: list of (username, selector), once per grant
+        """
+
+        rows = (
+            self.session.query(User.username, GroupGrant.selector)
+            .join(User, User.id == GroupGrant.user_id)
+            .yield_per(10000)
+        )
+
+        return [(row.username, row.selector) for row in rows]
+
+    def hosts_reachable(
+        self, any_of: List[str], none_of: List[str] = None
+    ) -> Union[List[str], None]:
+        """
+        Finds the hosts reachable by anyone in one group of users but by no one in another, e.g. the hosts of team A
+        which team B can not reach. The access matrix of the grant index answers when it is current; otherwise this is
+        a single EXCEPT query. Networks count as single hosts and group grants are not included.
+
+        :param any_of: usernames
+        :param none_of: usernames
+        :return: sorted list of hosts, None on failure.
+        """
+
+        if self.index_changes.is_current(grant_index, "grants"):
+            return grant_index.matrix.hosts_reachable(
+                any_of=any_of, none_of=none_of or []
+            )
+
+        def hosts_of(usernames: List[str]):
+            return (
+                select([AccessGrant.host])
+                .select_from(AccessGrant.__table__.join(User.__table__))
+                .where(User.username.in_(usernames))
+                .distinct()
+            )
+
+        query = hosts_of(any_of)
+        if none_of:
+            query = query.except_(hosts_of(none_of))
+
+        try:
+            rows = self.session.execute(query).fetchall()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        return sorted(row.host for row in rows)
+
+    def users_reaching(
+        self, host_groups: List[List[str]], excluding: List[str] = None
+    ) -> Union[List[str], None]:
+        """
+        Finds the users who can reach at least one host of every group and none of the excluded hosts, e.g. the users
+        with both prod and staging access. The access matrix of the grant index answers when it is current; otherwise
+        the grants of the given hosts are read from the (host, user id, remote user) index in a single query.
+
+        :param host_groups: lists of hosts
+        :param excluding: hosts
+        :return: sorted list of usernames, None on failure.
+        """
+
+        host_groups = [
+            [normalize_host(host) for host in hosts] for hosts in host_groups
+        ]
+        excluding = [normalize_host(host) for host in excluding or []]
+
+        if self.index_changes.is_current(grant_index, "grants"):
+            return grant_index.matrix.users_reaching(
+                host_groups=host_groups, excluding=excluding
+            )
+
+        if not host_groups:
+            return []
+
+        hosts: Set[str] = set(excluding).union(*host_groups)
+        try:
+            rows = (
+                self.session.query(User.username, AccessGrant.host)
+                .join(User, User.id == AccessGrant.user_id)
+                .filter(AccessGrant.host.in_(hosts))
+                .all()
+            )
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        users_of_host: Dict[str, Set[str]] = {}
+        for row in rows:
+            users_of_host.setdefault(row.host, set()).add(row.username)
+
+        def users_of_any(group: List[str]) -> Set[str]:
+            return set().union(*(users_of_host.get(host, set()) for host in group))
+
+        users: Set[str] = set.intersection(
+            *(users_of_any(group) for group in host_groups)
+        )
+        return sorted(users - users_of_any(excluding))
+
+    def all_grants(self) -> List[Tuple[str, str]]:
+        """
+        Returns every grant, for loading the grant index.
+
+        :return: list of (username, host), once per grant
+        """
+
+        rows = (
+            self.session.query(User.username, AccessGrant.host)
+            .join(User, User.id == AccessGrant.user_id)
+            .yield_per(10000)
+        )
+
+        return [(row.username, row.host) for row in rows]
+
     def get_all_ips(self, username: str) -> List[str]:
         """
         Gets list of all Ip addresses for the given user.
@@ -135,12 +840,292 @@ class AccessControlModel:
         """
 
         try:
-            acl_details: AccessControl = (
-                self.session.query(AccessControl)
-                .join(User)
-                .filter(AccessControl.username == username)
-                .first()
+            rows = (
+                self.session.query(AccessGrant.host)
+                .join(User, User.id == AccessGrant.user_id)
+                .filter(User.username == username)
+                .distinct()
+                .all()
             )
-            return acl_details.ip_addresses
-        except (AttributeError, SQLAlchemyError):
+            return [row.host for row in rows]
+        except SQLAlchemyError:
+            self.session.rollback()
             return []
+
+    def get_grants(self, username: str) -> List[Tuple[str, str]]:
+        """
+        Gets all the grants of the given user.
+
+        :param username:
+        :return: list of (ip address, remote user)
+        """
+
+        try:
+            rows = (
+                self.session.query(AccessGrant.host, AccessGrant.remote_user)
+                .join(User, User.id == AccessGrant.user_id)
+                .filter(User.username == username)
+                .order_by(AccessGrant.host, AccessGrant.remote_user)
+                .all()
+            )
+            return [(row.host, row.remote_user) for row in rows]
+        except SQLAlchemyError:
+            self.session.rollback()
+            return []
+
+    def certificate_principals(
+        self, username: str, limit: int
+    ) -> Union[List[str], None]:
+        """
+        Gets the principals of the user's SSH certificates: "remote_user@host" for every host the user is granted as a
+        remote user, directly(every host of a granted network) or through a group grant. The hosts only accept the
+        principals naming themselves, so that a certificate can not log in to hosts the user is not granted. Grants
+        without a remote user are left out.
+
+        :param username:
+        :param limit: Stop once there are more principals than this, as they would not fit in a certificate
+        :return: sorted list of principals, more than "limit" if there are too many. None on failure.
+        """
+
+        try:
+            direct = (
+                self.session.query(AccessGrant.host, AccessGrant.remote_user)
+                .join(User, User.id == AccessGrant.user_id)
+                .filter(User.username == username, AccessGrant.remote_user != "")
+                .all()
+            )
+            group = (
+                self.session.query(GroupGrant.selector, GroupGrant.remote_user)
+                .join(User, User.id == GroupGrant.user_id)
+                .filter(User.username == username, GroupGrant.remote_user != "")
+                .all()
+            )
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        hosts_of_grants: List[Tuple[str, Iterable[str]]] = []
+        for row in direct:
+            hosts: Iterable[str] = [row.host]
+            if "/" in row.host:
+                hosts = map(str, ipaddress.ip_network(row.host).hosts())
+            hosts_of_grants.append((row.remote_user, hosts))
+        for row in group:
+            members: Union[List[str], None] = Hosts().members(selector=row.selector)
+            if members is None:
+                return None
+            hosts_of_grants.append((row.remote_user, members))
+
+        principals: Set[str] = set()
+        for remote_user, hosts in hosts_of_grants:
+            for host in hosts:
+                principals.add(f"{remote_user}@{host}")
+                if len(principals) > limit:
+                    return sorted(principals)
+
+        return sorted(principals)
+
+    def users_with_access(
+        self, hosts: List[str], limit: int, cursors: Dict[str, Cursor] = None
+    ) -> Union[Dict[str, Tuple[List[Tuple[str, str]], Union[Cursor, None]]], None]:
+        """
+        Finds the users who can reach each of the hosts, in a single query, like has_access: through a grant of the
+        host or of a network containing it, a group grant matching its labels or a grant of one of their roles,
+        including the inherited ones. Every host gets a page of at most "limit" (user, remote user) ordered by (user
+        id, remote user), read after the cursor of that host, so that hosts with very large user sets can be paged
+        through without offsets. The grants of the host itself are read from the (host, user id, remote user) index.
+
+        :param hosts:
+        :param limit: Maximum number of grants per host
+        :param cursors: Cursor of each host to continue after, as returned for the previous page
+        :return: for each host, as given, its list of (username, remote user) and the cursor of the next page or None
+        if it was the last one. None on failure.
+        """
+
+        cursors = cursors or {}
+        hosts = list(dict.fromkeys(hosts))
+        normalized: List[str] = [normalize_host(host) for host in hosts]
+
+        try:
+            host_selectors: List[Tuple[str, str]] = self.matching_selectors(
+                hosts=dict(zip(hosts, normalized))
+            )
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        pages = (
+            text(
+                "SELECT * FROM unnest(CAST(:hosts AS VARCHAR[]), CAST(:normalized AS VARCHAR[]), "
+                "CAST(:addresses AS INET[]), CAST(:user_ids AS INTEGER[]), CAST(:remote_users AS VARCHAR[])) "
+                "AS pages(host, normalized, address, after_user_id, after_remote_user)"
+            )
+            .bindparams(
+                hosts=hosts,
+                normalized=normalized,
+                addresses=[ip_address_of(host) for host in normalized],
+                user_ids=[cursors.get(host, (0, ""))[0] for host in hosts],
+                remote_users=[cursors.get(host, (0, ""))[1] for host in hosts],
+            )
+            .columns(
+                host=String,
+                normalized=String,
+                address=INET,
+                after_user_id=Integer,
+                after_remote_user=String,
+            )
+            .alias("pages")
+        )
+        selectors = (
+            text(
+                "SELECT * FROM unnest(CAST(:selector_hosts AS VARCHAR[]), CAST(:selectors AS VARCHAR[])) "
+                "AS host_selectors(host, selector)"
+            )
+            .bindparams(
+                selector_hosts=[host for host, _ in host_selectors],
+                selectors=[selector for _, selector in host_selectors],
+            )
+            .columns(host=String, selector=String)
+            .alias("host_selectors")
+        )
+
+        def granted_by(host):
+            return or_(
+                host == pages.c.normalized,
+                and_(
+                    pages.c.address.isnot(None), network_contains(host, pages.c.address)
+                ),
+            )
+
+        # The roles granted each host, and the roles inheriting from them.
+        roles = (
+            select([pages.c.host, RoleGrant.role_id, RoleGrant.remote_user])
+            .select_from(pages.join(RoleGrant, granted_by(RoleGrant.host)))
+            .cte("host_roles", recursive=True)
+        )
+        roles = roles.union(
+            select([roles.c.host, RoleParent.role_id, roles.c.remote_user]).where(
+                RoleParent.parent_id == roles.c.role_id
+            )
+        )
+
+        def after_cursor(query, user_id, remote_user):
+            # The branches of the union are correlated with the row of pages by hand, unlike the lateral itself.
+            return query.where(
+                tuple_(user_id, remote_user)
+                > tuple_(pages.c.after_user_id, pages.c.after_remote_user)
+            ).correlate(pages)
+
+        candidates = union(
+            after_cursor(
+                select([AccessGrant.user_id, AccessGrant.remote_user]).where(
+                    AccessGrant.host == pages.c.normalized
+                ),
+                AccessGrant.user_id,
+                AccessGrant.remote_user,
+            ),
+            after_cursor(
+                select([AccessGrant.user_id, AccessGrant.remote_user]).where(
+                    and_(
+                        pages.c.address.isnot(None),
+                        network_contains(AccessGrant.host, pages.c.address),
+                    )
+                ),
+                AccessGrant.user_id,
+                AccessGrant.remote_user,
+            ),
+            after_cursor(
+                select([GroupGrant.user_id, GroupGrant.remote_user]).where(
+                    GroupGrant.selector.in_(
+                        select([selectors.c.selector])
+                        .where(selectors.c.host == pages.c.host)
+                        .correlate(pages)
+                    )
+                ),
+                GroupGrant.user_id,
+                GroupGrant.remote_user,
+            ),
+            after_cursor(
+                select([RoleMember.user_id, roles.c.remote_user])
+                .select_from(
+                    roles.join(RoleMember, RoleMember.role_id == roles.c.role_id)
+                )
+                .where(roles.c.host == pages.c.host),
+                RoleMember.user_id,
+                roles.c.remote_user,
+            ),
+        ).alias("candidates")
+        grants = (
+            select([candidates.c.user_id, candidates.c.remote_user])
+            .order_by(candidates.c.user_id, candidates.c.remote_user)
+            .limit(limit + 1)
+            .lateral("grants")
+        )
+
+        try:
+            rows = (
+                self.session.query(
+                    pages.c.host, grants.c.user_id, User.username, grants.c.remote_user
+                )
+                .select_from(pages)
+                .join(grants, true())
+                .join(User, User.id == grants.c.user_id)
+                .order_by(pages.c.host, grants.c.user_id, grants.c.remote_user)
+                .all()
+            )
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+        rows_by_host: Dict[str, list] = {host: [] for host in hosts}
+        for row in rows:
+            rows_by_host[row.host].append(row)
+
+        result: Dict[str, Tuple[List[Tuple[str, str]], Union[Cursor, None]]] = {}
+        for host, host_rows in rows_by_host.items():
+            page = host_rows[:limit]
+            # The extra row only tells that there is a next page.
+            next_cursor: Union[Cursor, None] = (
+                (page[-1].user_id, page[-1].remote_user)
+                if len(host_rows) > limit
+                else None
+            )
+            result[host] = (
+                [(row.username, row.remote_user) for row in page],
+                next_cursor,
+            )
+
+        return result
+
+    def matching_selectors(self, hosts: Dict[str, str]) -> List[Tuple[str, str]]:
+        """
+        Matches the selectors of the group grants against the labels of the hosts.
+
+        :param hosts: normalized host of each host
+        :return: list of (host, selector)
+        :raises SQLAlchemyError: On failure
+        """
+
+        selectors: List[str] = [
+            row.selector for row in self.session.query(GroupGrant.selector).distinct()
+        ]
+        if not selectors:
+            return []
+
+        labels: Dict[str, Dict[str, str]] = {
+            row.address: host_labels(row.labels, row.zone)
+            for row in self.session.query(Host.address, Host.labels, Host.zone).filter(
+                Host.address.in_(list(set(hosts.values())))
+            )
+        }
+
+        return [
+            (host, selector)
+            for host, address in hosts.items()
+            for selector in selectors
+            if address in labels
+            and all(
+                labels[address].get(key) == value
+                for key, value in parse_selector(selector).items()
+            )
+        ]
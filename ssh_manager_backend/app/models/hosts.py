@@ -0,0 +1,115 @@
+from typing import Dict, List, Tuple, Union
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from ssh_manager_backend.app.models.index_changes import IndexChanges
+from ssh_manager_backend.app.services import host_index
+from ssh_manager_backend.app.services.grant_index import normalize_host
+from ssh_manager_backend.app.services.host_index import host_labels, parse_selector
+from ssh_manager_backend.db import Host
+from ssh_manager_backend.db.database import db_session
+
+
+class Hosts:
+    def __init__(self):
+        self.session = db_session()
+        self.index_changes = IndexChanges()
+
+    def register(
+        self, address: str, labels: Dict[str, str] = None, zone: str = None
+    ) -> bool:
+        """
+        Registers a host, or replaces the labels and zone of a registered host, and updates the host index.
+
+        :param address:
+        :param labels:
+        :param zone:
+        :return: booleans value for success/failure.
+        """
+
+        address = normalize_host(address)
+        labels = {str(key): str(value) for key, value in (labels or {}).items()}
+
+        try:
+            statement = insert(Host).values(address=address, labels=labels, zone=zone)
+            self.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["address"],
+                    set_={
+                        "labels": statement.excluded.labels,
+                        "zone": statement.excluded.zone,
+                    },
+                )
+            )
+            self.index_changes.notify("hosts")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        host_index.set_host(address=address, labels=host_labels(labels, zone))
+
+        return True
+
+    def remove(self, address: str) -> bool:
+        """
+        Removes a host from the registry and the host index.
+
+        :param address:
+        :return: booleans value for success/failure.
+        """
+
+        address = normalize_host(address)
+
+        try:
+            self.session.execute(delete(Host).where(Host.address == address))
+            self.index_changes.notify("hosts")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        host_index.remove_host(address=address)
+
+        return True
+
+    def members(self, selector: str) -> Union[List[str], None]:
+        """
+        Returns the addresses of the hosts matching a label selector, from the host index when it is current and
+        otherwise with a containment query on the labels.
+
+        :param selector: e.g. "env=prod, role=db"
+        :return: sorted list of addresses, None on failure.
+        :raises ValueError: If the selector is malformed
+        """
+
+        labels: Dict[str, str] = parse_selector(selector)
+
+        if self.index_changes.is_current(host_index, "hosts"):
+            return sorted(host_index.members(labels))
+
+        zone: Union[str, None] = labels.pop("zone", None)
+        try:
+            query = self.session.query(Host.address).filter(
+                Host.labels.contains(labels)
+            )
+            if zone is not None:
+                query = query.filter(Host.zone == zone)
+
+            return sorted(row.address for row in query)
+        except SQLAlchemyError:
+            self.session.rollback()
+            return None
+
+    def all_hosts(self) -> List[Tuple[str, Dict[str, str]]]:
+        """
+        Returns every host, for loading the host index.
+
+        :return: list of (address, labels including the zone)
+        """
+
+        rows = self.session.query(Host.address, Host.labels, Host.zone).yield_per(10000)
+
+        return [(row.address, host_labels(row.labels, row.zone)) for row in rows]
@@ -0,0 +1,48 @@
+from sqlalchemy import text
+
+from ssh_manager_backend.app.services import change_listener
+from ssh_manager_backend.app.services.background_sync import BackgroundSync
+from ssh_manager_backend.app.services.change_listener import CHANNEL
+from ssh_manager_backend.db.database import db_session
+
+
+class IndexChanges:
+    def __init__(self):
+        self.session = db_session()
+
+    def notify(self, name: str) -> None:
+        """
+        Notifies the other workers of a change to an index source in the current transaction, which the caller
+        commits. The notification is only delivered if the transaction commits(see the change_listener service).
+
+        :param name: "grants", "hosts" or "roles"
+        :return: None
+        """
+
+        self.session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": CHANNEL, "payload": change_listener.payload(name)},
+        )
+
+    @staticmethod
+    def is_current(index: BackgroundSync, name: str) -> bool:
+        """
+        Checks whether an in-memory index has every committed change of its source, so that it can answer for the
+        database. This is an in-memory check against the generation of the change listener. A stale index is synced
+        early.
+
+        :param index: grant_index, host_index or role_resolver
+        :param name: the name of its source
+        :return: boolean value, False while the change listener is disconnected
+        """
+
+        version = change_listener.version(name)
+        if version is None:
+            return False
+
+        if index.is_current(version):
+            return True
+
+        if index.loaded:
+            index.request_sync()
+        return False
@@ -23,13 +23,16 @@ class PrivateKeys:
             is not None
         )
 
-    def create(self, encrypted_key: bytes, key_hash: str, user_id: int) -> bool:
+    def create(
+        self, encrypted_key: bytes, key_hash: str, user_id: int, kdf_version: int
+    ) -> bool:
         """
         Creates a key in database.
 
         :param encrypted_key:
         :param key_hash:
         :param user_id:
+        :param kdf_version: version of the derivation of the key used for encryption
         :return: Boolean value indicating success/failure.
         """
 
@@ -37,6 +40,7 @@ class PrivateKeys:
             key: PrivateKey = PrivateKey(
                 encrypted_private_key=encrypted_key,
                 key_hash=key_hash,
+                kdf_version=kdf_version,
                 user_id=user_id,
             )
 
@@ -60,6 +64,29 @@ class PrivateKeys:
             self.session.query(PrivateKey).filter(PrivateKey.name == key_name).first()
         )
 
+    def update_encrypted_key(
+        self, key_id: int, encrypted_key: bytes, kdf_version: int
+    ) -> bool:
+        """
+        Replaces the encrypted key, used when the key is migrated to a new version of the key derivation.
+
+        :param key_id:
+        :param encrypted_key:
+        :param kdf_version:
+        :return: Boolean value indicating success/failure.
+        """
+
+        try:
+            self.session.query(PrivateKey).filter(PrivateKey.id == key_id).update(
+                {"encrypted_private_key": encrypted_key, "kdf_version": kdf_version}
+            )
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        return True
+
     def delete_key(self, key_name: str) -> bool:
         """
         Deletes a private key.
@@ -0,0 +1,397 @@
+from typing import List, Set, Tuple, Union
+
+from sqlalchemy import Integer, and_, delete, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased
+
+from ssh_manager_backend.app.models.index_changes import IndexChanges
+from ssh_manager_backend.app.services import role_resolver
+from ssh_manager_backend.app.services.grant_index import normalize_host
+from ssh_manager_backend.db import Role, RoleGrant, RoleMember, RoleParent, User
+from ssh_manager_backend.db.database import db_session
+
+
+class Roles:
+    def __init__(self):
+        self.session = db_session()
+        self.index_changes = IndexChanges()
+
+    def role_id(self, name: str) -> Union[int, None]:
+        """
+        Returns the id of the role.
+
+        :param name:
+        :return: role id, None if the role does not exist
+        """
+
+        row = self.session.query(Role.id).filter(Role.name == name).first()
+        return row.id if row is not None else None
+
+    def create(self, name: str) -> bool:
+        """
+        Creates a role.
+
+        :param name:
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            self.session.execute(
+                insert(Role)
+                .values(name=name)
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        return True
+
+    def delete(self, name: str) -> bool:
+        """
+        Deletes a role with its grants, members and inheritances.
+
+        :param name:
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            self.session.execute(delete(Role).where(Role.name == name))
+            self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        role_resolver.remove_role(role=name)
+
+        return True
+
+    def ancestor_ids(self, role_id: int) -> Set[int]:
+        """
+        Returns the ids of the role and of every role it inherits from, with a recursive query.
+
+        :param role_id:
+        :return: set of role ids
+        """
+
+        ancestors = select([literal(role_id, Integer).label("id")]).cte(
+            "ancestors", recursive=True
+        )
+        ancestors = ancestors.union(
+            select([RoleParent.parent_id]).where(RoleParent.role_id == ancestors.c.id)
+        )
+
+        return {row.id for row in self.session.execute(select([ancestors.c.id]))}
+
+    def add_parent(self, name: str, parent: str) -> bool:
+        """
+        Makes the role inherit the grants of the parent role. An inheritance which would close a cycle is refused.
+
+        :param name:
+        :param parent:
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            role_id: Union[int, None] = self.role_id(name=name)
+            parent_id: Union[int, None] = self.role_id(name=parent)
+            if role_id is None or parent_id is None:
+                return False
+
+            if role_id in self.ancestor_ids(role_id=parent_id):
+                return False
+
+            self.session.execute(
+                insert(RoleParent)
+                .values(role_id=role_id, parent_id=parent_id)
+                .on_conflict_do_nothing(index_elements=["role_id", "parent_id"])
+            )
+            self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        role_resolver.add_parent(role=name, parent=parent)
+
+        return True
+
+    def remove_parent(self, name: str, parent: str) -> bool:
+        """
+        Stops the role inheriting the grants of the parent role.
+
+        :param name:
+        :param parent:
+        :return: booleans value for success/failure.
+        """
+
+        parent_role = aliased(Role)
+        try:
+            self.session.execute(
+                delete(RoleParent).where(
+                    and_(
+                        RoleParent.role_id
+                        == select([Role.id]).where(Role.name == name).as_scalar(),
+                        RoleParent.parent_id
+                        == select([parent_role.id])
+                        .where(parent_role.name == parent)
+                        .as_scalar(),
+                    )
+                )
+            )
+            self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        role_resolver.remove_parent(role=name, parent=parent)
+
+        return True
+
+    def grant_access(
+        self, name: str, ip_addresses: List[str], remote_user: str = ""
+    ) -> bool:
+        """
+        Grants the role access to the ip addresses or networks with a single insert.
+
+        :param name:
+        :param ip_addresses:
+        :param remote_user: The user on the remote hosts
+        :return: booleans value for success/failure.
+        """
+
+        hosts: List[str] = list({normalize_host(host) for host in ip_addresses})
+
+        try:
+            role_id: Union[int, None] = self.role_id(name=name)
+            if role_id is None:
+                return False
+
+            inserted = []
+            if hosts:
+                inserted = self.session.execute(
+                    insert(RoleGrant)
+                    .values(
+                        [
+                            {
+                                "role_id": role_id,
+                                "host": host,
+                                "remote_user": remote_user,
+                            }
+                            for host in hosts
+                        ]
+                    )
+                    .on_conflict_do_nothing(
+                        index_elements=["role_id", "host", "remote_user"]
+                    )
+                    .returning(RoleGrant.host, RoleGrant.remote_user)
+                ).fetchall()
+            if inserted:
+                self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        role_resolver.add_grants(
+            role=name, grants=[(row.host, row.remote_user) for row in inserted]
+        )
+
+        return True
+
+    def revoke_access(
+        self, name: str, ip_addresses: List[str], remote_user: str = None
+    ) -> bool:
+        """
+        Revokes the access of the role to the ip addresses or networks with a single delete.
+
+        :param name:
+        :param ip_addresses:
+        :param remote_user: Only revoke the grants of this remote user, defaults to all of them
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            role_id: Union[int, None] = self.role_id(name=name)
+            if role_id is None:
+                return False
+
+            statement = delete(RoleGrant).where(
+                and_(
+                    RoleGrant.role_id == role_id,
+                    RoleGrant.host.in_([normalize_host(host) for host in ip_addresses]),
+                )
+            )
+            if remote_user is not None:
+                statement = statement.where(RoleGrant.remote_user == remote_user)
+
+            deleted = self.session.execute(
+                statement.returning(RoleGrant.host, RoleGrant.remote_user)
+            ).fetchall()
+            if deleted:
+                self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        role_resolver.remove_grants(
+            role=name, grants=[(row.host, row.remote_user) for row in deleted]
+        )
+
+        return True
+
+    def add_member(self, name: str, username: str) -> bool:
+        """
+        Makes the user a member of the role.
+
+        :param name:
+        :param username:
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            role_id: Union[int, None] = self.role_id(name=name)
+            user = self.session.query(User.id).filter(User.username == username).first()
+            if role_id is None or user is None:
+                return False
+
+            self.session.execute(
+                insert(RoleMember)
+                .values(role_id=role_id, user_id=user.id)
+                .on_conflict_do_nothing(index_elements=["user_id", "role_id"])
+            )
+            self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        role_resolver.add_member(role=name, username=username)
+
+        return True
+
+    def remove_member(self, name: str, username: str) -> bool:
+        """
+        Removes the user from the role.
+
+        :param name:
+        :param username:
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            self.session.execute(
+                delete(RoleMember).where(
+                    and_(
+                        RoleMember.role_id
+                        == select([Role.id]).where(Role.name == name).as_scalar(),
+                        RoleMember.user_id
+                        == select([User.id])
+                        .where(User.username == username)
+                        .as_scalar(),
+                    )
+                )
+            )
+            self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        role_resolver.remove_member(role=name, username=username)
+
+        return True
+
+    def remove_all_memberships(self, username: str) -> bool:
+        """
+        Removes the user from all the roles with a single delete, e.g. when offboarding.
+
+        :param username:
+        :return: booleans value for success/failure.
+        """
+
+        try:
+            deleted = self.session.execute(
+                delete(RoleMember)
+                .where(
+                    and_(
+                        Role.id == RoleMember.role_id,
+                        User.id == RoleMember.user_id,
+                        User.username == username,
+                    )
+                )
+                .returning(Role.name)
+            ).fetchall()
+            if deleted:
+                self.index_changes.notify("roles")
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        for row in deleted:
+            role_resolver.remove_member(role=row.name, username=username)
+
+        return True
+
+    def get_roles(self, username: str) -> List[str]:
+        """
+        Gets the roles the user is directly a member of.
+
+        :param username:
+        :return: list of role names
+        """
+
+        try:
+            rows = (
+                self.session.query(Role.name)
+                .join(RoleMember, RoleMember.role_id == Role.id)
+                .join(User, User.id == RoleMember.user_id)
+                .filter(User.username == username)
+                .order_by(Role.name)
+                .all()
+            )
+            return [row.name for row in rows]
+        except SQLAlchemyError:
+            self.session.rollback()
+            return []
+
+    def snapshot(
+        self,
+    ) -> Tuple[
+        List[Tuple[str, str]], List[Tuple[str, str, str]], List[Tuple[str, str]]
+    ]:
+        """
+        Returns every inheritance, role grant and membership, for loading the role resolver.
+
+        :return: (role, parent) pairs, (role, host, remote user) grants and (role, username) memberships
+        """
+
+        parent_role = aliased(Role)
+        parents = (
+            self.session.query(Role.name, parent_role.name.label("parent"))
+            .join(RoleParent, RoleParent.role_id == Role.id)
+            .join(parent_role, parent_role.id == RoleParent.parent_id)
+        )
+        grants = (
+            self.session.query(Role.name, RoleGrant.host, RoleGrant.remote_user)
+            .join(RoleGrant, RoleGrant.role_id == Role.id)
+            .yield_per(10000)
+        )
+        members = (
+            self.session.query(Role.name, User.username)
+            .join(RoleMember, RoleMember.role_id == Role.id)
+            .join(User, User.id == RoleMember.user_id)
+            .yield_per(10000)
+        )
+
+        return (
+            [(row.name, row.parent) for row in parents],
+            [(row.name, row.host, row.remote_user) for row in grants],
+            [(row.name, row.username) for row in members],
+        )
@@ -1,15 +1,35 @@
-from typing import Union
+import hashlib
+from datetime import datetime, timedelta
+from typing import List, Union
 
+from sqlalchemy.engine import RowProxy
 from sqlalchemy.exc import SQLAlchemyError
 
-from ssh_manager_backend.db import Session
+from ssh_manager_backend.app.services import principal_cache
+from ssh_manager_backend.db import Session, User
 from ssh_manager_backend.db.database import db_session
 
 
 class Sessions:
+    ttl = timedelta(hours=12)  # sliding lifetime of a session
+    refresh_interval = timedelta(
+        minutes=5
+    )  # minimum time between two refreshes of the expiry
+
     def __init__(self):
         self.session = db_session()
 
+    @staticmethod
+    def hash_token(access_token: str) -> str:
+        """
+        Returns the hash of the access token under which the session is looked up.
+
+        :param access_token:
+        :return: SHA256 hex digest
+        """
+
+        return hashlib.sha256(bytes(access_token, encoding="utf-8")).hexdigest()
+
     def exists(self, username: str) -> bool:
         """
         Checks whether a session exists.
@@ -23,20 +43,24 @@ class Sessions:
             is not None
         )
 
-    def create(self, username: str, access_token: str) -> bool:
+    def create(
+        self, username: str, access_token: str, expires_at: datetime = None
+    ) -> bool:
         """
         Creates a user session and returns access token upon success.
 
         :param username: The username of the user,
-        :param access_token:
+        :param access_token: Only its hash is stored
+        :param expires_at: Expiry of the session (UTC), defaults to the session ttl from now
         :return:
         """
 
         try:
             user_session = Session()
             user_session.username = username
-            user_session.access_token = access_token
+            user_session.token_hash = self.hash_token(access_token)
             user_session.active = True
+            user_session.expires_at = expires_at or datetime.utcnow() + self.ttl
             self.session.add(user_session)
             self.session.commit()
         except SQLAlchemyError:
@@ -47,24 +71,147 @@ class Sessions:
 
         return True
 
-    def activate_session(self, username: str) -> bool:
+    def replace_token(self, username: str, access_token: str) -> bool:
         """
-        Activates a user session.
+        Replaces the access token of the newest active session of the user, so that the previous token is no longer
+        valid. The other sessions of the user(e.g. of signed access tokens, whose inactive rows revoke them) are left
+        as they are, and the token hash stays unique.
+
         :param username: The username of the user,
-        :return:
+        :param access_token:
+        :return: False if there is no active session(e.g. it was swept or logged out) or on failure
         """
 
         try:
-            self.session.query(Session).filter(Session.username == username).update(
-                {"active": True}
+            session_id: Union[int, None] = (
+                self.session.query(Session.id)
+                .filter(Session.username == username, Session.active.is_(True))
+                .order_by(Session.id.desc())
+                .limit(1)
+                .with_for_update()
+                .scalar()
+            )
+            updated: int = (
+                self.session.query(Session)
+                .filter(Session.id == session_id)
+                .update(
+                    {
+                        "token_hash": self.hash_token(access_token),
+                        "expires_at": datetime.utcnow() + self.ttl,
+                    },
+                    synchronize_session=False,
+                )
             )
             self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+        finally:
+            principal_cache.invalidate_username(username=username)
 
-            return True
-        except AttributeError:
+        return updated > 0
+
+    def validate(self, access_token: str) -> Union[RowProxy, None]:
+        """
+        Looks up the session of the access token with a single query on the indexed token hash.
+
+        :param access_token:
+        :return: row of (session_id, user_id, username, admin, active, expires_at), None if the token is unknown
+        """
+
+        return (
+            self.session.query(
+                Session.id.label("session_id"),
+                User.id.label("user_id"),
+                User.username,
+                User.admin,
+                Session.active,
+                Session.expires_at,
+            )
+            .join(User, User.username == Session.username)
+            .filter(Session.token_hash == self.hash_token(access_token))
+            .first()
+        )
+
+    def refresh(self, session_id: int, expires_at: datetime) -> bool:
+        """
+        Slides the expiry of an active session forward. The expiry is written at most once per refresh interval, and
+        the update only applies if the expiry is still the one that was read, so concurrent requests of the same
+        session write it once.
+
+        :param session_id:
+        :param expires_at: The expiry returned by validate
+        :return: True if the expiry was moved
+        """
+
+        now: datetime = datetime.utcnow()
+        if expires_at is None or expires_at - self.ttl + self.refresh_interval > now:
             return False
 
-    def deactivate_session(self, username: str) -> bool:
+        try:
+            updated: int = (
+                self.session.query(Session)
+                .filter(Session.id == session_id, Session.expires_at == expires_at)
+                .update({"expires_at": now + self.ttl}, synchronize_session=False)
+            )
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        return updated > 0
+
+    def delete_expired(self, batch_size: int = 500) -> int:
+        """
+        Deletes one batch of the expired sessions, oldest first, and commits. Rows locked by another transaction(e.g.
+        a login replacing the token) are skipped, so that the sweeper never waits on the login path.
+
+        :param batch_size:
+        :return: number of deleted sessions
+        """
+
+        expired_ids = (
+            self.session.query(Session.id)
+            .filter(Session.expires_at < datetime.utcnow())
+            .order_by(Session.expires_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+
+        try:
+            deleted: int = (
+                self.session.query(Session)
+                .filter(Session.id.in_(expired_ids.subquery()))
+                .delete(synchronize_session=False)
+            )
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return 0
+
+        return deleted
+
+    def revoked_token_hashes(self) -> List[str]:
+        """
+        Returns the token hashes of the inactive sessions which have not expired yet, i.e. the signed access tokens
+        which have to be rejected although their signature is valid.
+
+        :return: list of token hashes
+        """
+
+        rows = (
+            self.session.query(Session.token_hash)
+            .filter(
+                Session.active.is_(False),
+                Session.token_hash.isnot(None),
+                Session.expires_at > datetime.utcnow(),
+            )
+            .all()
+        )
+
+        return [row.token_hash for row in rows]
+
+    def activate_session(self, username: str) -> bool:
         """
         Activates a user session.
         :param username: The username of the user,
@@ -73,29 +220,29 @@ class Sessions:
 
         try:
             self.session.query(Session).filter(Session.username == username).update(
-                {"active": False}
+                {"active": True}
             )
             self.session.commit()
+            principal_cache.invalidate_username(username=username)
+
             return True
         except AttributeError:
             return False
 
-    def user_access_token(self, username: str) -> Union[bool, str]:
+    def deactivate_session(self, username: str) -> bool:
         """
-        Returns access token of user.
-
+        Activates a user session.
         :param username: The username of the user,
-        :return: access token
+        :return:
         """
 
         try:
-            access_token = (
-                self.session.query(Session)
-                .filter(Session.username == username)
-                .first()
-                .access_token
+            self.session.query(Session).filter(Session.username == username).update(
+                {"active": False}
             )
-            return access_token
+            self.session.commit()
+            principal_cache.invalidate_username(username=username)
+            return True
         except AttributeError:
             return False
 
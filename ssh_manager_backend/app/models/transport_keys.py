@@ -0,0 +1,118 @@
+from typing import List
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from ssh_manager_backend.db import TransportKey
+from ssh_manager_backend.db.database import db_session
+
+# Key of the postgres advisory lock held while a worker generates a transport key.
+TRANSPORT_KEY_LOCK_ID = 7290417
+
+
+class TransportKeys:
+    def __init__(self):
+        self.session = db_session()
+
+    def create(
+        self, kind: str, key_id: str, material: bytes, generation_time: float
+    ) -> bool:
+        """
+        Stores a transport key.
+
+        :param kind:
+        :param key_id:
+        :param material:
+        :param generation_time:
+        :return: Boolean value indicating success/failure.
+        """
+
+        try:
+            key: TransportKey = TransportKey(
+                kind=kind,
+                key_id=key_id,
+                material=material,
+                generation_time=generation_time,
+            )
+
+            self.session.add(key)
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        return True
+
+    def get_keys(self, kind: str) -> List[TransportKey]:
+        """
+        Gets the transport keys of the given kind, oldest first.
+
+        :param kind:
+        :return: list of TransportKey objects
+        """
+
+        return (
+            self.session.query(TransportKey)
+            .filter(TransportKey.kind == kind)
+            .order_by(TransportKey.generation_time)
+            .all()
+        )
+
+    def publish(
+        self, kind: str, key_id: str, material: bytes, generation_time: float, keep: int
+    ) -> bool:
+        """
+        Stores a transport key and deletes all but the newest "keep" keys of its kind in a single transaction, so that
+        the advisory lock(see lock) is held until both are committed.
+
+        :param kind:
+        :param key_id:
+        :param material:
+        :param generation_time:
+        :param keep:
+        :return: Boolean value indicating success/failure.
+        """
+
+        try:
+            self.session.add(
+                TransportKey(
+                    kind=kind,
+                    key_id=key_id,
+                    material=material,
+                    generation_time=generation_time,
+                )
+            )
+            self.session.flush()
+
+            newest_ids = (
+                self.session.query(TransportKey.id)
+                .filter(TransportKey.kind == kind)
+                .order_by(TransportKey.generation_time.desc())
+                .limit(keep)
+                .subquery()
+            )
+            self.session.query(TransportKey).filter(
+                TransportKey.kind == kind, ~TransportKey.id.in_(newest_ids)
+            ).delete(synchronize_session=False)
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+
+        return True
+
+    def lock(self) -> None:
+        """
+        Acquires the advisory lock for generating a transport key. The lock is bound to the current transaction, so
+        it is released by the commit of publish or by unlock.
+        """
+
+        self.session.execute(
+            "SELECT pg_advisory_xact_lock(:lock_id)", {"lock_id": TRANSPORT_KEY_LOCK_ID}
+        )
+
+    def unlock(self) -> None:
+        """
+        Releases the advisory lock for generating a transport key by ending the transaction.
+        """
+
+        self.session.commit()
@@ -2,6 +2,7 @@ from typing import Union
 
 from sqlalchemy.exc import SQLAlchemyError
 
+from ssh_manager_backend.app.services import principal_cache
 from ssh_manager_backend.db import User
 from ssh_manager_backend.db.database import db_session
 
@@ -148,5 +149,31 @@ class Users:
         except SQLAlchemyError:
             self.session.rollback()
             return False
+        finally:
+            principal_cache.invalidate_username(username=username)
 
         return True
+
+    def set_admin(self, username: str, admin: bool) -> bool:
+        """
+        Grants or removes the admin rights of a user.
+
+        :param username:
+        :param admin:
+        :return: Boolean value indicating success/failure.
+        """
+
+        try:
+            updated: int = (
+                self.session.query(User)
+                .filter(User.username == username)
+                .update({"admin": admin})
+            )
+            self.session.commit()
+        except SQLAlchemyError:
+            self.session.rollback()
+            return False
+        finally:
+            principal_cache.invalidate_username(username=username)
+
+        return updated > 0
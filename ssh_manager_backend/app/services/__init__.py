@@ -1,4 +1,30 @@
 from ssh_manager_backend.app.services.aes import AES
+from ssh_manager_backend.app.services.change_listener import ChangeListener
+from ssh_manager_backend.app.services.crypto_executor import CryptoExecutor
+from ssh_manager_backend.app.services.dek_cache import DekCache
+from ssh_manager_backend.app.services.grant_coalescer import GrantCoalescer
+from ssh_manager_backend.app.services.grant_index import GrantIndex
+from ssh_manager_backend.app.services.host_index import HostIndex
+from ssh_manager_backend.app.services.principal_cache import PrincipalCache
+from ssh_manager_backend.app.services.revocation_filter import RevocationFilter
+from ssh_manager_backend.app.services.role_resolver import RoleResolver
 from ssh_manager_backend.app.services.rsa import RSA
+from ssh_manager_backend.app.services.session_keys import SessionKeyCache
+from ssh_manager_backend.app.services.signed_tokens import SignedTokens
+from ssh_manager_backend.app.services.ssh_certificates import SSHCertificateAuthority
+from ssh_manager_backend.app.services.x25519 import X25519
 
+change_listener = ChangeListener()
+crypto_executor = CryptoExecutor()
+dek_cache = DekCache()
+grant_coalescer = GrantCoalescer()
+grant_index = GrantIndex()
+host_index = HostIndex()
+principal_cache = PrincipalCache()
+revocations = RevocationFilter()
+role_resolver = RoleResolver()
 rsa = RSA()
+session_keys = SessionKeyCache()
+signed_tokens = SignedTokens()
+ssh_ca = SSHCertificateAuthority()
+x25519 = X25519()
@@ -0,0 +1,191 @@
+from typing import Dict, Iterable, List
+
+
+"""
+This module keeps the (user, host) access matrix as bitsets, for fleet-wide questions such as "hosts reachable by
+anyone in team A but not team B" or "users with access to both prod and staging".
+
+Every user and host gets a small integer id when first seen. The matrix is stored both ways: for each user, the set of
+its hosts as a Python int with bit "host id" set, and for each host, the set of its users as an int over the user ids.
+A union, intersection or difference of whole teams or host groups is then a few big integer operations, which run over
+64 ids per machine word instead of iterating over grant rows.
+
+The matrix is owned by the grant index(see grant_index), which keeps it in step with the grants it loads, adds and
+removes.
+"""
+
+
+def bit_count(bits: int) -> int:
+    """
+    Returns the number of set bits.
+    """
+
+    return bin(bits).count("1")
+
+
+def bit_positions(bits: int) -> List[int]:
+    """
+    Returns the positions of the set bits, in a single pass over the binary digits.
+    """
+
+    digits = bin(bits)[:1:-1]  # least significant digit first, without "0b"
+    return [position for position, digit in enumerate(digits) if digit == "1"]
+
+
+class AccessMatrix:
+    __slots__ = (
+        "_user_ids",
+        "_usernames",
+        "_host_ids",
+        "_hosts",
+        "_hosts_of_user",
+        "_users_of_host",
+    )
+
+    def __init__(self):
+        self._user_ids: Dict[str, int] = {}
+        self._usernames: List[str] = []
+        self._host_ids: Dict[str, int] = {}
+        self._hosts: List[str] = []
+        self._hosts_of_user: Dict[int, int] = {}  # user id -> bitset of host ids
+        self._users_of_host: Dict[int, int] = {}  # host id -> bitset of user ids
+
+    @staticmethod
+    def intern(name: str, ids: Dict[str, int], names: List[str]) -> int:
+        """
+        Returns the id of a user or host, assigning the next one on first sight.
+        """
+
+        identifier = ids.get(name)
+        if identifier is None:
+            identifier = len(names)
+            ids[name] = identifier
+            names.append(name)
+
+        return identifier
+
+    def set(self, username: str, host: str) -> None:
+        """
+        Marks the host as reachable by the user.
+
+        :param username:
+        :param host:
+        :return: None
+        """
+
+        user_id = self.intern(username, self._user_ids, self._usernames)
+        host_id = self.intern(host, self._host_ids, self._hosts)
+        self._hosts_of_user[user_id] = self._hosts_of_user.get(user_id, 0) | (
+            1 << host_id
+        )
+        self._users_of_host[host_id] = self._users_of_host.get(host_id, 0) | (
+            1 << user_id
+        )
+
+    def clear(self, username: str, host: str) -> None:
+        """
+        Marks the host as no longer reachable by the user.
+
+        :param username:
+        :param host:
+        :return: None
+        """
+
+        user_id = self._user_ids.get(username)
+        host_id = self._host_ids.get(host)
+        if user_id is None or host_id is None:
+            return
+
+        hosts = self._hosts_of_user.get(user_id, 0) & ~(1 << host_id)
+        if hosts:
+            self._hosts_of_user[user_id] = hosts
+        else:
+            self._hosts_of_user.pop(user_id, None)
+
+        users = self._users_of_host.get(host_id, 0) & ~(1 << user_id)
+        if users:
+            self._users_of_host[host_id] = users
+        else:
+            self._users_of_host.pop(host_id, None)
+
+    def hosts_of_any(self, usernames: Iterable[str]) -> int:
+        """
+        Returns the bitset of the hosts reachable by at least one of the users.
+
+        :param usernames:
+        :return: bitset of host ids
+        """
+
+        bits = 0
+        for username in usernames:
+            user_id = self._user_ids.get(username)
+            if user_id is not None:
+                bits |= self._hosts_of_user.get(user_id, 0)
+
+        return bits
+
+    def users_of_any(self, hosts: Iterable[str]) -> int:
+        """
+        Returns the bitset of the users who can reach at least one of the hosts.
+
+        :param hosts:
+        :return: bitset of user ids
+        """
+
+        bits = 0
+        for host in hosts:
+            host_id = self._host_ids.get(host)
+            if host_id is not None:
+                bits |= self._users_of_host.get(host_id, 0)
+
+        return bits
+
+    def hosts_reachable(
+        self, any_of: Iterable[str], none_of: Iterable[str] = ()
+    ) -> List[str]:
+        """
+        Returns the hosts reachable by anyone in "any_of" but by no one in "none_of".
+
+        :param any_of: usernames
+        :param none_of: usernames
+        :return: sorted list of hosts
+        """
+
+        bits = self.hosts_of_any(any_of) & ~self.hosts_of_any(none_of)
+        return sorted(self._hosts[host_id] for host_id in bit_positions(bits))
+
+    def users_reaching(
+        self, host_groups: List[Iterable[str]], excluding: Iterable[str] = ()
+    ) -> List[str]:
+        """
+        Returns the users who can reach at least one host of every group, and none of the excluded hosts.
+
+        :param host_groups: e.g. [prod hosts, staging hosts]
+        :param excluding: hosts
+        :return: sorted list of usernames
+        """
+
+        if not host_groups:
+            return []
+
+        bits = -1  # every user
+        for hosts in host_groups:
+            bits &= self.users_of_any(hosts)
+            if not bits:
+                return []
+
+        bits &= ~self.users_of_any(excluding)
+        return sorted(self._usernames[user_id] for user_id in bit_positions(bits))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the size of the matrix.
+        """
+
+        return {
+            "users": len(self._hosts_of_user),
+            "hosts": len(self._users_of_host),
+            "pairs": sum(
+                bit_count(hosts) for hosts in list(self._hosts_of_user.values())
+            ),
+        }
@@ -1,9 +1,15 @@
-from typing import Union
-
-from cryptography.exceptions import InvalidKey, InvalidSignature, UnsupportedAlgorithm
+import os
+from typing import Tuple, Union
+
+from cryptography.exceptions import (
+    InvalidKey,
+    InvalidSignature,
+    InvalidTag,
+    UnsupportedAlgorithm,
+)
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers import Cipher, aead, algorithms, modes
 
 
 """This module is a wrapper around the Cipher class of cryptography.hazmat.primitives.ciphers. It make the process of
@@ -62,3 +68,47 @@ class AES:
             return unpadded_plaintext
         except UnsupportedAlgorithm or InvalidKey or InvalidSignature:
             return False
+
+
+class AESGCM:
+    __noncelength__ = 12
+
+    def __init__(self, key: bytes):
+
+        self.aead = aead.AESGCM(key)
+
+    def encrypt(
+        self, plaintext: Union[str, bytes], associated_data: bytes = None
+    ) -> Tuple[bytes, bytes]:
+        """
+        This function encrypts the data with a freshly generated nonce and returns the nonce and the ciphertext(in
+        bytes). The authentication tag is appended to the ciphertext. No padding is needed as GCM is a stream mode.
+
+        :param plaintext: The data to be encrypted
+        :param associated_data: Data which is authenticated but not encrypted
+        :return: (nonce, ciphertext)
+        """
+
+        if not isinstance(plaintext, bytes):
+            plaintext = bytes(str(plaintext), encoding="utf-8")
+
+        nonce: bytes = os.urandom(self.__noncelength__)
+        return nonce, self.aead.encrypt(nonce, plaintext, associated_data)
+
+    def decrypt(
+        self, nonce: bytes, ciphertext: bytes, associated_data: bytes = None
+    ) -> Union[bool, bytes]:
+        """
+        This function decrypts and authenticates the data and returns plaintext(in bytes) in case of successful
+        decryption else it returns false.
+
+        :param nonce: The nonce used for encryption
+        :param ciphertext: The encrypted data along with the authentication tag
+        :param associated_data: Data which was authenticated along with the ciphertext
+        :return: plaintext
+        """
+
+        try:
+            return self.aead.decrypt(nonce, ciphertext, associated_data)
+        except InvalidTag:
+            return False
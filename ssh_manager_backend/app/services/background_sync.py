@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, List, TypeVar, Union
+
+
+"""
+This module provides the background sync shared by the in-memory indexes(grant_index, host_index, role_resolver) and
+the revocation filter. Each of them is reloaded from its source by a daemon thread every sync interval, while the
+models keep updating it incrementally.
+
+A change made while a sync is reading the source may be missing from what was read, so the changes are recorded for
+the duration of the read and applied again to the new state before it is swapped in. A failed sync is logged and
+counted; the previous state is kept and the sync is retried on the next interval.
+
+An index can also record the version of its source(see the change_listener service) read before the source itself, so
+that the models can tell whether it has every committed change, answer from the database while it does not and request
+an early sync.
+"""
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BackgroundSync(ABC):
+    sync_name = "sync"  # name of the thread, and of the state in the logs
+    min_sync_interval = 1.0  # (in seconds) between the syncs requested early
+
+    def __init__(self, sync_interval: float):
+        self.sync_interval = sync_interval  # (in seconds)
+        self.last_sync = 0
+        self.sync_failures = 0
+        self.loaded = False
+        self.version_source: Union[Callable[[], int], None] = None
+        self.version: Union[int, None] = None  # of the source, None when unknown
+        self._read_version: Union[int, None] = None
+        self._changes_during_sync: Union[List[tuple], None] = None
+        self._lock = threading.Lock()
+        self._stop_sync = threading.Event()
+        self._wake = threading.Event()
+        self._syncer: Union[threading.Thread, None] = None
+
+    @abstractmethod
+    def sync(self) -> None:
+        """
+        Reloads the state from the source.
+        """
+
+    def read_source(self, read: Callable[[], T]) -> T:
+        """
+        Reads the source, recording the changes made meanwhile(see record_change).
+
+        :param read: reads the whole source
+        :return: what was read
+        """
+
+        with self._lock:
+            self._changes_during_sync = []
+
+        try:
+            self._read_version = (
+                self.version_source() if self.version_source is not None else None
+            )
+            return read()
+        except Exception:
+            with self._lock:
+                self._changes_during_sync = None
+            raise
+
+    def record_change(self, *change) -> None:
+        """
+        Records a change if a sync is reading the source. The caller must hold the lock.
+        """
+
+        if self._changes_during_sync is not None:
+            self._changes_during_sync.append(change)
+
+    def changes_during_sync(self) -> List[tuple]:
+        """
+        Returns the changes recorded while the source was read and stops recording. The caller must hold the lock.
+        """
+
+        changes: List[tuple] = self._changes_during_sync or []
+        self._changes_during_sync = None
+        return changes
+
+    def mark_loaded(self) -> None:
+        """
+        Marks the state just swapped in as loaded, at the version read with the source. The caller must hold the lock.
+        """
+
+        self.loaded = True
+        self.last_sync = time.time()
+        self.version = self._read_version
+        self._read_version = None
+
+    def is_current(self, version: int) -> bool:
+        """
+        Checks whether the state has every change of the source up to the given version.
+        """
+
+        return self.loaded and self.version is not None and self.version >= version
+
+    def request_sync(self) -> None:
+        """
+        Wakes up the background sync thread before the end of the interval.
+        """
+
+        self._wake.set()
+
+    def try_sync(self) -> bool:
+        """
+        Syncs, logging a failure instead of raising it.
+
+        :return: True if the sync succeeded
+        """
+
+        try:
+            self.sync()
+        except Exception:
+            self.sync_failures += 1
+            logger.exception(
+                "The %s failed, the previous state is kept until the next one",
+                self.sync_name,
+            )
+            return False
+
+        return True
+
+    def start_sync(self) -> None:
+        """
+        Starts the background sync thread.
+
+        :returns: None
+        """
+
+        if self._syncer is not None and self._syncer.is_alive():
+            return
+
+        def run():
+            while not self._stop_sync.is_set():
+                started: float = time.monotonic()
+                self.try_sync()
+                self._stop_sync.wait(self.min_sync_interval)
+                self._wake.wait(
+                    max(self.sync_interval - (time.monotonic() - started), 0)
+                )
+                self._wake.clear()
+
+        self._stop_sync.clear()
+        self._syncer = threading.Thread(target=run, name=self.sync_name, daemon=True)
+        self._syncer.start()
+
+    def stop_sync(self) -> None:
+        """
+        Stops the background sync thread.
+        """
+
+        self._stop_sync.set()
+        self._wake.set()
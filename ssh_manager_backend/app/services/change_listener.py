@@ -0,0 +1,177 @@
+import logging
+import os
+import select
+import threading
+import uuid
+from typing import Callable, Dict, Union
+
+
+"""
+This module tells every worker about the changes to the sources of the in-memory indexes(grant_index, host_index,
+role_resolver) committed by the other workers, so that the models know without a query whether an index has every
+committed change.
+
+The models send a notification on the index_changes channel in the transaction of every change(see the index_changes
+model). Postgres delivers it when, and only if, the transaction commits, and sending it takes no row lock. The listener
+of each worker counts the notifications of every source on a dedicated connection, as the generation of the source. An
+index records the generation of its source before reading the source(see background_sync), so it is current as long
+as no change of another worker was committed since. The changes of a worker are applied to its own indexes directly,
+so the notifications it sent itself are not counted.
+
+While the listener is disconnected there is no generation and the models answer from the database. A reconnection
+counts as a change of every source, as notifications may have been missed meanwhile.
+"""
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "index_changes"
+
+
+class ChangeListener:
+    sources = ("grants", "hosts", "roles")
+
+    def __init__(
+        self,
+        connect: Callable[[], any] = None,
+        poll_interval: float = 5.0,
+        reconnect_interval: float = 1.0,
+    ):
+        self.connect = connect  # opens a dedicated psycopg2 connection(set in app.py)
+        self.poll_interval = poll_interval  # (in seconds) between idle checks
+        self.reconnect_interval = reconnect_interval  # (in seconds)
+        self.connected = False
+        self.received = 0
+        self.failures = 0
+        self._generations: Dict[str, int] = {source: 0 for source in self.sources}
+        self._origin: Union[str, None] = None
+        self._origin_pid: Union[int, None] = None
+        self._lock = threading.Lock()
+        self._stop_listening = threading.Event()
+        self._listener: Union[threading.Thread, None] = None
+
+    @property
+    def origin(self) -> str:
+        """
+        Returns the id of this worker in its notifications, a new one in a forked worker.
+        """
+
+        if self._origin_pid != os.getpid():
+            self._origin = f"{os.getpid()}-{uuid.uuid4().hex}"
+            self._origin_pid = os.getpid()
+
+        return self._origin
+
+    def payload(self, source: str) -> str:
+        """
+        Returns the payload of the notification of a change to a source.
+
+        :param source: "grants", "hosts" or "roles"
+        :return: payload
+        """
+
+        return f"{source}:{self.origin}"
+
+    def receive(self, payload: str) -> None:
+        """
+        Counts a notification, unless this worker sent it.
+
+        :param payload: as returned by payload()
+        :return: None
+        """
+
+        source, _, origin = payload.partition(":")
+        if origin == self.origin or source not in self._generations:
+            return
+
+        with self._lock:
+            self._generations[source] += 1
+            self.received += 1
+
+    def version(self, source: str) -> Union[int, None]:
+        """
+        Returns the generation of a source, for the sync of its index.
+
+        :param source: "grants", "hosts" or "roles"
+        :return: generation, None while disconnected
+        """
+
+        with self._lock:
+            return self._generations[source] if self.connected else None
+
+    def listen(self) -> None:
+        """
+        Listens on a new connection until it fails or the listener is stopped.
+
+        :returns: None
+        """
+
+        connection = self.connect()
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+
+            with self._lock:
+                for source in self._generations:
+                    self._generations[source] += 1
+                self.connected = True
+
+            while not self._stop_listening.is_set():
+                readable, _, _ = select.select([connection], [], [], self.poll_interval)
+                if not readable:
+                    # Fails when the connection was lost while idle.
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+
+                connection.poll()
+                while connection.notifies:
+                    self.receive(connection.notifies.pop(0).payload)
+        finally:
+            with self._lock:
+                self.connected = False
+            connection.close()
+
+    def start_listening(self) -> None:
+        """
+        Starts the listener thread, which reconnects after a failure.
+
+        :returns: None
+        """
+
+        if self._listener is not None and self._listener.is_alive():
+            return
+
+        def run():
+            while not self._stop_listening.is_set():
+                try:
+                    self.listen()
+                except Exception:
+                    self.failures += 1
+                    logger.exception(
+                        "The change listener failed, the indexes are not used until it reconnects"
+                    )
+                self._stop_listening.wait(self.reconnect_interval)
+
+        self._stop_listening.clear()
+        self._listener = threading.Thread(
+            target=run, name="change-listener", daemon=True
+        )
+        self._listener.start()
+
+    def stop_listening(self) -> None:
+        """
+        Stops the listener thread, within the poll interval.
+        """
+
+        self._stop_listening.set()
+
+    def stats(self) -> Dict[str, Union[bool, int]]:
+        """
+        Returns the counters of the listener.
+        """
+
+        return {
+            "connected": self.connected,
+            "received": self.received,
+            "failures": self.failures,
+        }
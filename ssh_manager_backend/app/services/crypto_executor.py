@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Union
+
+from werkzeug.exceptions import ServiceUnavailable
+
+
+"""
+This module runs the CPU heavy cryptographic work(PBKDF2, RSA decryption) on a pool sized to the number of cores
+instead of on the request threads, so that a burst of logins queues up instead of creating threads which fight over
+the cores.
+
+A thread pool is used because cryptography releases the GIL while OpenSSL does the work, so the workers run in
+parallel without the cost of sending keys and passwords to other processes. The number of requests waiting for a
+worker is bounded; once the queue is full the request is rejected with 503 instead of adding to the latency of every
+other request.
+"""
+
+
+class CryptoExecutor:
+    def __init__(
+        self, max_workers: int = None, max_queue: int = None, timeout: float = 5
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue if max_queue is not None else 4 * self.max_workers
+        self.timeout = timeout  # (in seconds) maximum time to wait for a queue slot
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="crypto"
+        )
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self.submitted = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_wait = 0.0
+
+    def run(self, function: Callable, *args, **kwargs):
+        """
+        Runs the function on the pool and returns its result. Calls made from a worker of the pool run inline.
+
+        :param function: The function to be run
+        :return: return value of the function
+        :raises ServiceUnavailable: If the queue stays full for longer than the timeout
+        """
+
+        if getattr(self._local, "in_worker", False):
+            return function(*args, **kwargs)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceUnavailable(description="Server is busy, try again later")
+
+        enqueued_at: float = time.monotonic()
+        with self._lock:
+            self.submitted += 1
+
+        def task():
+            wait: float = time.monotonic() - enqueued_at
+            with self._lock:
+                self.running += 1
+                self._waits.append(wait)
+                self.max_wait = max(self.max_wait, wait)
+
+            self._local.in_worker = True
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._local.in_worker = False
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        try:
+            return self._pool.submit(task).result()
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Returns the queue depth and the wait time metrics. The wait times are in milliseconds and the percentiles are
+        computed over the last 1000 tasks.
+        """
+
+        with self._lock:
+            waits = sorted(self._waits)
+            queue_depth: int = self.submitted - self.completed - self.running
+
+            def percentile(fraction: float) -> float:
+                if not waits:
+                    return 0.0
+                return waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000
+
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": queue_depth,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_p50_ms": percentile(0.5),
+                "wait_p99_ms": percentile(0.99),
+                "wait_max_ms": self.max_wait * 1000,
+            }
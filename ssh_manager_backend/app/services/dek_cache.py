@@ -0,0 +1,166 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+
+
+"""
+This module provides an opt-in, short lived cache of unlocked deks(see secrets module) so that a burst of requests from
+the same user pays for the password based key derivation only once.
+
+Every entry is stored against the user id together with a verifier, which is a keyed hash of the password and the
+wrapped dek. A request with a different password, or made after the dek was re-wrapped by a password change, does not
+match the verifier and misses the cache. The deks are kept in bytearrays which are zeroed when the entry is evicted,
+expires or is invalidated.
+"""
+
+
+class DekCache:
+    def __init__(self, enabled: bool = False, ttl: int = 60, max_entries: int = 256):
+        self.enabled = enabled
+        self.ttl = ttl  # (in seconds)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._secret = os.urandom(32)
+        self._entries: "OrderedDict[int, Tuple[bytes, bytearray, float]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def verifier(self, password: str or bytes, wrapped_dek: bytes) -> bytes:
+        """
+        Returns the verifier of the password and the wrapped dek.
+
+        :param password: The password of the user
+        :param wrapped_dek: The encrypted dek of the user
+        :return: verifier
+        """
+
+        if not isinstance(password, bytes):
+            password = bytes(password, encoding="utf-8")
+
+        return hmac.new(
+            self._secret,
+            hashlib.sha256(password).digest() + wrapped_dek,
+            digestmod=hashlib.sha256,
+        ).digest()
+
+    @staticmethod
+    def zero(dek: bytearray) -> None:
+        """
+        Overwrites the dek in place.
+
+        :param dek:
+        :return: None
+        """
+
+        dek[:] = bytes(len(dek))
+
+    def get(
+        self, user_id: int, password: str or bytes, wrapped_dek: bytes
+    ) -> Union[bytes, None]:
+        """
+        Returns the cached dek of the user, or None if there is no valid entry for the password.
+
+        :param user_id:
+        :param password: The password of the user
+        :param wrapped_dek: The encrypted dek of the user
+        :return: dek
+        """
+
+        if not self.enabled:
+            return None
+
+        verifier: bytes = self.verifier(password=password, wrapped_dek=wrapped_dek)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry_verifier, dek, expires_at = entry
+            if expires_at < time.time():
+                self.zero(self._entries.pop(user_id)[1])
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            if not hmac.compare_digest(entry_verifier, verifier):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return bytes(dek)
+
+    def put(
+        self, user_id: int, password: str or bytes, wrapped_dek: bytes, dek: bytes
+    ) -> None:
+        """
+        Caches the unlocked dek of the user.
+
+        :param user_id:
+        :param password: The password of the user
+        :param wrapped_dek: The encrypted dek of the user
+        :param dek: The unlocked dek
+        :return: None
+        """
+
+        if not self.enabled:
+            return
+
+        verifier: bytes = self.verifier(password=password, wrapped_dek=wrapped_dek)
+
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous is not None:
+                self.zero(previous[1])
+
+            self._entries[user_id] = (verifier, bytearray(dek), time.time() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self.zero(self._entries.popitem(last=False)[1][1])
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Removes and zeroes the cached dek of the user. Called on logout and when the password changes.
+
+        :param user_id:
+        :return: None
+        """
+
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self.zero(entry[1])
+
+    def clear(self) -> None:
+        """
+        Removes and zeroes all the cached deks.
+        """
+
+        with self._lock:
+            for _, dek, _ in self._entries.values():
+                self.zero(dek)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Union[bool, int]]:
+        """
+        Returns the counters of the cache.
+        """
+
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
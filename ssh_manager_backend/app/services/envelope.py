@@ -0,0 +1,180 @@
+import base64
+import json
+from typing import Dict, Tuple, Union
+
+from werkzeug.exceptions import BadRequest, Unauthorized
+
+from ssh_manager_backend.app.services import (
+    AES,
+    crypto_executor,
+    rsa,
+    session_keys,
+    x25519,
+)
+from ssh_manager_backend.app.services.aes import AESGCM
+
+
+"""
+This module opens encrypted request bodies and seals the response bodies.
+
+Two envelope versions are understood:
+
+v1: {"key": RSA(key), "iv": RSA(iv), "data": AES-CBC(data)}. The response is encrypted with the same key and iv.
+v2: {"version": 2, "key": RSA(key), "nonce": nonce, "data": AES-GCM(data)}. Only one RSA decryption is needed per
+    request and every message, in either direction, is encrypted with a fresh nonce.
+
+A v2 envelope may use the X25519 transport instead of RSA by sending {"ephemeral_public_key": public key} in place of
+"key". The request key is then derived with ECDH and HKDF, see the x25519 service.
+
+Both RSA envelopes may carry the "key_id" returned by /get_rsa_key so that a request encrypted with the previous key
+still succeeds after a rotation. The requests without a "version" are treated as v1. For v2 the iv returned by
+open_request is None, which tells seal_response to use AES-GCM.
+
+Only a v2 response carries a "session_key_id", which a later v2 request may send in place of "key"(see the
+session_keys service). A v1 session is never resumed, as it would reuse the same key and iv for every message.
+"""
+
+REQUEST_AAD = b"ssh-key-manager request"
+RESPONSE_AAD = b"ssh-key-manager response"
+
+
+def b64decode(value: str) -> bytes:
+    """
+    Decodes a base64 encoded field of the request body.
+
+    :param value:
+    :return: decoded bytes
+    """
+
+    return base64.decodebytes(bytes(value, encoding="utf-8"))
+
+
+def b64encode(value: bytes) -> str:
+    """
+    Encodes bytes into a base64 string for the response body.
+
+    :param value:
+    :return: encoded string
+    """
+
+    return base64.encodebytes(value).decode()
+
+
+def envelope_version(body: Dict[str, any]) -> int:
+    """
+    Returns the envelope version of the request body.
+
+    :param body: request body
+    :return: version
+    """
+
+    try:
+        version = int(body.get("version", 1))
+    except (TypeError, ValueError):
+        raise BadRequest(description="Invalid envelope version")
+
+    if version not in (1, 2):
+        raise BadRequest(description="Unsupported envelope version")
+
+    return version
+
+
+def unwrap_request_key(body: Dict[str, any]) -> Tuple[bytes, Union[bytes, None]]:
+    """
+    Returns the key and iv of the request, either from the session key cache, by deriving it using the X25519 key or
+    by decrypting them using the RSA private key. The iv is None for v2 envelopes.
+
+    :param body: request body
+    :return: (key, iv)
+    """
+
+    version: int = envelope_version(body=body)
+
+    session_key_id: str = body.get("session_key_id")
+    if session_key_id is not None and session_keys.enabled:
+        if version != 2:
+            raise BadRequest(description="Session keys require a v2 envelope")
+
+        key: Union[bytes, None] = session_keys.get(key_id=session_key_id)
+        if key is not None:
+            return key, None
+
+        if "key" not in body and "ephemeral_public_key" not in body:
+            raise Unauthorized(description="Session key expired")
+
+    if "ephemeral_public_key" in body:
+        if version != 2:
+            raise BadRequest(description="X25519 transport requires a v2 envelope")
+
+        x25519.ensure_key_pair()
+        try:
+            return x25519.derive_key(b64decode(body["ephemeral_public_key"])), None
+        except ValueError:
+            raise BadRequest(description="Invalid ephemeral public key")
+
+    key_id: str = body.get("key_id")
+    try:
+        key: bytes = crypto_executor.run(
+            rsa.decrypt_cipher, b64decode(body["key"]), key_id=key_id
+        )
+        if version == 2:
+            return key, None
+
+        iv: bytes = crypto_executor.run(
+            rsa.decrypt_cipher, b64decode(body["iv"]), key_id=key_id
+        )
+    except KeyError:
+        raise Unauthorized(description="Transport key expired")
+
+    return key, iv
+
+
+def open_request(
+    body: Dict[str, any]
+) -> Tuple[Dict[str, any], bytes, Union[bytes, None]]:
+    """
+    Decrypts the request body.
+
+    :param body: request body
+    :return: (data, key, iv)
+    """
+
+    key, iv = unwrap_request_key(body=body)
+    try:
+        encrypted_data: bytes = b64decode(body["data"])
+        nonce: Union[bytes, None] = b64decode(body["nonce"]) if iv is None else None
+    except KeyError as error:
+        raise BadRequest(description=f"Missing envelope field {error}")
+
+    if iv is None:
+        data: Union[bool, bytes] = AESGCM(key=key).decrypt(
+            nonce=nonce, ciphertext=encrypted_data, associated_data=REQUEST_AAD
+        )
+    else:
+        data = AES(key=key, iv=iv).decrypt(encrypted_data)
+
+    if data is False:
+        raise BadRequest(description="Request could not be decrypted")
+
+    return json.loads(data.decode("utf-8")), key, iv
+
+
+def seal_response(
+    data: Dict[str, any], key: bytes, iv: Union[bytes, None]
+) -> Dict[str, str]:
+    """
+    Encrypts the response data with the key of the request.
+
+    :param data: Data to be encrypted
+    :param key: Key of the request
+    :param iv: iv of the request, None for v2 envelopes
+    :return: encrypted fields of the response body
+    """
+
+    if iv is None:
+        nonce, ciphertext = AESGCM(key=key).encrypt(
+            plaintext=json.dumps(data), associated_data=RESPONSE_AAD
+        )
+        return {"version": 2, "data": b64encode(ciphertext), "nonce": b64encode(nonce)}
+
+    return {"data": b64encode(AES(key=key, iv=iv).encrypt(json.dumps(data)))}
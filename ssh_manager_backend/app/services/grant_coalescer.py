@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+
+"""
+This module coalesces grant and revoke operations into batches, so that granting access to a fleet is one multi-host
+playbook run instead of one run per host.
+
+Operations are grouped by (operation, admin SSH key, remote user), which is what a single run can share. A group is
+dispatched when its oldest operation has waited for the window, or as soon as it reaches the maximum batch size. The
+dispatch(set in app.py) enqueues one task per batch.
+"""
+
+logger = logging.getLogger(__name__)
+
+# (operation, admin SSH key, remote user)
+BatchKey = Tuple[str, bytes, str]
+
+
+class Batch:
+    __slots__ = ("created", "items")
+
+    def __init__(self):
+        self.created = time.monotonic()
+        self.items: List[Tuple[str, str]] = []  # (username, host)
+
+
+class GrantCoalescer:
+    operations = ("grant", "revoke")
+
+    def __init__(
+        self,
+        dispatch: Callable[[str, bytes, str, List[Tuple[str, str]]], None] = None,
+        window: float = 1.0,
+        max_batch_size: int = 500,
+    ):
+        self.dispatch = dispatch  # enqueues a batch as (operation, ssh key, remote user, [(username, host)])
+        self.window = window  # (in seconds)
+        self.max_batch_size = max_batch_size
+        self.submitted = 0
+        self.batches = 0
+        self.failures = 0
+        self._pending: Dict[BatchKey, Batch] = {}
+        self._lock = threading.Lock()
+        self._stop_flush = threading.Event()
+        self._flusher: Union[threading.Thread, None] = None
+
+    def submit(
+        self,
+        operation: str,
+        ssh_key: bytes,
+        remote_user: str,
+        username: str,
+        host: str,
+    ) -> None:
+        """
+        Adds an operation to the pending batch of its admin key and remote user.
+
+        :param operation: "grant" or "revoke"
+        :param ssh_key: The admin's SSH key
+        :param remote_user:
+        :param username:
+        :param host:
+        :return: None
+        :raises ValueError: If the operation is unknown
+        """
+
+        if operation not in self.operations:
+            raise ValueError(f"Unknown operation {operation}")
+
+        key: BatchKey = (operation, ssh_key, remote_user)
+        full: Union[Batch, None] = None
+
+        with self._lock:
+            batch: Batch = self._pending.setdefault(key, Batch())
+            batch.items.append((username, host))
+            self.submitted += 1
+            if len(batch.items) >= self.max_batch_size:
+                full = self._pending.pop(key)
+
+        if full is not None:
+            self._dispatch(key, full)
+
+    def _dispatch(self, key: BatchKey, batch: Batch) -> None:
+        operation, ssh_key, remote_user = key
+        try:
+            self.dispatch(operation, ssh_key, remote_user, batch.items)
+            self.batches += 1
+        except Exception:
+            self.failures += 1
+            logger.exception(
+                "Could not dispatch a %s batch of %d hosts", operation, len(batch.items)
+            )
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Dispatches the batches which have waited for the window, or all of them.
+
+        :param force: Dispatch every pending batch
+        :return: number of dispatched batches
+        """
+
+        now: float = time.monotonic()
+        with self._lock:
+            due: List[BatchKey] = [
+                key
+                for key, batch in self._pending.items()
+                if force or now - batch.created >= self.window
+            ]
+            batches: List[Tuple[BatchKey, Batch]] = [
+                (key, self._pending.pop(key)) for key in due
+            ]
+
+        for key, batch in batches:
+            self._dispatch(key, batch)
+
+        return len(batches)
+
+    def start_flush(self) -> None:
+        """
+        Starts the background thread dispatching the batches at the end of their window.
+
+        :returns: None
+        """
+
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+
+        def run():
+            while not self._stop_flush.wait(self.window / 4):
+                self.flush()
+            self.flush(force=True)
+
+        self._stop_flush.clear()
+        self._flusher = threading.Thread(
+            target=run, name="grant-coalescer-flush", daemon=True
+        )
+        self._flusher.start()
+
+    def stop_flush(self) -> None:
+        """
+        Stops the background thread, after it dispatches the pending batches.
+        """
+
+        self._stop_flush.set()
+
+    def close(self, timeout: float = 5.0) -> int:
+        """
+        Stops the background thread and dispatches every pending batch, so that none is lost when the worker exits.
+
+        :param timeout: (in seconds) to wait for the background thread
+        :return: number of batches dispatched after the thread stopped
+        """
+
+        self.stop_flush()
+        if self._flusher is not None:
+            self._flusher.join(timeout)
+
+        return self.flush(force=True)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the counters of the coalescer.
+        """
+
+        return {
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "failures": self.failures,
+            "pending": sum(len(batch.items) for batch in list(self._pending.values())),
+        }
@@ -0,0 +1,349 @@
+import ipaddress
+import re
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from ssh_manager_backend.app.services.access_matrix import AccessMatrix
+from ssh_manager_backend.app.services.background_sync import BackgroundSync
+
+"""
+This module keeps an in-memory index of the access grants(see the access_control model), so that access checks do not
+query the database and grants to whole networks(CIDR blocks) can be checked without expanding them into hosts.
+
+Grants to single addresses and hostnames are kept in a set per user. Grants to networks are kept in a binary prefix
+tree per user and address family, so that checking an address walks at most one node per bit of the address(32 for
+IPv4, 128 for IPv6), however many networks the user holds.
+
+The index is loaded from the source(all the grants) in the background and updated incrementally by the model when it
+grants or revokes access. The changes made by other workers are in the index after its next sync; until then the
+model answers from the database(see the change_listener service). Revocations made while a sync is reading the source
+are applied again to the new index, so that a revocation is never lost by a concurrent reload.
+
+The index also keeps the grants as a user by host bitset matrix(see access_matrix) for fleet-wide set operations, in
+which a network is a single host.
+"""
+
+
+# A hostname as in RFC 1123: dot separated labels of letters, digits and inner hyphens
+HOSTNAME = re.compile(
+    r"^(?=.{1,253}$)[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?"
+    r"(\.[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?)*$"
+)
+
+
+def is_valid_host(host: str) -> bool:
+    """
+    Checks whether a host is an ip address, a network in CIDR notation or a hostname, which is all that may reach the
+    inventory of the hosts.
+
+    :param host:
+    :return: boolean value
+    """
+
+    try:
+        ipaddress.ip_network(host, strict=False)
+        return True
+    except ValueError:
+        return HOSTNAME.match(host) is not None
+
+
+def normalize_host(host: str) -> str:
+    """
+    Returns the canonical form of a host: a single address without prefix length, a network as "address/prefix" with
+    the host bits cleared, and anything else(a hostname) as it is.
+
+    :param host:
+    :return: normalized host
+    """
+
+    try:
+        network = ipaddress.ip_network(host.strip(), strict=False)
+    except ValueError:
+        return host.strip()
+
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+
+    return str(network)
+
+
+class PrefixTrie:
+    __slots__ = ("root", "size")
+
+    def __init__(self):
+        # Each node is [child for bit 0, child for bit 1, number of networks ending at the node].
+        self.root: list = [None, None, 0]
+        self.size = 0
+
+    @staticmethod
+    def bits(value: int, length: int, max_length: int) -> Iterable[int]:
+        """
+        Returns the first "length" bits of an address, most significant first.
+        """
+
+        return ((value >> (max_length - 1 - i)) & 1 for i in range(length))
+
+    def insert(
+        self, network: Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+    ) -> None:
+        """
+        Adds a network.
+
+        :param network:
+        :return: None
+        """
+
+        node = self.root
+        for bit in self.bits(
+            int(network.network_address), network.prefixlen, network.max_prefixlen
+        ):
+            if node[bit] is None:
+                node[bit] = [None, None, 0]
+            node = node[bit]
+
+        node[2] += 1
+        self.size += 1
+
+    def remove(
+        self, network: Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+    ) -> bool:
+        """
+        Removes a network and prunes the nodes which no longer lead to any network.
+
+        :param network:
+        :return: True if the network was in the trie
+        """
+
+        path = [self.root]
+        for bit in self.bits(
+            int(network.network_address), network.prefixlen, network.max_prefixlen
+        ):
+            node = path[-1][bit]
+            if node is None:
+                return False
+            path.append(node)
+
+        if path[-1][2] == 0:
+            return False
+
+        path[-1][2] -= 1
+        self.size -= 1
+
+        for depth in range(len(path) - 1, 0, -1):
+            node = path[depth]
+            if node[0] is not None or node[1] is not None or node[2]:
+                break
+            parent = path[depth - 1]
+            parent[0 if parent[0] is node else 1] = None
+
+        return True
+
+    def contains(
+        self, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+    ) -> bool:
+        """
+        Checks whether any network of the trie contains the address.
+
+        :param address:
+        :return: boolean value
+        """
+
+        node = self.root
+        if node[2]:
+            return True
+
+        for bit in self.bits(
+            int(address), address.max_prefixlen, address.max_prefixlen
+        ):
+            node = node[bit]
+            if node is None:
+                return False
+            if node[2]:
+                return True
+
+        return False
+
+
+class UserGrants:
+    __slots__ = ("hosts", "networks")
+
+    def __init__(self):
+        self.hosts: Counter = (
+            Counter()
+        )  # number of grants(one per remote user) of each host
+        self.networks: Dict[int, PrefixTrie] = {}  # prefix tree of each IP version
+
+    def add(self, host: str) -> None:
+        """
+        Adds a grant of a normalized host.
+        """
+
+        self.hosts[host] += 1
+        if "/" in host:
+            network = ipaddress.ip_network(host)
+            self.networks.setdefault(network.version, PrefixTrie()).insert(network)
+
+    def remove(self, host: str) -> None:
+        """
+        Removes a grant of a normalized host.
+        """
+
+        if self.hosts[host] <= 0:
+            self.hosts.pop(host, None)
+            return
+
+        self.hosts[host] -= 1
+        if not self.hosts[host]:
+            del self.hosts[host]
+
+        if "/" in host:
+            network = ipaddress.ip_network(host)
+            trie: Union[PrefixTrie, None] = self.networks.get(network.version)
+            if trie is not None:
+                trie.remove(network)
+
+    def has_access(self, host: str) -> bool:
+        """
+        Checks whether the host is granted, either itself or through a network containing it.
+        """
+
+        if host in self.hosts:
+            return True
+
+        if not self.networks:
+            return False
+
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+
+        trie: Union[PrefixTrie, None] = self.networks.get(address.version)
+        return trie is not None and trie.contains(address)
+
+
+class GrantIndex(BackgroundSync):
+    sync_name = "grant-index-sync"
+
+    def __init__(
+        self,
+        source: Callable[[], Iterable[Tuple[str, str]]] = None,
+        sync_interval: int = 300,
+    ):
+        super().__init__(sync_interval=sync_interval)
+        self.source = source  # returns the (username, normalized host) of every grant
+        self.checks = 0
+        self._users: Dict[str, UserGrants] = {}
+        self.matrix = AccessMatrix()
+
+    def load(self, grants: Iterable[Tuple[str, str]]) -> None:
+        """
+        Replaces the index with the given grants. The index is built aside and swapped in, so the readers never wait.
+
+        :param grants: (username, normalized host) of every grant
+        :return: None
+        """
+
+        users: Dict[str, UserGrants] = {}
+        matrix = AccessMatrix()
+        for username, host in grants:
+            users.setdefault(username, UserGrants()).add(host)
+            matrix.set(username, host)
+
+        with self._lock:
+            for username, hosts in self.changes_during_sync():
+                if username in users:
+                    self._remove(users[username], matrix, username, hosts)
+
+            self._users = users
+            self.matrix = matrix
+            self.mark_loaded()
+
+    def add(self, username: str, hosts: List[str]) -> None:
+        """
+        Adds newly stored grants of the user.
+
+        :param username:
+        :param hosts: normalized hosts, once per stored grant
+        :return: None
+        """
+
+        with self._lock:
+            user_grants: UserGrants = self._users.setdefault(username, UserGrants())
+            for host in hosts:
+                user_grants.add(host)
+                self.matrix.set(username, host)
+
+    def remove(self, username: str, hosts: List[str]) -> None:
+        """
+        Removes deleted grants of the user.
+
+        :param username:
+        :param hosts: normalized hosts, once per deleted grant
+        :return: None
+        """
+
+        with self._lock:
+            self.record_change(username, hosts)
+
+            user_grants: Union[UserGrants, None] = self._users.get(username)
+            if user_grants is None:
+                return
+
+            self._remove(user_grants, self.matrix, username, hosts)
+
+            if not user_grants.hosts:
+                del self._users[username]
+
+    @staticmethod
+    def _remove(
+        user_grants: UserGrants, matrix: AccessMatrix, username: str, hosts: List[str]
+    ) -> None:
+        """
+        Removes grants of a user, clearing a host in the matrix once its last grant is removed.
+        """
+
+        for host in hosts:
+            user_grants.remove(host)
+            if host not in user_grants.hosts:
+                matrix.clear(username, host)
+
+    def has_access(self, username: str, host: str) -> bool:
+        """
+        Checks whether the user has access to the host.
+
+        :param username:
+        :param host:
+        :return: boolean value
+        """
+
+        self.checks += 1
+        user_grants: Union[UserGrants, None] = self._users.get(username)
+        return user_grants is not None and user_grants.has_access(normalize_host(host))
+
+    def sync(self) -> None:
+        """
+        Reloads the index from the source.
+
+        :returns: None
+        """
+
+        if self.source is None:
+            return
+
+        self.load(self.read_source(lambda: list(self.source())))
+
+    def stats(self) -> Dict[str, Union[bool, int, float]]:
+        """
+        Returns the counters of the index.
+        """
+
+        users = self._users
+        return {
+            "loaded": self.loaded,
+            "users": len(users),
+            "matrix": self.matrix.stats(),
+            "checks": self.checks,
+            "last_sync": self.last_sync,
+            "sync_failures": self.sync_failures,
+        }
@@ -0,0 +1,299 @@
+import re
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+
+from ssh_manager_backend.app.services.background_sync import BackgroundSync
+
+"""
+This module keeps an in-memory index of the host registry(see the hosts model) and of the group grants, so that a
+grant to a group of hosts, such as "env=prod,role=db", is stored as one row and resolved when access is checked.
+
+Every label of every host(the zone is the "zone" label) is indexed as label -> set of hosts. A group grant matches a
+host if the host is in the set of every label of the selector, so a check costs one set lookup per label of each of
+the user's selectors, however large the groups are. Registering a host or changing its labels only moves the host
+between the sets of the labels which changed.
+
+The index is loaded from the sources in the background and updated incrementally by the models. Changes made while a
+sync is reading the sources are applied again to the new index, except for new group grants which are picked up by
+the next sync.
+"""
+
+Label = Tuple[str, str]
+
+# The keys and values of the labels, which name the CA key files of the group grants on the hosts
+LABEL = re.compile(r"^[A-Za-z0-9_.-]{1,63}$")
+
+
+def parse_selector(selector: Union[str, Dict[str, str]]) -> Dict[str, str]:
+    """
+    Parses a label selector given as "key=value, key=value" or as a dictionary.
+
+    :param selector:
+    :return: labels of the selector
+    :raises ValueError: If the selector is empty or malformed
+    """
+
+    if isinstance(selector, dict):
+        labels = {
+            str(key).strip(): str(value).strip() for key, value in selector.items()
+        }
+    else:
+        labels = {}
+        for part in str(selector).split(","):
+            key, separator, value = part.partition("=")
+            if not separator:
+                raise ValueError(f"Invalid label selector {selector}")
+            labels[key.strip()] = value.strip()
+
+    if not labels or not all(labels) or not all(labels.values()):
+        raise ValueError(f"Invalid label selector {selector}")
+
+    return labels
+
+
+def canonical_selector(selector: Union[str, Dict[str, str]]) -> str:
+    """
+    Returns the canonical form of a label selector, under which it is stored. Its keys and values must be made of
+    letters, digits, "_", "." and "-", as the selector names the CA key file of its group grant on the hosts.
+
+    :param selector:
+    :return: "key=value" pairs sorted by key and joined with commas
+    :raises ValueError: If the selector is malformed
+    """
+
+    labels: Dict[str, str] = parse_selector(selector)
+    if not all(
+        LABEL.match(key) and LABEL.match(value) for key, value in labels.items()
+    ):
+        raise ValueError(f"Invalid label selector {selector}")
+
+    return ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+
+
+def host_labels(labels: Dict[str, str], zone: Union[str, None]) -> Dict[str, str]:
+    """
+    Returns the labels of a host, including its zone.
+    """
+
+    labels = dict(labels or {})
+    if zone:
+        labels["zone"] = zone
+
+    return labels
+
+
+class HostIndex(BackgroundSync):
+    sync_name = "host-index-sync"
+
+    def __init__(
+        self,
+        hosts_source: Callable[[], Iterable[Tuple[str, Dict[str, str]]]] = None,
+        grants_source: Callable[[], Iterable[Tuple[str, str]]] = None,
+        sync_interval: int = 300,
+    ):
+        super().__init__(sync_interval=sync_interval)
+        self.hosts_source = (
+            hosts_source  # returns the (address, labels with zone) of every host
+        )
+        self.grants_source = grants_source  # returns the (username, canonical selector) of every group grant
+        self.checks = 0
+        self._labels: Dict[str, Dict[str, str]] = {}
+        self._members: Dict[Label, Set[str]] = {}
+        self._selectors: Dict[str, Counter] = {}
+        self._parsed: Dict[str, Tuple[Label, ...]] = {}
+
+    def parsed(self, selector: str) -> Tuple[Label, ...]:
+        """
+        Returns the labels of a canonical selector, parsed once.
+        """
+
+        labels = self._parsed.get(selector)
+        if labels is None:
+            labels = tuple(parse_selector(selector).items())
+            self._parsed[selector] = labels
+
+        return labels
+
+    def _set_host(self, address: str, labels: Dict[str, str]) -> None:
+        old_labels: Dict[str, str] = self._labels.get(address, {})
+
+        for label in set(old_labels.items()) - set(labels.items()):
+            members: Set[str] = self._members.get(label, set())
+            members.discard(address)
+            if not members:
+                self._members.pop(label, None)
+
+        for label in set(labels.items()) - set(old_labels.items()):
+            self._members.setdefault(label, set()).add(address)
+
+        if labels:
+            self._labels[address] = dict(labels)
+        else:
+            self._labels.pop(address, None)
+
+    def _remove_group_grants(self, username: str, selectors: List[str]) -> None:
+        user_selectors: Union[Counter, None] = self._selectors.get(username)
+        if user_selectors is None:
+            return
+
+        for selector in selectors:
+            if user_selectors[selector] > 1:
+                user_selectors[selector] -= 1
+            else:
+                user_selectors.pop(selector, None)
+
+        if not user_selectors:
+            del self._selectors[username]
+
+    def apply(self, change: Callable, *args) -> None:
+        """
+        Applies a change to the index and records it if a sync is reading the sources. The caller must hold the lock.
+        """
+
+        change(*args)
+        self.record_change(change.__name__, args)
+
+    def set_host(self, address: str, labels: Dict[str, str]) -> None:
+        """
+        Registers a host or replaces its labels, moving it only between the sets of the labels which changed.
+
+        :param address:
+        :param labels: labels of the host, including its zone
+        :return: None
+        """
+
+        with self._lock:
+            self.apply(self._set_host, address, labels)
+
+    def remove_host(self, address: str) -> None:
+        """
+        Removes a host from the index.
+
+        :param address:
+        :return: None
+        """
+
+        self.set_host(address=address, labels={})
+
+    def add_group_grants(self, username: str, selectors: List[str]) -> None:
+        """
+        Adds newly stored group grants of the user.
+
+        :param username:
+        :param selectors: canonical selectors, once per stored grant
+        :return: None
+        """
+
+        with self._lock:
+            user_selectors: Counter = self._selectors.setdefault(username, Counter())
+            for selector in selectors:
+                user_selectors[selector] += 1
+
+    def remove_group_grants(self, username: str, selectors: List[str]) -> None:
+        """
+        Removes deleted group grants of the user.
+
+        :param username:
+        :param selectors: canonical selectors, once per deleted grant
+        :return: None
+        """
+
+        with self._lock:
+            self.apply(self._remove_group_grants, username, selectors)
+
+    def members(self, selector: Union[str, Dict[str, str]]) -> Set[str]:
+        """
+        Returns the hosts matching a label selector, intersecting the smallest label sets first.
+
+        :param selector:
+        :return: set of host addresses
+        """
+
+        label_sets: List[Set[str]] = sorted(
+            (
+                self._members.get(label, set())
+                for label in parse_selector(selector).items()
+            ),
+            key=len,
+        )
+        return set.intersection(*label_sets) if label_sets else set()
+
+    def has_access(self, username: str, host: str) -> bool:
+        """
+        Checks whether any group grant of the user matches the host.
+
+        :param username:
+        :param host:
+        :return: boolean value
+        """
+
+        self.checks += 1
+        user_selectors: Union[Counter, None] = self._selectors.get(username)
+        if not user_selectors:
+            return False
+
+        members: Dict[Label, Set[str]] = self._members
+        return any(
+            all(host in members.get(label, ()) for label in self.parsed(selector))
+            for selector in list(user_selectors)
+        )
+
+    def load(
+        self,
+        hosts: Iterable[Tuple[str, Dict[str, str]]],
+        group_grants: Iterable[Tuple[str, str]],
+    ) -> None:
+        """
+        Replaces the index. The index is built aside and swapped in, so the readers never wait.
+
+        :param hosts: (address, labels with zone) of every host
+        :param group_grants: (username, canonical selector) of every group grant
+        :return: None
+        """
+
+        index = HostIndex()
+        for address, labels in hosts:
+            index._set_host(address, labels)
+        for username, selector in group_grants:
+            index._selectors.setdefault(username, Counter())[selector] += 1
+
+        with self._lock:
+            for name, args in self.changes_during_sync():
+                getattr(index, name)(*args)
+
+            self._labels, self._members, self._selectors = (
+                index._labels,
+                index._members,
+                index._selectors,
+            )
+            self.mark_loaded()
+
+    def sync(self) -> None:
+        """
+        Reloads the index from the sources.
+
+        :returns: None
+        """
+
+        if self.hosts_source is None or self.grants_source is None:
+            return
+
+        hosts, group_grants = self.read_source(
+            lambda: (list(self.hosts_source()), list(self.grants_source()))
+        )
+        self.load(hosts=hosts, group_grants=group_grants)
+
+    def stats(self) -> Dict[str, Union[bool, int, float]]:
+        """
+        Returns the counters of the index.
+        """
+
+        return {
+            "loaded": self.loaded,
+            "hosts": len(self._labels),
+            "labels": len(self._members),
+            "users": len(self._selectors),
+            "checks": self.checks,
+            "last_sync": self.last_sync,
+            "sync_failures": self.sync_failures,
+        }
@@ -0,0 +1,260 @@
+import base64
+import errno
+import fcntl
+import json
+import os
+import stat
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+"""
+This module provides the stores used for sharing the transport keys (see the rsa and x25519 services) between the
+worker processes and nodes. Every worker loads the key ring from the store at startup and after a rotation, so that a
+client can fetch the public key from one worker and send its request to any other.
+
+Each stored key is a dictionary of:
+
+kind: "rsa", "x25519", "token" or "ssh_ca"
+key_id: id of the key-pair
+material: PEM encoded private key
+generation_time: time of generation (in seconds)
+
+FileKeyStore keeps the keys in a file, which by default lives in a directory of /dev/shm private to the user of the
+workers, so that it never touches the disk. The directory, the file and its lock must belong to that user and be
+inaccessible to the others, or the store refuses them: a file planted by another user is never loaded. It is meant for
+the workers of one node. DatabaseKeyStore keeps the keys in the transport_keys table and is meant for multiple nodes.
+"""
+
+
+class KeyStore(ABC):
+    @abstractmethod
+    def load(self, kind: str) -> List[Dict[str, any]]:
+        """
+        Returns the stored keys of the given kind, oldest first.
+
+        :param kind:
+        :return: list of keys
+        """
+
+    @abstractmethod
+    def publish(
+        self, kind: str, key_id: str, material: bytes, generation_time: float, keep: int
+    ) -> None:
+        """
+        Stores a new key and removes all but the newest "keep" keys of that kind.
+
+        :param kind:
+        :param key_id:
+        :param material:
+        :param generation_time:
+        :param keep:
+        :return: None
+        """
+
+    @abstractmethod
+    def lock(self):
+        """
+        Holds an exclusive lock across all the workers sharing the store, so that only one of them generates a key. This
+        is a context manager.
+        """
+
+
+def check_private(path: str, status: os.stat_result) -> None:
+    """
+    Checks that a file or directory belongs to the current user and that no other user can access it.
+
+    :param path:
+    :param status: of the file, not following symlinks
+    :return: None
+    :raises PermissionError: If the file is a symlink, belongs to another user or is accessible to others
+    """
+
+    if stat.S_ISLNK(status.st_mode):
+        raise PermissionError(f"{path} is a symlink")
+
+    if status.st_uid != os.geteuid() or status.st_mode & 0o077:
+        raise PermissionError(
+            f"{path} must belong to the user of the workers and be private to it"
+        )
+
+
+class FileKeyStore(KeyStore):
+    def __init__(self, path: str = None):
+        if path is None:
+            root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            directory = os.path.join(root, f"ssh_manager-{os.geteuid()}")
+            try:
+                os.mkdir(directory, 0o700)
+            except FileExistsError:
+                pass
+            path = os.path.join(directory, "transport_keys.json")
+
+        self.path = path
+
+    def check_directory(self) -> None:
+        """
+        Checks that the directory of the file is private, so that no other user can replace the file.
+
+        :raises PermissionError:
+        """
+
+        directory: str = os.path.dirname(os.path.abspath(self.path))
+        check_private(directory, os.lstat(directory))
+
+    def open_private(self, path: str, flags: int) -> int:
+        """
+        Opens a file of the store without following symlinks and checks that it is private.
+
+        :param path:
+        :param flags: os.open flags
+        :return: file descriptor
+        :raises PermissionError:
+        """
+
+        try:
+            descriptor: int = os.open(path, flags | os.O_NOFOLLOW, 0o600)
+        except OSError as error:
+            if error.errno == errno.ELOOP:
+                raise PermissionError(f"{path} is a symlink") from error
+            raise
+
+        try:
+            check_private(path, os.fstat(descriptor))
+        except PermissionError:
+            os.close(descriptor)
+            raise
+
+        return descriptor
+
+    def read(self) -> List[Dict[str, any]]:
+        """
+        Reads all the keys from the file.
+
+        :return: list of keys
+        :raises PermissionError: If the file or its directory is not private
+        """
+
+        self.check_directory()
+        try:
+            with os.fdopen(self.open_private(self.path, os.O_RDONLY)) as key_file:
+                entries = json.load(key_file)
+        except (FileNotFoundError, ValueError):
+            return []
+
+        for entry in entries:
+            entry["material"] = base64.b64decode(entry["material"])
+
+        return entries
+
+    def write(self, entries: List[Dict[str, any]]) -> None:
+        """
+        Replaces the file atomically so that a reader never sees a partially written file.
+
+        :param entries:
+        :return: None
+        """
+
+        serialized = [
+            dict(entry, material=base64.b64encode(entry["material"]).decode())
+            for entry in entries
+        ]
+
+        self.check_directory()
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(descriptor, "w") as key_file:
+            json.dump(serialized, key_file)
+
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, self.path)
+
+    def load(self, kind: str) -> List[Dict[str, any]]:
+        entries = [entry for entry in self.read() if entry["kind"] == kind]
+        return sorted(entries, key=lambda entry: entry["generation_time"])
+
+    def publish(
+        self, kind: str, key_id: str, material: bytes, generation_time: float, keep: int
+    ) -> None:
+        entries = self.read()
+        entries.append(
+            {
+                "kind": kind,
+                "key_id": key_id,
+                "material": material,
+                "generation_time": generation_time,
+            }
+        )
+
+        same_kind = sorted(
+            [entry for entry in entries if entry["kind"] == kind],
+            key=lambda entry: entry["generation_time"],
+        )
+        stale_ids = {entry["key_id"] for entry in same_kind[:-keep]}
+
+        self.write(
+            [
+                entry
+                for entry in entries
+                if entry["kind"] != kind or entry["key_id"] not in stale_ids
+            ]
+        )
+
+    @contextmanager
+    def lock(self):
+        self.check_directory()
+        descriptor: int = self.open_private(
+            self.path + ".lock", os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        )
+        with os.fdopen(descriptor, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class DatabaseKeyStore(KeyStore):
+    @property
+    def transport_keys(self):
+        """
+        Returns the model bound to the database session of the calling thread. It is imported here so that the
+        services can be used without a database connection.
+        """
+
+        from ssh_manager_backend.app.models import TransportKeys
+
+        return TransportKeys()
+
+    def load(self, kind: str) -> List[Dict[str, any]]:
+        return [
+            {
+                "kind": key.kind,
+                "key_id": key.key_id,
+                "material": key.material,
+                "generation_time": key.generation_time,
+            }
+            for key in self.transport_keys.get_keys(kind=kind)
+        ]
+
+    def publish(
+        self, kind: str, key_id: str, material: bytes, generation_time: float, keep: int
+    ) -> None:
+        if not self.transport_keys.publish(
+            kind=kind,
+            key_id=key_id,
+            material=material,
+            generation_time=generation_time,
+            keep=keep,
+        ):
+            raise RuntimeError(f"The {kind} key {key_id} could not be stored")
+
+    @contextmanager
+    def lock(self):
+        transport_keys = self.transport_keys
+        transport_keys.lock()
+        try:
+            yield
+        finally:
+            transport_keys.unlock()
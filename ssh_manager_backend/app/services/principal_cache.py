@@ -0,0 +1,168 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, Set, Tuple, Union
+
+
+"""
+This module provides a per-process cache which maps an access token to a small immutable record of the authenticated
+user, so that the authenticated requests do not have to load the full user row(with all the secrets) on every call.
+
+The entries expire after the TTL, and are invalidated explicitly by the models whenever the session or the user
+changes(logout, login, deletion, admin change).
+"""
+
+Principal = namedtuple("Principal", ["user_id", "username", "admin", "session_active"])
+
+
+class PrincipalCache:
+    def __init__(self, enabled: bool = True, ttl: int = 60, max_entries: int = 10000):
+        self.enabled = enabled
+        self.ttl = ttl  # (in seconds)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._tokens_by_username: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def token_key(access_token: str) -> str:
+        """
+        Returns the key under which the principal of a token is stored, so that the raw tokens are not kept in memory.
+
+        :param access_token:
+        :return: key
+        """
+
+        return hashlib.sha256(bytes(access_token, encoding="utf-8")).hexdigest()
+
+    def remove(self, token_key: str) -> None:
+        """
+        Removes an entry. The caller must hold the lock.
+
+        :param token_key:
+        :return: None
+        """
+
+        principal, _ = self._entries.pop(token_key)
+        tokens: Set[str] = self._tokens_by_username.get(principal.username, set())
+        tokens.discard(token_key)
+        if not tokens:
+            self._tokens_by_username.pop(principal.username, None)
+
+    def get(self, access_token: str) -> Union[Principal, None]:
+        """
+        Returns the cached principal of the token, or None if it is not cached or has expired.
+
+        :param access_token:
+        :return: Principal
+        """
+
+        if not self.enabled:
+            return None
+
+        token_key: str = self.token_key(access_token)
+
+        with self._lock:
+            entry = self._entries.get(token_key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            principal, expires_at = entry
+            if expires_at < time.time():
+                self.remove(token_key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token_key)
+            self.hits += 1
+            return principal
+
+    def put(
+        self, access_token: str, principal: Principal, expires_at: float = None
+    ) -> None:
+        """
+        Caches the principal of the token.
+
+        :param access_token:
+        :param principal:
+        :param expires_at: Expiry of the session (in seconds since the epoch), the entry does not outlive it
+        :return: None
+        """
+
+        if not self.enabled:
+            return
+
+        token_key: str = self.token_key(access_token)
+
+        with self._lock:
+            if token_key in self._entries:
+                self.remove(token_key)
+
+            entry_expires_at: float = time.time() + self.ttl
+            if expires_at is not None:
+                entry_expires_at = min(entry_expires_at, expires_at)
+
+            self._entries[token_key] = (principal, entry_expires_at)
+            self._tokens_by_username.setdefault(principal.username, set()).add(
+                token_key
+            )
+
+            while len(self._entries) > self.max_entries:
+                self.remove(next(iter(self._entries)))
+
+    def invalidate_token(self, access_token: str) -> None:
+        """
+        Removes the cached principal of the token.
+
+        :param access_token:
+        :return: None
+        """
+
+        token_key: str = self.token_key(access_token)
+
+        with self._lock:
+            if token_key in self._entries:
+                self.remove(token_key)
+                self.invalidations += 1
+
+    def invalidate_username(self, username: str) -> None:
+        """
+        Removes the cached principals of all the tokens of the user.
+
+        :param username:
+        :return: None
+        """
+
+        with self._lock:
+            for token_key in list(self._tokens_by_username.get(username, ())):
+                self.remove(token_key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """
+        Removes all the cached principals.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_username.clear()
+
+    def stats(self) -> Dict[str, Union[bool, int]]:
+        """
+        Returns the counters of the cache.
+        """
+
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
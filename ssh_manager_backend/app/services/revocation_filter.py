@@ -0,0 +1,189 @@
+import hashlib
+import math
+import time
+from typing import Callable, Dict, Iterable, Set, Union
+
+from ssh_manager_backend.app.services.background_sync import BackgroundSync
+
+
+"""
+This module keeps the set of revoked signed access tokens(see the signed_tokens service) in memory, so that checking a
+token on every request does not need the database.
+
+The token hashes are kept in a Bloom filter in front of an exact set. Almost every request carries a token which is
+not revoked, and the Bloom filter answers those with a few bit lookups; only the rare positive is confirmed against the
+exact set, so there are no false positives. The filter is rebuilt from the source(the revoked sessions) every sync
+interval by a background thread, and the tokens revoked by this worker are added immediately.
+"""
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size: int = max(
+            8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.hash_count: int = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, digest: bytes) -> Iterable[int]:
+        """
+        Returns the bit positions of a digest, derived from two 64 bit halves of it(double hashing).
+
+        :param digest: SHA256 digest of the item
+        :return: bit positions
+        """
+
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, digest: bytes) -> None:
+        """
+        Sets the bits of a digest.
+        """
+
+        for position in self.positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        """
+        Returns true if the digest may have been added, false if it certainly was not.
+        """
+
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(digest)
+        )
+
+
+class RevocationFilter(BackgroundSync):
+    sync_name = "revocation-sync"
+
+    def __init__(
+        self,
+        source: Callable[[], Iterable[str]] = None,
+        sync_interval: int = 30,
+        error_rate: float = 0.001,
+    ):
+        super().__init__(sync_interval=sync_interval)
+        self.source = source  # returns the hex SHA256 hashes of the revoked tokens
+        self.error_rate = error_rate
+        self.checks = 0
+        self.filter_positives = 0
+        self.revoked = 0
+        self._hashes: Set[str] = set()
+        self._local: Dict[str, float] = {}
+        self._filter = BloomFilter(capacity=1024, error_rate=error_rate)
+
+    @staticmethod
+    def token_hash(access_token: str) -> str:
+        """
+        Returns the hash of the access token, which is the same as the token hash of its session.
+
+        :param access_token:
+        :return: SHA256 hex digest
+        """
+
+        return hashlib.sha256(bytes(access_token, encoding="utf-8")).hexdigest()
+
+    def is_revoked(self, access_token: str) -> bool:
+        """
+        Checks whether the access token is revoked.
+
+        :param access_token:
+        :return: True if revoked
+        """
+
+        token_hash: str = self.token_hash(access_token)
+        bloom_filter, hashes = self._filter, self._hashes
+
+        self.checks += 1
+        if bytes.fromhex(token_hash) not in bloom_filter:
+            return False
+
+        self.filter_positives += 1
+        revoked: bool = token_hash in hashes
+        if revoked:
+            self.revoked += 1
+
+        return revoked
+
+    def revoke(self, access_token: str) -> None:
+        """
+        Revokes the access token on this worker. The other workers learn about it on their next sync.
+
+        :param access_token:
+        :return: None
+        """
+
+        self.add(self.token_hash(access_token))
+
+    def add(self, token_hash: str) -> None:
+        """
+        Adds a token hash to the filter.
+
+        :param token_hash:
+        :return: None
+        """
+
+        with self._lock:
+            self._local[token_hash] = time.time()
+            self._hashes.add(token_hash)
+            self._filter.add(bytes.fromhex(token_hash))
+
+    def load(self, token_hashes: Iterable[str]) -> None:
+        """
+        Replaces the revoked token hashes. The filter is built aside and swapped in, so the readers never wait. The
+        tokens revoked by this worker in the last two sync intervals are kept, in case the source was read before
+        their revocation was committed.
+
+        :param token_hashes:
+        :return: None
+        """
+
+        hashes: Set[str] = set(token_hashes)
+        bloom_filter = BloomFilter(
+            capacity=max(1024, 2 * len(hashes)), error_rate=self.error_rate
+        )
+        for token_hash in hashes:
+            bloom_filter.add(bytes.fromhex(token_hash))
+
+        with self._lock:
+            cutoff: float = time.time() - 2 * self.sync_interval
+            self._local = {
+                token_hash: revoked_at
+                for token_hash, revoked_at in self._local.items()
+                if revoked_at >= cutoff
+            }
+            for token_hash in self._local:
+                hashes.add(token_hash)
+                bloom_filter.add(bytes.fromhex(token_hash))
+
+            self._hashes, self._filter = hashes, bloom_filter
+            self.last_sync = time.time()
+
+    def sync(self) -> None:
+        """
+        Reloads the revoked token hashes from the source.
+
+        :returns: None
+        """
+
+        if self.source is not None:
+            self.load(self.source())
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Returns the counters of the filter.
+        """
+
+        return {
+            "size": len(self._hashes),
+            "filter_bits": self._filter.size,
+            "checks": self.checks,
+            "filter_positives": self.filter_positives,
+            "revoked": self.revoked,
+            "last_sync": self.last_sync,
+            "sync_failures": self.sync_failures,
+        }
@@ -0,0 +1,348 @@
+from typing import Callable, Dict, FrozenSet, Iterable, List, Set, Tuple, Union
+
+from ssh_manager_backend.app.services.background_sync import BackgroundSync
+from ssh_manager_backend.app.services.grant_index import UserGrants, normalize_host
+
+
+"""
+This module resolves the effective permissions of users granted through roles(see the roles model). A role holds host
+grants and inherits the grants of its parent roles; a user gets the grants of every role it is a member of.
+
+The role graph is kept in memory, and the flattened grants of each user are memoized on first check, so that a check
+is a lookup in the user's grant set(including networks, see grant_index) instead of a walk of the role graph. Each
+change invalidates only what it affects:
+
+- a grant of a role: the users of the role and of every role inheriting from it
+- a membership: the user
+- an inheritance: the users of the role and of every role inheriting from it, and the ancestors of those roles
+
+The graph is loaded from the source in the background and updated incrementally by the model. Changes made while a
+sync is reading the source are applied again to the new graph.
+"""
+
+# (role parents, role grants, role members) as (role, parent), (role, host, remote user) and (role, username)
+Snapshot = Tuple[
+    Iterable[Tuple[str, str]],
+    Iterable[Tuple[str, str, str]],
+    Iterable[Tuple[str, str]],
+]
+
+
+class RoleGraph:
+    def __init__(self):
+        self.parents: Dict[str, Set[str]] = {}
+        self.children: Dict[str, Set[str]] = {}
+        self.grants: Dict[str, Set[Tuple[str, str]]] = {}  # role -> (host, remote user)
+        self.members: Dict[str, Set[str]] = {}  # role -> usernames
+        self.roles_of_user: Dict[str, Set[str]] = {}
+
+    def add_parent(self, role: str, parent: str) -> None:
+        self.parents.setdefault(role, set()).add(parent)
+        self.children.setdefault(parent, set()).add(role)
+
+    def remove_parent(self, role: str, parent: str) -> None:
+        self.parents.get(role, set()).discard(parent)
+        self.children.get(parent, set()).discard(role)
+
+    def add_grant(self, role: str, host: str, remote_user: str) -> None:
+        self.grants.setdefault(role, set()).add((host, remote_user))
+
+    def remove_grant(self, role: str, host: str, remote_user: str) -> None:
+        self.grants.get(role, set()).discard((host, remote_user))
+
+    def add_member(self, role: str, username: str) -> None:
+        self.members.setdefault(role, set()).add(username)
+        self.roles_of_user.setdefault(username, set()).add(role)
+
+    def remove_member(self, role: str, username: str) -> None:
+        self.members.get(role, set()).discard(username)
+        self.roles_of_user.get(username, set()).discard(role)
+
+    def remove_role(self, role: str) -> None:
+        for parent in self.parents.pop(role, set()):
+            self.children.get(parent, set()).discard(role)
+        for child in self.children.pop(role, set()):
+            self.parents.get(child, set()).discard(role)
+        for username in self.members.pop(role, set()):
+            self.roles_of_user.get(username, set()).discard(role)
+        self.grants.pop(role, None)
+
+    def descendants(self, role: str) -> Set[str]:
+        """
+        Returns the role and every role inheriting from it.
+        """
+
+        roles: Set[str] = {role}
+        pending: List[str] = [role]
+        while pending:
+            for child in self.children.get(pending.pop(), ()):
+                if child not in roles:
+                    roles.add(child)
+                    pending.append(child)
+
+        return roles
+
+    def ancestors(self, role: str) -> Set[str]:
+        """
+        Returns the role and every role it inherits from.
+        """
+
+        roles: Set[str] = {role}
+        pending: List[str] = [role]
+        while pending:
+            for parent in self.parents.get(pending.pop(), ()):
+                if parent not in roles:
+                    roles.add(parent)
+                    pending.append(parent)
+
+        return roles
+
+
+class RoleResolver(BackgroundSync):
+    sync_name = "role-resolver-sync"
+
+    def __init__(self, source: Callable[[], Snapshot] = None, sync_interval: int = 300):
+        super().__init__(sync_interval=sync_interval)
+        self.source = source  # returns the role parents, role grants and role members
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._graph = RoleGraph()
+        self._ancestors: Dict[
+            str, FrozenSet[str]
+        ] = {}  # memoized ancestors of each role
+        self._effective: Dict[str, UserGrants] = {}  # memoized grants of each user
+
+    def role_ancestors(self, role: str) -> FrozenSet[str]:
+        """
+        Returns the memoized ancestors of a role, including itself. The caller must hold the lock.
+        """
+
+        ancestors = self._ancestors.get(role)
+        if ancestors is None:
+            ancestors = frozenset(self._graph.ancestors(role))
+            self._ancestors[role] = ancestors
+
+        return ancestors
+
+    def effective_grants(self, username: str) -> UserGrants:
+        """
+        Returns the memoized grants of the user through all of its roles, flattening them on the first call.
+
+        :param username:
+        :return: grants of the user
+        """
+
+        user_grants: Union[UserGrants, None] = self._effective.get(username)
+        if user_grants is not None:
+            self.hits += 1
+            return user_grants
+
+        with self._lock:
+            self.misses += 1
+            user_grants = UserGrants()
+            roles: Set[str] = set()
+            for role in self._graph.roles_of_user.get(username, ()):
+                roles |= self.role_ancestors(role)
+            for role in roles:
+                for host, _ in self._graph.grants.get(role, ()):
+                    user_grants.add(host)
+
+            self._effective[username] = user_grants
+
+        return user_grants
+
+    def has_access(self, username: str, host: str) -> bool:
+        """
+        Checks whether any role of the user grants the host.
+
+        :param username:
+        :param host:
+        :return: boolean value
+        """
+
+        return self.effective_grants(username=username).has_access(normalize_host(host))
+
+    def _invalidate_users(self, usernames: Iterable[str]) -> None:
+        for username in usernames:
+            if self._effective.pop(username, None) is not None:
+                self.invalidations += 1
+
+    def _invalidate_role(self, role: str) -> None:
+        """
+        Forgets the memoized grants of the users of the role and of every role inheriting from it.
+        """
+
+        for descendant in self._graph.descendants(role):
+            self._ancestors.pop(descendant, None)
+            self._invalidate_users(self._graph.members.get(descendant, ()))
+
+    def _change(self, name: str, *args) -> None:
+        """
+        Applies a change to the graph, invalidates what it affects and records it if a sync is reading the source. The
+        caller must hold the lock.
+        """
+
+        role: str = args[0]
+        if name in ("add_member", "remove_member"):
+            getattr(self._graph, name)(*args)
+            self._invalidate_users([args[1]])
+        else:
+            # Invalidating before a removal still sees the roles inheriting from the removed role.
+            self._invalidate_role(role)
+            getattr(self._graph, name)(*args)
+            self._invalidate_role(role)
+
+        self.record_change(name, args)
+
+    def add_parent(self, role: str, parent: str) -> None:
+        """
+        Makes the role inherit the grants of the parent role.
+
+        :param role:
+        :param parent:
+        :return: None
+        """
+
+        with self._lock:
+            self._change("add_parent", role, parent)
+
+    def remove_parent(self, role: str, parent: str) -> None:
+        """
+        Stops the role inheriting the grants of the parent role.
+
+        :param role:
+        :param parent:
+        :return: None
+        """
+
+        with self._lock:
+            self._change("remove_parent", role, parent)
+
+    def add_grants(self, role: str, grants: List[Tuple[str, str]]) -> None:
+        """
+        Adds grants of the role.
+
+        :param role:
+        :param grants: (normalized host, remote user)
+        :return: None
+        """
+
+        with self._lock:
+            for host, remote_user in grants:
+                self._change("add_grant", role, host, remote_user)
+
+    def remove_grants(self, role: str, grants: List[Tuple[str, str]]) -> None:
+        """
+        Removes grants of the role.
+
+        :param role:
+        :param grants: (normalized host, remote user)
+        :return: None
+        """
+
+        with self._lock:
+            for host, remote_user in grants:
+                self._change("remove_grant", role, host, remote_user)
+
+    def add_member(self, role: str, username: str) -> None:
+        """
+        Makes the user a member of the role.
+
+        :param role:
+        :param username:
+        :return: None
+        """
+
+        with self._lock:
+            self._change("add_member", role, username)
+
+    def remove_member(self, role: str, username: str) -> None:
+        """
+        Removes the user from the role.
+
+        :param role:
+        :param username:
+        :return: None
+        """
+
+        with self._lock:
+            self._change("remove_member", role, username)
+
+    def remove_role(self, role: str) -> None:
+        """
+        Removes a role with its grants, members and inheritances.
+
+        :param role:
+        :return: None
+        """
+
+        with self._lock:
+            self._change("remove_role", role)
+
+    def load(
+        self,
+        parents: Iterable[Tuple[str, str]],
+        grants: Iterable[Tuple[str, str, str]],
+        members: Iterable[Tuple[str, str]],
+    ) -> None:
+        """
+        Replaces the role graph and forgets every memoized grant set. The graph is built aside and swapped in.
+
+        :param parents: (role, parent) of every inheritance
+        :param grants: (role, normalized host, remote user) of every role grant
+        :param members: (role, username) of every membership
+        :return: None
+        """
+
+        graph = RoleGraph()
+        for role, parent in parents:
+            graph.add_parent(role, parent)
+        for role, host, remote_user in grants:
+            graph.add_grant(role, host, remote_user)
+        for role, username in members:
+            graph.add_member(role, username)
+
+        with self._lock:
+            for name, args in self.changes_during_sync():
+                getattr(graph, name)(*args)
+
+            self._graph = graph
+            self._ancestors = {}
+            self._effective = {}
+            self.mark_loaded()
+
+    def sync(self) -> None:
+        """
+        Reloads the role graph from the source.
+
+        :returns: None
+        """
+
+        if self.source is None:
+            return
+
+        parents, grants, members = self.read_source(
+            lambda: [list(rows) for rows in self.source()]
+        )
+        self.load(parents=parents, grants=grants, members=members)
+
+    def stats(self) -> Dict[str, Union[bool, int, float]]:
+        """
+        Returns the counters of the resolver.
+        """
+
+        return {
+            "loaded": self.loaded,
+            "roles": len(
+                self._graph.parents.keys()
+                | self._graph.grants.keys()
+                | self._graph.members.keys()
+            ),
+            "memoized_users": len(self._effective),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "last_sync": self.last_sync,
+            "sync_failures": self.sync_failures,
+        }
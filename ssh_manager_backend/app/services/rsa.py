@@ -1,4 +1,8 @@
+import hashlib
+import threading
 import time
+from collections import OrderedDict
+from typing import Union
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
@@ -9,28 +13,204 @@ from cryptography.hazmat.primitives.asymmetric import padding, rsa
 This is wrapper around rsa class of cryptography.hazmat.primitives.asymmetric and provides the functionality of
 generating RSA key-pair, serializing the public key, decrypting a cipher using the private key and refreshing
 the kye-pair.
+
+The key-pairs are kept in a ring of the current and the previous keys, each identified by a key id, so that a client
+still holding the previous public key can finish its request after a rotation. A background rotator pre-generates the
+next key-pair so that neither the first request nor a rotation has to wait for a 4096 bit key generation.
+
+When a key store (see the key_store service) is set, the ring is shared by all the workers using that store.
 """
 
 
 class RSA:
-    def __init__(self):
+    kind = "rsa"
+
+    def __init__(self, ring_size: int = 2, key_store=None):
         self._private_key = None
         self._public_key = None
         self.generation_time = 0
         self.expire_time = 3600  # (in seconds)
+        self.ring_size = ring_size
+        self._ring: "OrderedDict[str, rsa.RSAPrivateKey]" = OrderedDict()
+        self._current_key_id: Union[str, None] = None
+        self._next_private_key = None
+        self._generation_lock = threading.Lock()
+        self._stop_rotation = threading.Event()
+        self._rotator: Union[threading.Thread, None] = None
+        self.key_store = key_store
+        self._last_sync = 0
+        self.sync_interval = 1  # (in seconds)
 
-    def generate_key_pair(self) -> None:
+    @staticmethod
+    def new_private_key():
         """
-        Generates a 4096 bit RSA key-pair.
+        Generates a 4096 bit RSA private key.
 
-        :returns: None
+        :returns: private key
         """
 
-        self._private_key = rsa.generate_private_key(
+        return rsa.generate_private_key(
             public_exponent=65537, key_size=4096, backend=default_backend()
         )
-        self.public_key = self._private_key.public_key()
-        self.generation_time = time.time()
+
+    @staticmethod
+    def compute_key_id(private_key) -> str:
+        """
+        Returns the key id of a key-pair, which is the truncated SHA256 fingerprint of the public key.
+
+        :param private_key:
+        :return: key id
+        """
+
+        public_key_der: bytes = private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        return hashlib.sha256(public_key_der).hexdigest()[:16]
+
+    def add_key_pair(self, private_key, generation_time: float = None) -> str:
+        """
+        Makes the given key-pair the current one. The previous key-pairs stay in the ring until they are pushed out
+        by newer ones.
+
+        :param private_key:
+        :param generation_time:
+        :return: key id
+        """
+
+        key_id: str = self.compute_key_id(private_key)
+
+        self._ring[key_id] = private_key
+        self._ring.move_to_end(key_id)
+        while len(self._ring) > self.ring_size:
+            self._ring.popitem(last=False)
+
+        self._private_key = private_key
+        self._public_key = private_key.public_key()
+        self._current_key_id = key_id
+        self.generation_time = generation_time or time.time()
+
+        return key_id
+
+    def serialize_private_key(self, private_key) -> bytes:
+        """
+        Serializes a private key for the key store.
+
+        :param private_key:
+        :return: PEM encoded private key
+        """
+
+        return private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+
+    def load_from_store(self) -> None:
+        """
+        Replaces the ring with the key-pairs of the key store. The caller must hold the generation lock.
+
+        :returns: None
+        """
+
+        entries = self.key_store.load(kind=self.kind)
+        self._last_sync = time.time()
+        if not entries:
+            return
+
+        known = dict(self._ring)
+        self._ring.clear()
+        for entry in entries:
+            private_key = known.get(entry["key_id"]) or (
+                serialization.load_pem_private_key(
+                    data=entry["material"], password=None, backend=default_backend()
+                )
+            )
+            self.add_key_pair(private_key, generation_time=entry["generation_time"])
+
+    def add_new_key_pair(self) -> None:
+        """
+        Makes a new (or the pre-generated) key-pair current and publishes it to the key store. The caller must hold
+        the generation lock.
+
+        :returns: None
+        """
+
+        private_key = self._next_private_key or self.new_private_key()
+        self._next_private_key = None
+        key_id: str = self.add_key_pair(private_key)
+
+        if self.key_store is not None:
+            self.key_store.publish(
+                kind=self.kind,
+                key_id=key_id,
+                material=self.serialize_private_key(private_key),
+                generation_time=self.generation_time,
+                keep=self.ring_size,
+            )
+
+    def sync(self) -> None:
+        """
+        Loads the key ring from the key store, so that the key-pairs generated by other workers are known.
+
+        :returns: None
+        """
+
+        if self.key_store is None:
+            return
+
+        with self._generation_lock:
+            self.load_from_store()
+
+    def generate_key_pair(self) -> None:
+        """
+        Generates a 4096 bit RSA key-pair and makes it the current one. A pre-generated key-pair is used if the
+        rotator has prepared one.
+
+        :returns: None
+        """
+
+        with self._generation_lock:
+            self.add_new_key_pair()
+
+    def ensure_key_pair(self) -> None:
+        """
+        Generates the key-pair if it is not generated yet. Concurrent callers, including the other workers sharing
+        the key store, wait for a single generation instead of each generating a key-pair.
+
+        :returns: None
+        """
+
+        if self.is_generated():
+            return
+
+        with self._generation_lock:
+            if self.is_generated():
+                return
+
+            if self.key_store is None:
+                self.add_new_key_pair()
+                return
+
+            with self.key_store.lock():
+                self.load_from_store()
+                if not self.is_generated():
+                    self.add_new_key_pair()
+
+    def prepare_next_key_pair(self) -> None:
+        """
+        Generates the next key-pair without making it current, so that the rotation itself is instant.
+
+        :returns: None
+        """
+
+        if self._next_private_key is not None:
+            return
+
+        private_key = self.new_private_key()
+        with self._generation_lock:
+            if self._next_private_key is None:
+                self._next_private_key = private_key
 
     def serialize_key(self) -> str:
         """
@@ -46,21 +226,46 @@ class RSA:
 
         return public_key_serialized.decode("utf-8")
 
-    def decrypt_cipher(self, ciphertext: bytes) -> bytes:
+    def decrypt_cipher(self, ciphertext: bytes, key_id: str = None) -> bytes:
         """
         Decrypts the cipher encrypted from the generated RSA public key using the private key.
 
         :param ciphertext: The encrypted text to be decrypted
+        :param key_id: The id of the key-pair used by the client. Without it, the keys of the ring are tried from the
+            newest, as a client may still hold a public key from before a rotation.
         :return: plaintext
+        :raises KeyError: If the key id is not in the ring
+        :raises ValueError: If no key of the ring decrypts the cipher
         """
 
-        plaintext: bytes = self._private_key.decrypt(
+        if key_id is not None:
+            private_key = self._ring.get(key_id)
+            if private_key is None and self.can_sync():
+                self.sync()
+                private_key = self._ring.get(key_id)
+
+            if private_key is None:
+                raise KeyError(key_id)
+
+            return self._decrypt(private_key, ciphertext)
+
+        private_keys = list(reversed(self._ring.values())) or [self._private_key]
+        for private_key in private_keys[:-1]:
+            try:
+                return self._decrypt(private_key, ciphertext)
+            except ValueError:
+                continue
+
+        return self._decrypt(private_keys[-1], ciphertext)
+
+    @staticmethod
+    def _decrypt(private_key: rsa.RSAPrivateKey, ciphertext: bytes) -> bytes:
+        return private_key.decrypt(
             ciphertext=ciphertext,
             padding=padding.OAEP(
                 mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None
             ),
         )
-        return plaintext
 
     @property
     def public_key(self) -> str:
@@ -70,12 +275,40 @@ class RSA:
 
         return self.serialize_key()
 
+    @property
+    def key_id(self) -> Union[str, None]:
+        """
+        Returns the key id of the current key-pair.
+        """
+
+        return self._current_key_id
+
     def refresh_key_pair(self) -> None:
         """
-        Refreshes the rsa key-pair.
+        Refreshes the rsa key-pair. When a key store is shared, only the first worker to get the lock generates the
+        new key-pair and the others adopt it.
         """
 
-        self.generate_key_pair()
+        if self.key_store is None:
+            self.generate_key_pair()
+            return
+
+        with self._generation_lock:
+            with self.key_store.lock():
+                self.load_from_store()
+                if self.is_expired():
+                    self.add_new_key_pair()
+
+    def can_sync(self) -> bool:
+        """
+        Returns true if the ring may be reloaded from the key store. Reloads are limited to one per sync interval so
+        that requests with unknown key ids cannot flood the store.
+        """
+
+        return (
+            self.key_store is not None
+            and time.time() - self._last_sync >= self.sync_interval
+        )
 
     def is_generated(self) -> bool:
         """
@@ -84,13 +317,52 @@ class RSA:
 
         return self._private_key is not None
 
-    @public_key.setter
-    def public_key(self, value: bytes) -> None:
+    def is_expired(self) -> bool:
+        """
+        Returns true if the current key-pair is older than the expire time.
+        """
+
+        return time.time() - self.generation_time >= self.expire_time
+
+    def rotate(self) -> None:
+        """
+        Runs one step of the rotator: generates the first key-pair, pre-generates the next one and rotates once the
+        current key-pair has expired.
+
+        :returns: None
         """
-        Sets the public key.
 
-        :param value: The value of the public key.
-        :return: None
+        self.sync()
+        self.ensure_key_pair()
+        self.prepare_next_key_pair()
+
+        if self.is_expired():
+            self.refresh_key_pair()
+            self.prepare_next_key_pair()
+
+    def start_rotation(self, interval: int = 60) -> None:
+        """
+        Starts the background rotator thread.
+
+        :param interval: Seconds between two rotator steps
+        :returns: None
+        """
+
+        if self._rotator is not None and self._rotator.is_alive():
+            return
+
+        def run():
+            while not self._stop_rotation.is_set():
+                self.rotate()
+                self._stop_rotation.wait(interval)
+
+        self._stop_rotation.clear()
+        self._rotator = threading.Thread(target=run, name="rsa-rotator", daemon=True)
+        self._rotator.start()
+
+    def stop_rotation(self) -> None:
+        """
+        Stops the background rotator thread.
         """
 
-        self._public_key = value
+        self._stop_rotation.set()
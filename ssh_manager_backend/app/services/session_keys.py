@@ -0,0 +1,112 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+
+
+"""
+This module provides a per-process store of request encryption keys which have already been unwrapped using the RSA
+private key. A client which has completed one RSA wrapped request receives an opaque session key id in the response and
+can send that id instead of the RSA wrapped key on later requests, which skips the RSA decryption completely.
+
+Only the key of a v2 envelope is stored. A v2 message is encrypted with a fresh nonce, so reusing its key is safe,
+while a v1 key comes with a fixed iv and would encrypt every later message with the same key and iv.
+"""
+
+
+class SessionKeyCache:
+    def __init__(self, enabled: bool = True, ttl: int = 900, max_entries: int = 10000):
+        self.enabled = enabled
+        self.ttl = ttl  # (in seconds)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._secret = os.urandom(32)
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key_id(self, key: bytes) -> str:
+        """
+        Derives the opaque session key id for the given key. The id is a keyed hash, so it does not reveal anything
+        about the key and cannot be forged without the per-process secret.
+
+        :param key: The request encryption key
+        :return: session key id
+        """
+
+        return hmac.new(self._secret, key, digestmod=hashlib.sha256).hexdigest()
+
+    def put(self, key: bytes) -> str:
+        """
+        Stores the key and returns the session key id. Storing an already present key only refreshes its position in
+        the LRU order, the expiry time is not extended.
+
+        :param key: The request encryption key of a v2 envelope
+        :return: session key id
+        """
+
+        key_id = self.key_id(key=key)
+
+        with self._lock:
+            if key_id in self._entries:
+                self._entries.move_to_end(key_id)
+                return key_id
+
+            self._entries[key_id] = (key, time.time() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return key_id
+
+    def get(self, key_id: str) -> Union[bytes, None]:
+        """
+        Returns the key stored against the session key id, or None if the id is unknown or has expired.
+
+        :param key_id: The session key id sent by the client
+        :return: key
+        """
+
+        with self._lock:
+            entry = self._entries.get(key_id)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            key, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key_id]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key_id)
+            self.hits += 1
+            return key
+
+    def clear(self) -> None:
+        """
+        Removes all the stored keys.
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Union[bool, int]]:
+        """
+        Returns the counters of the cache.
+        """
+
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
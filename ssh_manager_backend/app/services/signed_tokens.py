@@ -0,0 +1,265 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+
+
+"""
+This module provides an opt-in signed access token format, which carries the user id, the username, the admin flag and
+the expiry of the session, so that a request can be authenticated without querying the database.
+
+A token looks like "st1.<key id>.<claims>.<signature>", where the claims are base64url encoded JSON and the signature
+is a HMAC-SHA256 of everything before it. The signing keys rotate every expire time and the previous key is kept so
+that the tokens signed just before a rotation stay valid until they expire.
+
+When a key store (see the key_store service) is set, all the workers using that store share the signing keys. Logged out
+tokens are rejected using the revocation_filter service.
+"""
+
+
+def b64url_encode(data: bytes) -> str:
+    """
+    Encodes the data to unpadded base64url, which needs no escaping in the headers.
+    """
+
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def b64url_decode(data: str) -> bytes:
+    """
+    Decodes unpadded base64url data.
+    """
+
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SignedTokens:
+    __prefix__ = "st1"
+    __keylength__ = 32
+    kind = "token"
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl: int = 3600,
+        ring_size: int = 2,
+        key_store=None,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl  # (in seconds) lifetime of a token
+        self.expire_time = 24 * 3600  # (in seconds) lifetime of a signing key
+        self.ring_size = ring_size
+        self.key_store = key_store
+        self.sync_interval = 1  # (in seconds)
+        self.generation_time = 0
+        self._keys: "OrderedDict[str, bytes]" = OrderedDict()
+        self._current_key_id: Union[str, None] = None
+        self._last_sync = 0
+        self._generation_lock = threading.Lock()
+
+    @staticmethod
+    def compute_key_id(key: bytes) -> str:
+        """
+        Returns the key id of a signing key.
+
+        :param key:
+        :return: key id
+        """
+
+        return hashlib.sha256(key).hexdigest()[:16]
+
+    def add_key(self, key: bytes, generation_time: float = None) -> str:
+        """
+        Makes the given key the current signing key. The previous keys are kept for verification until they are
+        pushed out by newer ones.
+
+        :param key:
+        :param generation_time:
+        :return: key id
+        """
+
+        key_id: str = self.compute_key_id(key)
+
+        self._keys[key_id] = key
+        self._keys.move_to_end(key_id)
+        while len(self._keys) > self.ring_size:
+            self._keys.popitem(last=False)
+
+        self._current_key_id = key_id
+        self.generation_time = generation_time or time.time()
+
+        return key_id
+
+    def load_from_store(self) -> None:
+        """
+        Replaces the keys with the keys of the key store. The caller must hold the generation lock.
+
+        :returns: None
+        """
+
+        entries = self.key_store.load(kind=self.kind)
+        self._last_sync = time.time()
+        if not entries:
+            return
+
+        self._keys.clear()
+        for entry in entries:
+            self.add_key(entry["material"], generation_time=entry["generation_time"])
+
+    def add_new_key(self) -> None:
+        """
+        Generates a new signing key and publishes it to the key store. The caller must hold the generation lock.
+
+        :returns: None
+        """
+
+        key_id: str = self.add_key(os.urandom(self.__keylength__))
+
+        if self.key_store is not None:
+            self.key_store.publish(
+                kind=self.kind,
+                key_id=key_id,
+                material=self._keys[key_id],
+                generation_time=self.generation_time,
+                keep=self.ring_size,
+            )
+
+    def ensure_key(self) -> None:
+        """
+        Makes sure that there is a current signing key which has not expired. When a key store is shared, only the
+        first worker to get the lock generates the new key and the others adopt it.
+
+        :returns: None
+        """
+
+        if self._current_key_id is not None and not self.is_expired():
+            return
+
+        with self._generation_lock:
+            if self._current_key_id is not None and not self.is_expired():
+                return
+
+            if self.key_store is None:
+                self.add_new_key()
+                return
+
+            with self.key_store.lock():
+                self.load_from_store()
+                if self._current_key_id is None or self.is_expired():
+                    self.add_new_key()
+
+    def is_expired(self) -> bool:
+        """
+        Returns true if the current signing key is older than the expire time.
+        """
+
+        return time.time() - self.generation_time >= self.expire_time
+
+    def can_sync(self) -> bool:
+        """
+        Returns true if the keys may be reloaded from the key store. Reloads are limited to one per sync interval so
+        that tokens with unknown key ids cannot flood the store.
+        """
+
+        return (
+            self.key_store is not None
+            and time.time() - self._last_sync >= self.sync_interval
+        )
+
+    def signature(self, key: bytes, message: str) -> str:
+        """
+        Returns the encoded HMAC-SHA256 of the message.
+
+        :param key: The signing key
+        :param message:
+        :return: signature
+        """
+
+        return b64url_encode(
+            hmac.new(key, bytes(message, encoding="utf-8"), hashlib.sha256).digest()
+        )
+
+    def issue(self, user_id: int, username: str, admin: bool) -> Tuple[str, int]:
+        """
+        Issues a signed access token.
+
+        :param user_id:
+        :param username:
+        :param admin:
+        :return: access token and its expiry (in seconds since the epoch)
+        """
+
+        self.ensure_key()
+
+        expires_at: float = time.time() + self.ttl
+        claims: str = b64url_encode(
+            json.dumps(
+                {
+                    "uid": user_id,
+                    "sub": username,
+                    "adm": bool(admin),
+                    "exp": int(expires_at),
+                    "jti": os.urandom(8).hex(),
+                },
+                separators=(",", ":"),
+            ).encode()
+        )
+        key_id: str = self._current_key_id
+        message: str = ".".join([self.__prefix__, key_id, claims])
+
+        return (
+            message + "." + self.signature(self._keys[key_id], message),
+            int(expires_at),
+        )
+
+    def is_signed(self, access_token: str) -> bool:
+        """
+        Returns true if the access token has the signed format.
+        """
+
+        return access_token.startswith(self.__prefix__ + ".")
+
+    def verify(self, access_token: str) -> Union[Dict[str, any], None]:
+        """
+        Verifies the signature of the access token without any database access. The expiry is not checked here so
+        that the caller can tell an expired session from an invalid token.
+
+        :param access_token:
+        :return: claims of the token, None if the token is malformed or the signature does not match
+        """
+
+        parts = access_token.split(".")
+        if len(parts) != 4 or parts[0] != self.__prefix__:
+            return None
+
+        _, key_id, claims, signature = parts
+        key: Union[bytes, None] = self._keys.get(key_id)
+        if key is None and self.can_sync():
+            with self._generation_lock:
+                self.load_from_store()
+            key = self._keys.get(key_id)
+
+        if key is None:
+            return None
+
+        message: str = access_token[: -len(signature) - 1]
+        if not hmac.compare_digest(self.signature(key, message), signature):
+            return None
+
+        try:
+            return json.loads(b64url_decode(claims))
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def key_id(self) -> Union[str, None]:
+        """
+        Returns the key id of the current signing key.
+        """
+
+        return self._current_key_id
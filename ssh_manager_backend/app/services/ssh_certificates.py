@@ -0,0 +1,299 @@
+import base64
+import hashlib
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Tuple, Union
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+
+"""
+This module signs the users' public keys into short-lived OpenSSH user certificates(see PROTOCOL.certkeys of OpenSSH),
+so that granting or expiring access is a local signing operation instead of a push to the hosts. The hosts only need
+to trust the public key of the certificate authority once, as TrustedUserCAKeys, and again when it changes.
+
+The principals of a certificate are scoped to hosts, as "remote_user@host", and every host only accepts the principals
+naming itself(see AuthorizedPrincipalsFile in the trust_certificate_authority task). A certificate for a grant on one
+host can therefore not log in to another one as the same remote user.
+
+The certificate authority is an Ed25519 key-pair. When a key store (see the key_store service) is set, all the workers
+using that store share it; the store should then outlive the workers, as the hosts trust that one key. The private key
+is only stored encrypted with the passphrase, which must be set along with the store. The certificate authority is
+disabled until it is configured so(see app.py).
+"""
+
+CERTIFICATE_TYPES: Dict[str, str] = {
+    key_type: f"{key_type}-cert-v01@openssh.com"
+    for key_type in [
+        "ssh-rsa",
+        "ssh-ed25519",
+        "ecdsa-sha2-nistp256",
+        "ecdsa-sha2-nistp384",
+        "ecdsa-sha2-nistp521",
+    ]
+}
+USER_CERTIFICATE: int = 1
+# The permissions of a user certificate, as given by ssh-keygen by default
+EXTENSIONS: List[str] = [
+    "permit-X11-forwarding",
+    "permit-agent-forwarding",
+    "permit-port-forwarding",
+    "permit-pty",
+    "permit-user-rc",
+]
+
+
+def ssh_string(data: Union[bytes, str]) -> bytes:
+    """
+    Encodes a string of the SSH wire format: its length as an uint32, then its bytes.
+    """
+
+    if isinstance(data, str):
+        data = data.encode()
+
+    return struct.pack(">I", len(data)) + data
+
+
+def read_ssh_string(data: bytes, offset: int) -> Tuple[bytes, int]:
+    """
+    Decodes a string of the SSH wire format and returns it with the offset of what follows.
+    """
+
+    (length,) = struct.unpack(">I", data[offset : offset + 4])
+    end: int = offset + 4 + length
+    if end > len(data):
+        raise ValueError("Truncated SSH string")
+
+    return data[offset + 4 : end], end
+
+
+def public_key_blob(public_key: Union[bytes, str]) -> Tuple[str, bytes]:
+    """
+    Returns the key type and the wire format blob of a public key in OpenSSH("ssh-ed25519 AAAA...") or PEM format.
+
+    :param public_key:
+    :return: (key type, blob)
+    :raises ValueError: If the key can not be read or its type can not be certified
+    """
+
+    if isinstance(public_key, str):
+        public_key = public_key.encode()
+
+    public_key = public_key.strip()
+    if public_key.startswith(b"-----BEGIN"):
+        key = serialization.load_pem_public_key(public_key, backend=default_backend())
+        public_key = key.public_bytes(
+            encoding=serialization.Encoding.OpenSSH,
+            format=serialization.PublicFormat.OpenSSH,
+        )
+
+    fields: List[bytes] = public_key.split()
+    if len(fields) < 2:
+        raise ValueError("Invalid OpenSSH public key")
+
+    try:
+        blob: bytes = base64.b64decode(fields[1], validate=True)
+        key_type, _ = read_ssh_string(blob, 0)
+    except (ValueError, struct.error) as error:
+        raise ValueError("Invalid OpenSSH public key") from error
+
+    if key_type.decode(errors="replace") not in CERTIFICATE_TYPES:
+        raise ValueError(f"Keys of type {key_type!r} can not be certified")
+
+    return key_type.decode(), blob
+
+
+class SSHCertificateAuthority:
+    kind = "ssh_ca"
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        key_store=None,
+        passphrase: bytes = None,
+        max_validity: int = 3600,
+        clock_skew: int = 300,
+    ):
+        self.enabled = enabled
+        self.key_store = key_store
+        self.passphrase = passphrase  # encrypts the private key in the key store
+        self.max_validity = max_validity  # (in seconds) of a certificate
+        self.clock_skew = clock_skew  # (in seconds) tolerated between the clocks
+        self.issued = 0
+        self.generation_time = 0
+        self._private_key: Union[ed25519.Ed25519PrivateKey, None] = None
+        self._generation_lock = threading.Lock()
+
+    def generate_key_pair(self) -> None:
+        """
+        Generates an Ed25519 key-pair.
+
+        :returns: None
+        """
+
+        self._private_key = ed25519.Ed25519PrivateKey.generate()
+        self.generation_time = time.time()
+
+    def ensure_key_pair(self) -> None:
+        """
+        Generates the key-pair if it is not generated yet, or adopts the key-pair of the key store if one is set.
+
+        :returns: None
+        :raises RuntimeError: If a key store is set without a passphrase
+        """
+
+        if self.is_generated():
+            return
+
+        with self._generation_lock:
+            if self.is_generated():
+                return
+
+            if self.key_store is None:
+                self.generate_key_pair()
+                return
+
+            if not self.passphrase:
+                raise RuntimeError(
+                    "The private key of the certificate authority is only stored encrypted, set its passphrase"
+                )
+
+            with self.key_store.lock():
+                entries = self.key_store.load(kind=self.kind)
+                if entries:
+                    self._private_key = serialization.load_pem_private_key(
+                        data=entries[-1]["material"],
+                        password=self.passphrase,
+                        backend=default_backend(),
+                    )
+                    self.generation_time = entries[-1]["generation_time"]
+                    return
+
+                self.generate_key_pair()
+                self.key_store.publish(
+                    kind=self.kind,
+                    key_id=self.key_id,
+                    material=self._private_key.private_bytes(
+                        encoding=serialization.Encoding.PEM,
+                        format=serialization.PrivateFormat.PKCS8,
+                        encryption_algorithm=serialization.BestAvailableEncryption(
+                            self.passphrase
+                        ),
+                    ),
+                    generation_time=self.generation_time,
+                    keep=1,
+                )
+
+    def is_generated(self) -> bool:
+        """
+        Returns true is the key-pair is generated.
+        """
+
+        return self._private_key is not None
+
+    def public_key_bytes(self) -> bytes:
+        """
+        Returns the raw 32 byte public key.
+        """
+
+        return self._private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+        )
+
+    @property
+    def public_key(self) -> str:
+        """
+        Returns the public key in OpenSSH format, as installed on the hosts.
+        """
+
+        blob: bytes = ssh_string("ssh-ed25519") + ssh_string(self.public_key_bytes())
+        return f"ssh-ed25519 {base64.b64encode(blob).decode()} ssh-manager-ca"
+
+    @property
+    def key_id(self) -> str:
+        """
+        Returns the key id of the key-pair, which is the truncated SHA256 fingerprint of the public key.
+        """
+
+        return hashlib.sha256(self.public_key_bytes()).hexdigest()[:16]
+
+    def issue(
+        self,
+        public_key: Union[bytes, str],
+        key_id: str,
+        principals: List[str],
+        validity: int = None,
+    ) -> Tuple[str, int]:
+        """
+        Signs a public key into a user certificate.
+
+        :param public_key: The user's public key, in OpenSSH or PEM format
+        :param key_id: Identifies the certificate in the logs of the hosts
+        :param principals: The "remote_user@host" the certificate can log in as
+        :param validity: (in seconds) capped to max_validity, which is also the default
+        :return: certificate in OpenSSH format and the time it expires at
+        :raises ValueError: If the key can not be certified or there are no principals
+        """
+
+        if not principals:
+            raise ValueError("A certificate needs at least one principal")
+
+        self.ensure_key_pair()
+        key_type, blob = public_key_blob(public_key)
+        _, key_fields_offset = read_ssh_string(blob, 0)
+
+        now: int = int(time.time())
+        validity = min(validity or self.max_validity, self.max_validity)
+        valid_before: int = now + max(validity, 1)
+
+        certificate_type: str = CERTIFICATE_TYPES[key_type]
+        signed: bytes = b"".join(
+            [
+                ssh_string(certificate_type),
+                ssh_string(os.urandom(32)),  # nonce
+                blob[key_fields_offset:],
+                struct.pack(">Q", int.from_bytes(os.urandom(8), "big")),  # serial
+                struct.pack(">I", USER_CERTIFICATE),
+                ssh_string(key_id),
+                ssh_string(b"".join(ssh_string(principal) for principal in principals)),
+                struct.pack(">Q", max(now - self.clock_skew, 0)),
+                struct.pack(">Q", valid_before),
+                ssh_string(b""),  # critical options
+                ssh_string(
+                    b"".join(
+                        ssh_string(extension) + ssh_string(b"")
+                        for extension in sorted(EXTENSIONS)
+                    )
+                ),
+                ssh_string(b""),  # reserved
+                ssh_string(
+                    ssh_string("ssh-ed25519") + ssh_string(self.public_key_bytes())
+                ),
+            ]
+        )
+        signature: bytes = ssh_string("ssh-ed25519") + ssh_string(
+            self._private_key.sign(signed)
+        )
+        self.issued += 1
+
+        certificate: bytes = signed + ssh_string(signature)
+        return (
+            f"{certificate_type} {base64.b64encode(certificate).decode()} {key_id}",
+            valid_before,
+        )
+
+    def stats(self) -> Dict[str, Union[bool, int, str, None]]:
+        """
+        Returns the counters of the certificate authority.
+        """
+
+        return {
+            "enabled": self.enabled,
+            "generated": self.is_generated(),
+            "key_id": self.key_id if self.is_generated() else None,
+            "issued": self.issued,
+        }
@@ -1,12 +1,23 @@
+import hmac
+
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from ssh_manager_backend.app.services.aes import AES
+
 
 """
 This is sa utility file which contains functions which are called frequently in various files.
 """
 
+# Versions of the derivation of the key which encrypts the SSH keys from the dek. Version 1 stretched the random dek
+# with PBKDF2, version 2 uses HKDF as the dek is already a 32 byte random key.
+KDF_PBKDF2 = 1
+KDF_HKDF = 2
+CURRENT_KDF_VERSION = KDF_HKDF
+
 
 def hash_data(data: str or bytes, salt: bytes) -> bytes:
     """
@@ -30,6 +41,29 @@ def hash_data(data: str or bytes, salt: bytes) -> bytes:
     return digest.finalize()
 
 
+def matches_hash(data: str or bytes, hashed: str) -> bool:
+    """
+    Returns true if the data hashes(without salt) to the given hash, as stored for the SSH keys. The hash is the hex
+    digest, or the decoded digest for the keys stored before.
+
+    Parameters
+    ----------
+    data: str, bytes
+        The data to be checked
+    hashed: str
+        The stored hash
+    ----------
+    """
+
+    if not data or hashed is None:
+        return False
+
+    digest: bytes = hash_data(data=data, salt=b"")
+    return hmac.compare_digest(
+        digest.hex().encode(), hashed.encode()
+    ) or hmac.compare_digest(digest, hashed.encode())
+
+
 def pbkdf(data: str or bytes, salt: bytes) -> bytes:
     """
     Generates a key from the data and salt using the PBKDF2(Password based key derivation function) algorithm and returns the generated key(in bytes)
@@ -55,3 +89,100 @@ def pbkdf(data: str or bytes, salt: bytes) -> bytes:
     )
 
     return kdf.derive(data)
+
+
+def hkdf(data: bytes, salt: bytes) -> bytes:
+    """
+    Derives a key from high entropy input(like a random key) and salt using HKDF-SHA256 and returns the derived key(in
+    bytes). It must not be used for passwords, use pbkdf for them.
+
+    Parameters
+    ----------
+    data: bytes
+        The input key material
+    salt: bytes
+        The salt used for HKDF
+    ----------
+    """
+
+    kdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=b"ssh-key-manager dek",
+        backend=default_backend(),
+    )
+
+    return kdf.derive(data)
+
+
+def derive_dek_key(dek: bytes, salt: bytes, kdf_version: int = None) -> bytes:
+    """
+    Derives the key which encrypts the SSH keys from the dek using the given version of the derivation.
+
+    Parameters
+    ----------
+    dek: bytes
+        The decrypted dek of the user
+    salt: bytes
+        The salt for dek
+    kdf_version: int
+        The version of the derivation, rows stored before versioning have None which means KDF_PBKDF2
+    ----------
+    """
+
+    if kdf_version is None or kdf_version == KDF_PBKDF2:
+        return pbkdf(data=dek, salt=salt)
+
+    if kdf_version == KDF_HKDF:
+        return hkdf(data=dek, salt=salt)
+
+    raise ValueError(f"Unknown kdf version {kdf_version}")
+
+
+def encrypt_with_dek(
+    plaintext: str or bytes, dek: bytes, salt: bytes, iv: bytes
+) -> bytes:
+    """
+    Encrypts the data with the key derived from the dek using the current version of the derivation.
+
+    Parameters
+    ----------
+    plaintext: str, bytes
+        The data to be encrypted
+    dek: bytes
+        The decrypted dek of the user
+    salt: bytes
+        The salt for dek
+    iv: bytes
+        The iv for dek
+    ----------
+    """
+
+    key: bytes = derive_dek_key(dek=dek, salt=salt, kdf_version=CURRENT_KDF_VERSION)
+    return AES(key=key, iv=iv).encrypt(plaintext=plaintext)
+
+
+def decrypt_with_dek(
+    ciphertext: bytes, dek: bytes, salt: bytes, iv: bytes, kdf_version: int
+) -> bytes:
+    """
+    Decrypts the data with the key derived from the dek using the version of the derivation it was encrypted with.
+
+    Parameters
+    ----------
+    ciphertext: bytes
+        The data to be decrypted
+    dek: bytes
+        The decrypted dek of the user
+    salt: bytes
+        The salt for dek
+    iv: bytes
+        The iv for dek
+    kdf_version: int
+        The version of the derivation
+    ----------
+    """
+
+    key: bytes = derive_dek_key(dek=dek, salt=salt, kdf_version=kdf_version)
+    return AES(key=key, iv=iv).decrypt(ciphertext=ciphertext)
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+
+"""
+This is a wrapper around x25519 class of cryptography.hazmat.primitives.asymmetric and provides the functionality of
+generating a X25519 key-pair, serializing the public key and deriving the request key from the public key sent by the
+client using ECDH and HKDF. It is a cheaper alternative to the RSA transport key.
+
+When a key store (see the key_store service) is set, all the workers using that store share one key-pair.
+"""
+
+
+class X25519:
+    __info__ = b"ssh-key-manager request key"
+    __keylength__ = 32
+    kind = "x25519"
+
+    def __init__(self, key_store=None):
+        self._private_key = None
+        self._public_key = None
+        self.generation_time = 0
+        self.key_store = key_store
+        self._generation_lock = threading.Lock()
+
+    def generate_key_pair(self) -> None:
+        """
+        Generates a X25519 key-pair.
+
+        :returns: None
+        """
+
+        self._private_key = x25519.X25519PrivateKey.generate()
+        self._public_key = self._private_key.public_key()
+        self.generation_time = time.time()
+
+    def ensure_key_pair(self) -> None:
+        """
+        Generates the key-pair if it is not generated yet, or adopts the key-pair of the key store if one is set.
+
+        :returns: None
+        """
+
+        if self.is_generated():
+            return
+
+        with self._generation_lock:
+            if self.is_generated():
+                return
+
+            if self.key_store is None:
+                self.generate_key_pair()
+                return
+
+            with self.key_store.lock():
+                entries = self.key_store.load(kind=self.kind)
+                if entries:
+                    self._private_key = serialization.load_pem_private_key(
+                        data=entries[-1]["material"],
+                        password=None,
+                        backend=default_backend(),
+                    )
+                    self._public_key = self._private_key.public_key()
+                    self.generation_time = entries[-1]["generation_time"]
+                    return
+
+                self.generate_key_pair()
+                self.key_store.publish(
+                    kind=self.kind,
+                    key_id=self.key_id,
+                    material=self._private_key.private_bytes(
+                        encoding=serialization.Encoding.PEM,
+                        format=serialization.PrivateFormat.PKCS8,
+                        encryption_algorithm=serialization.NoEncryption(),
+                    ),
+                    generation_time=self.generation_time,
+                    keep=1,
+                )
+
+    def serialize_key(self) -> str:
+        """
+        Serializes the public key, encodes it to utf-8 format and returns it.
+
+        :returns: serialized public key
+        """
+
+        public_key_serialized: bytes = self._public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+
+        return public_key_serialized.decode("utf-8")
+
+    def public_key_bytes(self) -> bytes:
+        """
+        Returns the raw 32 byte public key.
+        """
+
+        return self._public_key.public_bytes(
+            encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+        )
+
+    def derive_key(self, peer_public_key: bytes) -> bytes:
+        """
+        Derives the request key from the raw ephemeral public key of the client. The shared secret is passed through
+        HKDF-SHA256 with both the public keys in the info so that the key is bound to this exchange.
+
+        :param peer_public_key: The raw 32 byte public key of the client
+        :return: derived key
+        """
+
+        shared_secret: bytes = self._private_key.exchange(
+            x25519.X25519PublicKey.from_public_bytes(peer_public_key)
+        )
+
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=self.__keylength__,
+            salt=None,
+            info=self.__info__ + peer_public_key + self.public_key_bytes(),
+            backend=default_backend(),
+        ).derive(shared_secret)
+
+    @property
+    def public_key(self) -> str:
+        """
+        Returns the serialized public key.
+        """
+
+        return self.serialize_key()
+
+    @property
+    def key_id(self) -> str:
+        """
+        Returns the key id of the key-pair, which is the truncated SHA256 fingerprint of the public key.
+        """
+
+        return hashlib.sha256(self.public_key_bytes()).hexdigest()[:16]
+
+    def is_generated(self) -> bool:
+        """
+        Returns true is the key-pair is generated.
+        """
+
+        return self._private_key is not None
@@ -3,19 +3,45 @@ from typing import Dict
 
 from flask import Blueprint, Response, request
 
-from ssh_manager_backend.app.controllers import UserController
-from ssh_manager_backend.app.services import rsa
+from ssh_manager_backend.app.controllers import AclController, UserController
+from ssh_manager_backend.app.services import (
+    change_listener,
+    crypto_executor,
+    dek_cache,
+    grant_coalescer,
+    grant_index,
+    host_index,
+    principal_cache,
+    revocations,
+    role_resolver,
+    rsa,
+    session_keys,
+    ssh_ca,
+    x25519,
+)
 
 rsa_ = Blueprint("rsa", __name__)
 users_ = Blueprint("users", __name__)
+metrics_ = Blueprint("metrics", __name__)
+acl_ = Blueprint("acl", __name__)
 
 
 @rsa_.route("/get_rsa_key", methods=["GET"])
 def rsa_handler() -> Response:
-    if not rsa.is_generated():
-        rsa.generate_key_pair()
-
-    return Response(response=json.dumps({"data": {"public_key": rsa.public_key}}))
+    rsa.ensure_key_pair()
+    x25519.ensure_key_pair()
+
+    return Response(
+        response=json.dumps(
+            {
+                "data": {
+                    "public_key": rsa.public_key,
+                    "key_id": rsa.key_id,
+                    "x25519_public_key": x25519.public_key,
+                }
+            }
+        )
+    )
 
 
 @users_.route("/register", methods=["POST"])
@@ -49,3 +75,92 @@ def is_logged_in():
     body: Dict[str, any] = json.loads(request.get_json())
     access_token: str = request.headers.get("access_token")
     return UserController(access_token=access_token).is_logged_in(body=body)
+
+
+@acl_.route("/users_with_access", methods=["POST"])
+def users_with_access_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).users_with_access(body=body)
+
+
+@acl_.route("/has_access", methods=["POST"])
+def has_access_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).has_access(body=body)
+
+
+@acl_.route("/register_host", methods=["POST"])
+def register_host_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).register_host(body=body)
+
+
+@acl_.route("/grant_group_access", methods=["POST"])
+def grant_group_access_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).grant_group_access(body=body)
+
+
+@acl_.route("/grant_access", methods=["POST"])
+def grant_access_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).grant_access(body=body)
+
+
+@acl_.route("/revoke_access", methods=["POST"])
+def revoke_access_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).revoke_access(body=body)
+
+
+@acl_.route("/revoke_all", methods=["POST"])
+def revoke_all_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).revoke_all(body=body)
+
+
+@acl_.route("/issue_certificate", methods=["POST"])
+def issue_certificate_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).issue_certificate(body=body)
+
+
+@acl_.route("/trust_certificate_authority", methods=["POST"])
+def trust_certificate_authority_handler() -> Response:
+    body: Dict[str, any] = json.loads(request.get_json())
+    access_token: str = request.headers.get("access_token")
+    return AclController(access_token=access_token).trust_certificate_authority(
+        body=body
+    )
+
+
+@metrics_.route("/metrics", methods=["GET"])
+def metrics_handler() -> Response:
+    return Response(
+        response=json.dumps(
+            {
+                "data": {
+                    "session_keys": session_keys.stats(),
+                    "dek_cache": dek_cache.stats(),
+                    "principal_cache": principal_cache.stats(),
+                    "crypto_executor": crypto_executor.stats(),
+                    "revocations": revocations.stats(),
+                    "grant_index": grant_index.stats(),
+                    "change_listener": change_listener.stats(),
+                    "grant_coalescer": grant_coalescer.stats(),
+                    "host_index": host_index.stats(),
+                    "role_resolver": role_resolver.stats(),
+                    "ssh_ca": ssh_ca.stats(),
+                }
+            }
+        ),
+        mimetype="application/json",
+    )
@@ -1,6 +1,19 @@
 import sys
 
 from ssh_manager_backend.db.database import init_db
-from ssh_manager_backend.db.schema import PrivateKey, PublicKey, Session, User
+from ssh_manager_backend.db.schema import (
+    AccessGrant,
+    GroupGrant,
+    Host,
+    PrivateKey,
+    PublicKey,
+    Role,
+    RoleGrant,
+    RoleMember,
+    RoleParent,
+    Session,
+    TransportKey,
+    User,
+)
 
 init_db()
@@ -1,4 +1,16 @@
-from sqlalchemy import ARRAY, Boolean, Column, ForeignKey, Integer, LargeBinary, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from ssh_manager_backend.db.database import Base
@@ -18,11 +30,15 @@ class User(Base):
     iv_for_kek = Column(LargeBinary, unique=True)
     salt_for_kek = Column(LargeBinary, unique=True)
     salt_for_password = Column(LargeBinary, unique=True)
-    private_key = relationship("PrivateKey", cascade="all,delete", backref="users")
-    public_key = relationship("PublicKey", cascade="all,delete", backref="users")
-    access_control = relationship(
-        "AccessControl", cascade="all,delete", backref="users"
+    private_key = relationship(
+        "PrivateKey", cascade="all,delete", backref="users", uselist=False
     )
+    public_key = relationship(
+        "PublicKey", cascade="all,delete", backref="users", uselist=False
+    )
+    access_grants = relationship("AccessGrant", cascade="all,delete", backref="users")
+    group_grants = relationship("GroupGrant", cascade="all,delete", backref="users")
+    role_memberships = relationship("RoleMember", cascade="all,delete", backref="users")
     session = relationship("Session", cascade="all,delete", backref="users")
 
     def __repr__(self) -> str:
@@ -39,6 +55,7 @@ class PrivateKey(Base):
     id = Column(Integer, primary_key=True)
     encrypted_private_key = Column(LargeBinary, unique=True)
     key_hash = Column(String, unique=True)
+    kdf_version = Column(Integer)
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User")
 
@@ -71,7 +88,7 @@ class PrivateKeyMapping(Base):
     __tablename__ = "private_key_mapping"
 
     id = Column(Integer, primary_key=True)
-    private_key_id = Column(String, ForeignKey("private_keys.id"))
+    private_key_id = Column(Integer, ForeignKey("private_keys.id"))
     ip_address = Column(String, unique=True)
     key = relationship("PrivateKey")
 
@@ -83,27 +100,182 @@ class PrivateKeyMapping(Base):
         return f"Key Mapping {self.id}"
 
 
-class AccessControl(Base):
-    __tablename__ = "access_control"
+class AccessGrant(Base):
+    __tablename__ = "access_grants"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "host", "remote_user", name="uq_access_grants_user_host"
+        ),
+        # Serves the reverse lookup of the users who can reach a host, in keyset order.
+        Index("ix_access_grants_host_user", "host", "user_id", "remote_user"),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(String, ForeignKey("users.id"))
-    ip_addresses = Column(ARRAY(String))
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    host = Column(String, nullable=False)
+    remote_user = Column(String, nullable=False, default="")
     user = relationship("User")
 
     def __repr__(self) -> str:
         """
-        :return: access_control id
+        :return: access grant id
+        """
+
+        return f"Access grant {self.id}"
+
+
+class Host(Base):
+    __tablename__ = "hosts"
+    __table_args__ = (Index("ix_hosts_labels", "labels", postgresql_using="gin"),)
+
+    id = Column(Integer, primary_key=True)
+    address = Column(String, unique=True, nullable=False)
+    zone = Column(String, index=True)
+    labels = Column(JSONB, nullable=False, default=dict)
+
+    def __repr__(self) -> str:
+        """
+        :return: host address
         """
 
-        return f"Access control {self.id}"
+        return f"Host {self.address}"
+
+
+class GroupGrant(Base):
+    __tablename__ = "group_grants"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "selector", "remote_user", name="uq_group_grants_user_selector"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    # Canonical label selector, e.g. "env=prod,role=db"
+    selector = Column(String, nullable=False)
+    remote_user = Column(String, nullable=False, default="")
+    user = relationship("User")
+
+    def __repr__(self) -> str:
+        """
+        :return: group grant id
+        """
+
+        return f"Group grant {self.id}"
+
+
+class Role(Base):
+    __tablename__ = "roles"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    grants = relationship("RoleGrant", cascade="all,delete", backref="roles")
+    members = relationship("RoleMember", cascade="all,delete", backref="roles")
+
+    def __repr__(self) -> str:
+        """
+        :return: role name
+        """
+
+        return f"Role {self.name}"
+
+
+class RoleParent(Base):
+    __tablename__ = "role_parents"
+    __table_args__ = (
+        UniqueConstraint("role_id", "parent_id", name="uq_role_parents_role_parent"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # The role inherits the grants of its parent.
+    role_id = Column(
+        Integer, ForeignKey("roles.id", ondelete="CASCADE"), nullable=False
+    )
+    parent_id = Column(
+        Integer, ForeignKey("roles.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+
+    def __repr__(self) -> str:
+        """
+        :return: role parent id
+        """
+
+        return f"Role parent {self.id}"
+
+
+class RoleGrant(Base):
+    __tablename__ = "role_grants"
+    __table_args__ = (
+        UniqueConstraint(
+            "role_id", "host", "remote_user", name="uq_role_grants_role_host"
+        ),
+        Index("ix_role_grants_host_role", "host", "role_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    role_id = Column(
+        Integer, ForeignKey("roles.id", ondelete="CASCADE"), nullable=False
+    )
+    host = Column(String, nullable=False)
+    remote_user = Column(String, nullable=False, default="")
+
+    def __repr__(self) -> str:
+        """
+        :return: role grant id
+        """
+
+        return f"Role grant {self.id}"
+
+
+class RoleMember(Base):
+    __tablename__ = "role_members"
+    __table_args__ = (
+        UniqueConstraint("user_id", "role_id", name="uq_role_members_user_role"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    role_id = Column(
+        Integer, ForeignKey("roles.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+
+    def __repr__(self) -> str:
+        """
+        :return: role member id
+        """
+
+        return f"Role member {self.id}"
 
 
 class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(Integer, primary_key=True)
-    username = Column(String, ForeignKey("users.username"))
-    access_token = Column(String, unique=True)
+    username = Column(String, ForeignKey("users.username"), index=True)
+    token_hash = Column(String(64), unique=True)
     active = Column(Boolean)
+    expires_at = Column(DateTime, index=True)
     user = relationship("User")
+
+
+class TransportKey(Base):
+    __tablename__ = "transport_keys"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, index=True)
+    key_id = Column(String, unique=True)
+    material = Column(LargeBinary)
+    generation_time = Column(Float)
+
+    def __repr__(self) -> str:
+        """
+        :return: transport key id
+        """
+
+        return f"Transport Key {self.key_id}"
@@ -1,2 +1,11 @@
-from tasks.grant_access import grant_access
-from tasks.revoke_access import revoke_access
+from tasks.grant_access import (
+    grant_access,
+    grant_access_batch,
+    grant_group_access,
+    trust_certificate_authority,
+)
+from tasks.revoke_access import (
+    revoke_access,
+    revoke_access_batch,
+    revoke_group_access,
+)
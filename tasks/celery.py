@@ -1,8 +1,19 @@
 from celery import Celery
 
-app = Celery("tasks", broker="amqp://localhost")
+app = Celery("tasks", broker="amqp://localhost", include=["tasks.sweep_sessions"])
 
 app.conf.update(
     task_serializer="json",
     result_serializer="json",
+    # The grant tasks run playbooks in private workspaces(see tasks.workspace), so the workers can run with the default
+    # concurrency of one process per core. Each process takes one task at a time, as the playbooks are long.
+    worker_prefetch_multiplier=1,
 )
+
+# Run with "celery -A tasks.celery beat" next to the workers.
+app.conf.beat_schedule = {
+    "sweep-expired-sessions": {
+        "task": "tasks.sweep_sessions.sweep_sessions",
+        "schedule": 300,  # (in seconds)
+    },
+}
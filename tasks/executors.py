@@ -0,0 +1,437 @@
+import asyncio
+import os
+import shlex
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Tuple, Union
+
+from tasks.workspace import SSH_CA_DIR, AnsibleWorkspace, PlaybookError, forks_for
+
+try:
+    import asyncssh
+except ImportError:  # asyncssh is only needed by the asyncio executor
+    asyncssh = None
+
+
+"""
+The executors push grants and revocations to the hosts. Both do what the grant and revoke playbooks do, for every host of
+a batch:
+
+- grant: copy the CA public keys(ssh_ca/<ca_name>.pub) to /etc/ssh, add them as TrustedUserCAKeys in sshd_config and
+  reload sshd
+- revoke: remove the CA public keys and their TrustedUserCAKeys lines, and reload sshd
+- trust: do what grant does, and make sshd accept the certificates of the users(see the ssh_certificates service) only
+  for the principals of /etc/ssh/auth_principals/<login user>: "<login user>@<host>" for each of the login_users of the
+  host, and "<login user>" alone for the certificates of the other CAs
+
+The Ansible executor runs the playbooks and stays the default. The asyncio executor talks SSH directly(with asyncssh,
+which must be installed), keeps the connections open for the next batches and works on at most max_in_flight hosts at a
+time. Its steps are idempotent: a file or line already in place is left untouched and sshd is only reloaded when
+something changed.
+
+Like lineinfile, the asyncio executor never edits a file in place: the new content is written to a temporary file next
+to it, which is validated with sshd -t for sshd_config and moved over the file. The file is read again just before the
+move, and if another push changed it meanwhile the edit is made again on the new content, so that concurrent pushes to
+a host do not lose each other's lines.
+
+Set SSH_EXECUTOR=asyncio to use the asyncio executor.
+"""
+
+SSHD_CONFIG: str = "/etc/ssh/sshd_config"
+SSHD: str = "/usr/sbin/sshd"
+PRINCIPALS_DIR: str = "/etc/ssh/auth_principals"
+PRINCIPALS_LINE: str = f"AuthorizedPrincipalsFile {PRINCIPALS_DIR}/%u"
+
+
+class HostResult(NamedTuple):
+    ok: bool
+    changed: bool = False
+    error: str = ""
+
+
+# Host variables of a batch: the ca_name of every host, several separated by commas for a grant or revocation, and for
+# a trust its login_users separated by commas
+HostVars = Dict[str, Dict[str, str]]
+
+
+class Executor(ABC):
+    operations = ("grant", "revoke", "trust")
+
+    @abstractmethod
+    def push(
+        self,
+        operation: str,
+        ssh_key: Union[bytes, str],
+        remote_user: str,
+        host_vars: HostVars,
+    ) -> Dict[str, HostResult]:
+        """
+        Grants or revokes the trust of the CA keys on the hosts.
+
+        Args:
+            operation: "grant", "revoke" or "trust"
+            ssh_key: The admin's SSH key used to connect
+            remote_user: The user to connect as
+            host_vars: The variables of every host
+
+        Returns: result of every host
+
+        """
+
+
+class AnsibleExecutor(Executor):
+    def push(
+        self,
+        operation: str,
+        ssh_key: Union[bytes, str],
+        remote_user: str,
+        host_vars: HostVars,
+    ) -> Dict[str, HostResult]:
+        """
+        Runs the playbook of the operation against all the hosts at once. The playbook only tells whether the whole run
+        succeeded, so every host gets the same result.
+        """
+
+        if operation not in self.operations:
+            raise ValueError(f"Unknown operation {operation}")
+
+        hosts: List[str] = list(host_vars)
+        try:
+            with AnsibleWorkspace() as workspace:
+                workspace.write_key(ssh_key=ssh_key)
+                workspace.write_inventory(hosts=hosts, host_vars=host_vars)
+                workspace.write_vars(remote_username=remote_user)
+                workspace.run_playbook(
+                    playbook=f"{operation}.yml", forks=forks_for(hosts)
+                )
+        except PlaybookError as error:
+            return {host: HostResult(ok=False, error=str(error)) for host in hosts}
+
+        return {host: HostResult(ok=True, changed=True) for host in hosts}
+
+
+class SSHConnection(ABC):
+    """
+    An open SSH connection to a host, as returned by the connect function of the asyncio executor.
+    """
+
+    @abstractmethod
+    async def run(self, command: str, input: str = None) -> Tuple[int, str]:
+        """
+        Runs a command and returns its exit status and output.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncSSHConnection(SSHConnection):
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def run(self, command: str, input: str = None) -> Tuple[int, str]:
+        result = await self.connection.run(command, input=input, check=False)
+        return result.exit_status, result.stdout or ""
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+async def asyncssh_connect(
+    host: str, remote_user: str, ssh_key: Union[bytes, str], **options
+) -> SSHConnection:
+    """
+    Opens an SSH connection with asyncssh, checking the host key against the known hosts like Ansible does.
+
+    Args:
+        host:
+        remote_user:
+        ssh_key:
+        **options: Other options of asyncssh.connect, e.g. the port or known_hosts
+
+    Returns: connection
+
+    """
+
+    if asyncssh is None:
+        raise RuntimeError("The asyncio executor needs asyncssh to be installed")
+
+    connection = await asyncssh.connect(
+        host,
+        username=remote_user,
+        client_keys=[asyncssh.import_private_key(ssh_key)],
+        **options,
+    )
+    return AsyncSSHConnection(connection)
+
+
+class AsyncSSHExecutor(Executor):
+    def __init__(
+        self,
+        connect: Callable[
+            [str, str, Union[bytes, str]], Awaitable[SSHConnection]
+        ] = asyncssh_connect,
+        max_in_flight: int = 100,
+        max_pool_size: int = 1000,
+        timeout: float = 60,
+        max_attempts: int = 5,
+    ):
+        self.connect = connect
+        self.max_in_flight = (
+            max_in_flight  # maximum number of hosts worked on at a time
+        )
+        self.max_pool_size = max_pool_size  # maximum number of connections kept open
+        self.timeout = timeout  # (in seconds) per host
+        self.max_attempts = max_attempts  # per file changed by another push meanwhile
+        self._loop = asyncio.new_event_loop()
+        # (host, remote user, ssh key) -> connection, least recently used first
+        self._pool: "OrderedDict[Tuple[str, str, Union[bytes, str]], SSHConnection]" = (
+            OrderedDict()
+        )
+
+    def push(
+        self,
+        operation: str,
+        ssh_key: Union[bytes, str],
+        remote_user: str,
+        host_vars: HostVars,
+    ) -> Dict[str, HostResult]:
+        """
+        Works on the hosts concurrently, at most max_in_flight at a time, over pooled connections.
+        """
+
+        if operation not in self.operations:
+            raise ValueError(f"Unknown operation {operation}")
+
+        return self._loop.run_until_complete(
+            self._push(operation, ssh_key, remote_user, host_vars)
+        )
+
+    async def _push(
+        self,
+        operation: str,
+        ssh_key: Union[bytes, str],
+        remote_user: str,
+        host_vars: HostVars,
+    ) -> Dict[str, HostResult]:
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def push_host(host: str) -> HostResult:
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self._push_host(
+                            operation, ssh_key, remote_user, host, host_vars[host]
+                        ),
+                        timeout=self.timeout,
+                    )
+                except Exception as error:
+                    # A connection which failed may be broken, the next batch opens a new one.
+                    self._discard((host, remote_user, ssh_key))
+                    return HostResult(
+                        ok=False, error=f"{type(error).__name__}: {error}"
+                    )
+
+        hosts: List[str] = list(host_vars)
+        results: List[HostResult] = await asyncio.gather(
+            *(push_host(host) for host in hosts)
+        )
+        self._trim_pool()
+
+        return dict(zip(hosts, results))
+
+    async def _connection(
+        self, host: str, remote_user: str, ssh_key: Union[bytes, str]
+    ) -> SSHConnection:
+        key = (host, remote_user, ssh_key)
+        connection: Union[SSHConnection, None] = self._pool.get(key)
+        if connection is None:
+            connection = await self.connect(host, remote_user, ssh_key)
+            self._pool[key] = connection
+        self._pool.move_to_end(key)
+
+        return connection
+
+    def _discard(self, key: Tuple[str, str, Union[bytes, str]]) -> None:
+        connection: Union[SSHConnection, None] = self._pool.pop(key, None)
+        if connection is not None:
+            connection.close()
+
+    def _trim_pool(self) -> None:
+        while len(self._pool) > self.max_pool_size:
+            _, connection = self._pool.popitem(last=False)
+            connection.close()
+
+    async def _push_host(
+        self,
+        operation: str,
+        ssh_key: Union[bytes, str],
+        remote_user: str,
+        host: str,
+        variables: Dict[str, str],
+    ) -> HostResult:
+        connection: SSHConnection = await self._connection(host, remote_user, ssh_key)
+        sudo: str = "" if remote_user == "root" else "sudo -n "
+        ca_names: List[str] = variables["ca_name"].split(",")
+        trust_lines: List[str] = [
+            f"TrustedUserCAKeys /etc/ssh/{ca_name}.pub" for ca_name in ca_names
+        ]
+
+        async def run(command: str, input: str = None) -> str:
+            status, output = await connection.run(sudo + command, input=input)
+            if status != 0:
+                raise RuntimeError(f"{command} exited with {status}")
+            return output
+
+        async def read(path: str) -> Union[str, None]:
+            status, output = await connection.run(sudo + f"cat -- {shlex.quote(path)}")
+            return output if status == 0 else None
+
+        async def replace(
+            path: str, content: str, original: Union[str, None], mode: str = None
+        ) -> bool:
+            """
+            Writes the content to a temporary file, validates it and moves it over the file, unless the file is no
+            longer the original content. Returns whether the file was replaced.
+            """
+
+            temporary: str = (
+                await run(f"mktemp -- {shlex.quote(path)}.XXXXXX")
+            ).strip()
+            try:
+                await run(f"tee -- {shlex.quote(temporary)} > /dev/null", input=content)
+                if mode is not None:
+                    await run(f"chmod {mode} -- {shlex.quote(temporary)}")
+                else:
+                    await run(
+                        f"chmod --reference={shlex.quote(path)} -- {shlex.quote(temporary)}"
+                    )
+                if path == SSHD_CONFIG:
+                    await run(f"{SSHD} -t -f {shlex.quote(temporary)}")
+
+                if await read(path) != original:
+                    return False
+
+                await run(f"mv -f -- {shlex.quote(temporary)} {shlex.quote(path)}")
+                temporary = None
+            finally:
+                if temporary is not None:
+                    await connection.run(sudo + f"rm -f -- {shlex.quote(temporary)}")
+
+            return True
+
+        async def edit(path: str, change: Callable[[str], str], **kwargs) -> bool:
+            """
+            Applies a change to the content of a file, again on the new content if another push replaced the file
+            meanwhile. Returns whether the file changed.
+            """
+
+            for _ in range(self.max_attempts):
+                original: Union[str, None] = await read(path)
+                content: str = change(original)
+                if content == original:
+                    return False
+                if await replace(path, content, original, **kwargs):
+                    return True
+
+            raise RuntimeError(f"{path} kept changing during the push")
+
+        def with_lines(
+            add: List[str] = (), remove: List[str] = (), create: bool = True
+        ) -> Callable[[Union[str, None]], str]:
+            """
+            Returns the change adding and removing whole lines of a file, which is created if missing and allowed.
+            """
+
+            def change(content: Union[str, None]) -> str:
+                if content is None and not create:
+                    raise RuntimeError("The file to change can not be read")
+                lines: List[str] = (content or "").splitlines()
+                if all(line in lines for line in add) and not any(
+                    line in lines for line in remove
+                ):
+                    return content
+                lines = [line for line in lines if line not in remove]
+                lines += [line for line in add if line not in lines]
+                return "\n".join(lines) + "\n"
+
+            return change
+
+        changed = False
+        if operation in ("grant", "trust"):
+            ca_public_keys: Dict[str, str] = {}
+            for ca_name in ca_names:
+                with open(
+                    os.path.join(SSH_CA_DIR, f"{ca_name}.pub")
+                ) as public_key_file:
+                    ca_public_keys[ca_name] = public_key_file.read()
+
+            sshd_lines: List[str] = list(trust_lines)
+            if operation == "trust":
+                for line in (await run(f"cat -- {SSHD_CONFIG}")).splitlines():
+                    if line.startswith("AuthorizedPrincipalsFile "):
+                        if line != PRINCIPALS_LINE:
+                            raise RuntimeError(f"{SSHD_CONFIG} has another {line}")
+
+                await run(f"mkdir -p -m 755 -- {PRINCIPALS_DIR}")
+                for login_user in variables["login_users"].split(","):
+                    changed |= await edit(
+                        f"{PRINCIPALS_DIR}/{login_user}",
+                        with_lines(add=[f"{login_user}@{host}", login_user]),
+                        mode="644",
+                    )
+                sshd_lines.append(PRINCIPALS_LINE)
+
+            # The keys and the principals are in place before sshd is told to use them.
+            for ca_name, ca_public_key in ca_public_keys.items():
+                changed |= await edit(
+                    f"/etc/ssh/{ca_name}.pub",
+                    lambda _, content=ca_public_key: content,
+                    mode="600",
+                )
+            changed |= await edit(SSHD_CONFIG, with_lines(add=sshd_lines, create=False))
+        else:
+            # sshd stops trusting the keys before they are removed.
+            changed |= await edit(
+                SSHD_CONFIG, with_lines(remove=trust_lines, create=False)
+            )
+            for ca_name in ca_names:
+                ca_file: str = f"/etc/ssh/{ca_name}.pub"
+                if await read(ca_file) is not None:
+                    await run(f"rm -f -- {shlex.quote(ca_file)}")
+                    changed = True
+
+        if changed:
+            await run("service ssh reload")
+
+        return HostResult(ok=True, changed=changed)
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections.
+        """
+
+        while self._pool:
+            _, connection = self._pool.popitem()
+            connection.close()
+
+
+_executor: Union[Executor, None] = None
+
+
+def get_executor() -> Executor:
+    """
+    Returns the executor of this worker process, chosen with SSH_EXECUTOR("ansible" by default, or "asyncio").
+
+    Returns: executor
+
+    """
+
+    global _executor
+    if _executor is None:
+        if os.environ.get("SSH_EXECUTOR", "ansible") == "asyncio":
+            _executor = AsyncSSHExecutor()
+        else:
+            _executor = AnsibleExecutor()
+
+    return _executor
@@ -1,54 +1,127 @@
+import hashlib
+import ipaddress
 import os
+from typing import Dict, List, Set, Tuple
 
-import yaml
-
-from ssh_manager_backend.app.models import AccessControlModel, UserModel
-from ssh_manager_backend.app.services import AES, utils
-from ssh_manager_backend.db import Key, User
+from ssh_manager_backend.app.models import AccessControlModel, Hosts, Users
+from ssh_manager_backend.db import PublicKey, User
 from tasks.celery import app
+from tasks.executors import HostResult, HostVars, get_executor
+from tasks.workspace import SSH_CA_DIR, PlaybookError
 
 
-def update_ansible_host_file(username: str, ip_address: str):
+def key_name(username: str, ip_address: str) -> str:
     """
-    Updates the ansible host file.
+    Returns the name of the CA key file of a user's grant of an ip address, network or group, which can not contain
+    the "/" of a CIDR block. Every user gets their own file, so that revoking the grant of a user never removes the
+    file the grant of another user relies on. The username is hashed as it may contain any character.
 
     Args:
         username:
-        ip_address
+        ip_address: ip address, network or group name
 
-    Returns:
+    Returns: key file name
 
     """
 
-    with open("./ansible/inventory", "w") as host_file:
-        host_file.write(
-            "[host:vars]\n"
-            f"ansible_ssh_private_key_file=./ansible/keys/admin_{ip_address}.pem\n\n"
-            "[host]\n"
-            f"{ip_address}\n"
-        )
+    user_tag: str = hashlib.sha256(bytes(username, encoding="utf-8")).hexdigest()[:16]
+    return f"admin_{user_tag}_{ip_address.replace('/', '_')}"
 
 
-def create_ssh_key_file(username: str, ssh_key: bytes, ip_address: str):
+def group_key_name(username: str, selector: str) -> str:
     """
-    Creates the pem file for SSH.
+    Returns the name of the CA key file of a user's group grant.
 
     Args:
         username:
-        ssh_key:
+        selector: canonical selector
+
+    Returns: key file name
+
+    """
+
+    return key_name(username, selector.replace("=", "-").replace(",", "_"))
+
+
+def expand_hosts(ip_address: str) -> List[str]:
+    """
+    Returns the hosts of a network in CIDR notation, or the ip address itself.
+
+    Args:
         ip_address:
 
+    Returns: list of hosts
+
+    """
+
+    if "/" not in ip_address:
+        return [ip_address]
+
+    return [str(host) for host in ipaddress.ip_network(ip_address).hosts()]
+
+
+def batch_inventory(grants: List[Tuple[str, str]]) -> Dict[str, Dict[str, str]]:
+    """
+    Returns the hosts of a batch with the names of their CA key files separated by commas, one for every user and ip
+    address or network the host was granted through, as in single grants.
+
+    Args:
+        grants: list of (username, ip address or network)
+
+    Returns: host vars of every host
+
+    """
+
+    ca_names: Dict[str, List[str]] = {}
+    for username, ip_address in dict.fromkeys(grants):
+        for host in expand_hosts(ip_address):
+            ca_names.setdefault(host, []).append(key_name(username, ip_address))
+
+    return {host: {"ca_name": ",".join(names)} for host, names in ca_names.items()}
+
+
+def push(
+    operation: str, ssh_key: bytes, remote_username: str, host_vars: HostVars
+) -> Set[str]:
+    """
+    Pushes a grant, revocation or trust to the hosts with the executor of the worker(see tasks.executors).
+
+    Args:
+        operation: "grant", "revoke" or "trust"
+        ssh_key:
+        remote_username:
+        host_vars: The variables of every host
+
+    Returns: the hosts which failed
+
+    """
+
+    results: Dict[str, HostResult] = get_executor().push(
+        operation, ssh_key, remote_username, host_vars
+    )
+    return {host for host, result in results.items() if not result.ok}
+
+
+def raise_for_failures(operation: str, failed: Set[str]) -> None:
+    """
+    Fails the task when hosts could not be pushed to, after what succeeded has been recorded.
+
+    Args:
+        operation:
+        failed: hosts which failed
+
     Returns:
 
     """
 
-    if not os.path.exists("./ansible/keys"):
-        os.mkdir("./ansible/keys")
+    if failed:
+        raise PlaybookError(
+            f"{operation} failed on {len(failed)} hosts: {', '.join(sorted(failed))}"
+        )
 
-    with open(f"./ansible/keys/admin_{ip_address}.pem", "w") as ssh_key_file:
-        ssh_key_file.write(ssh_key.decode())
 
-    os.system(f"chmod 400 ./ansible/keys/admin_{ip_address}.pem")
+# Name of the key file of the SSH certificate authority on the hosts
+CERTIFICATE_AUTHORITY_NAME: str = "ssh_manager_ca"
 
 
 def create_user_key_file(username: str):
@@ -62,8 +135,8 @@ def create_user_key_file(username: str):
 
     """
 
-    user: User = UserModel().get_user(username=username)
-    user_key: Key = user.public_key
+    user: User = Users().get_user(username=username)
+    user_key: PublicKey = user.public_key
 
     public_key: bytes = user_key.public_key
 
@@ -74,47 +147,147 @@ def create_user_key_file(username: str):
         public_key_file.write(public_key.decode())
 
 
-def update_ansible_vars(remote_username: str, username: str, ip_address: str):
+@app.task
+def grant_access(username: str, ssh_key: bytes, ip_address: str, remote_username: str):
     """
-    Updates the ansible variables.
+    Celery task for granting access to the given ip address, or to every host of a network in CIDR notation. The grant
+    is only recorded if every host succeeds.
 
     Args:
         remote_username:
         username:
+        ssh_key:
         ip_address:
 
     Returns:
 
     """
 
-    with open("./ansible/vars/params.yml") as yaml_file:
-        params = yaml.load(yaml_file)
-
-    params["remote_user"] = remote_username
-    params["ca_name"] = f"admin_{ip_address}"
+    failed: Set[str] = push(
+        "grant", ssh_key, remote_username, batch_inventory([(username, ip_address)])
+    )
+    raise_for_failures("grant", failed)
 
-    with open("./ansible/vars/params.yml", "w") as yaml_file:
-        yaml.dump(params, yaml_file)
+    AccessControlModel().grant_access(
+        username=username, ip_addresses=[ip_address], remote_user=remote_username
+    )
 
 
 @app.task
-def grant_access(username: str, ssh_key: bytes, ip_address: str, remote_username: str):
+def grant_group_access(
+    username: str, ssh_key: bytes, selector: str, remote_username: str
+):
     """
-    Celery task for granting access to the given ip address.
+    Celery task for granting access to every registered host matching a label selector. The key is installed on the
+    current members of the group and the grant is stored as a single row, which also covers the hosts that join the
+    group later.
 
     Args:
-        remote_username:
         username:
         ssh_key:
-        ip_address:
+        selector:
+        remote_username:
 
     Returns:
 
     """
 
-    create_ssh_key_file(username=username, ssh_key=ssh_key, ip_address=ip_address)
-    update_ansible_host_file(username=username, ip_address=ip_address)
-    update_ansible_vars(
-        remote_username=remote_username, username=username, ip_address=ip_address
+    members: List[str] = Hosts().members(selector=selector) or []
+
+    if members:
+        ca_name: str = group_key_name(username, selector)
+        failed: Set[str] = push(
+            "grant",
+            ssh_key,
+            remote_username,
+            {host: {"ca_name": ca_name} for host in members},
+        )
+        raise_for_failures("grant", failed)
+
+    AccessControlModel().grant_group_access(
+        username=username, selector=selector, remote_user=remote_username
     )
-    AccessControlModel().grant_access(username=username, ip_addresses=[ip_address])
+
+
+@app.task
+def grant_access_batch(
+    ssh_key: bytes, remote_username: str, grants: List[Tuple[str, str]]
+):
+    """
+    Celery task for granting a batch of (username, ip address) sharing the admin key and remote user, as coalesced by
+    the grant coalescer. Every host is pushed in one executor run, and the grants of each user are recorded with a
+    single insert. A grant is recorded when all of its hosts succeeded; the task fails afterwards if any host failed.
+
+    Args:
+        ssh_key:
+        remote_username:
+        grants: list of (username, ip address or network)
+
+    Returns: number of hosts
+
+    """
+
+    host_vars: Dict[str, Dict[str, str]] = batch_inventory(grants)
+    failed: Set[str] = push("grant", ssh_key, remote_username, host_vars)
+
+    ip_addresses_of_user: Dict[str, List[str]] = {}
+    for username, ip_address in grants:
+        if failed.isdisjoint(expand_hosts(ip_address)):
+            ip_addresses_of_user.setdefault(username, []).append(ip_address)
+
+    acl = AccessControlModel()
+    for username, ip_addresses in ip_addresses_of_user.items():
+        acl.grant_access(
+            username=username, ip_addresses=ip_addresses, remote_user=remote_username
+        )
+
+    raise_for_failures("grant", failed)
+
+    return len(host_vars)
+
+
+@app.task
+def trust_certificate_authority(
+    ssh_key: bytes,
+    ca_public_key: str,
+    ip_addresses: List[str],
+    remote_username: str,
+    login_users: List[str],
+):
+    """
+    Celery task for installing the public key of the SSH certificate authority as TrustedUserCAKeys on the given ip
+    addresses and networks. Every host then accepts, for each login user, the certificates naming "login_user@host"
+    (see AuthorizedPrincipalsFile in tasks.executors), so that the users' certificates are accepted without any further
+    push, and only by the hosts they are granted. Once a host reads its principals from these files, certificates are
+    refused for the login users which have none.
+
+    Args:
+        ssh_key:
+        ca_public_key: in OpenSSH format
+        ip_addresses:
+        remote_username:
+        login_users: The users the certificates log in as
+
+    Returns: number of hosts
+
+    """
+
+    os.makedirs(SSH_CA_DIR, exist_ok=True)
+    with open(
+        os.path.join(SSH_CA_DIR, f"{CERTIFICATE_AUTHORITY_NAME}.pub"), "w"
+    ) as public_key_file:
+        public_key_file.write(f"{ca_public_key}\n")
+
+    host_vars: HostVars = {
+        host: {
+            "ca_name": CERTIFICATE_AUTHORITY_NAME,
+            "login_users": ",".join(login_users),
+        }
+        for ip_address in ip_addresses
+        for host in expand_hosts(ip_address)
+    }
+    raise_for_failures(
+        "trust", push("trust", ssh_key, remote_username, host_vars=host_vars)
+    )
+
+    return len(host_vars)
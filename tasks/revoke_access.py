@@ -1,17 +1,153 @@
+import logging
+from typing import Dict, List, Set, Tuple, Union
+
+from ssh_manager_backend.app.models import AccessControlModel, Hosts
 from tasks.celery import app
+from tasks.executors import HostResult, HostVars, get_executor
+from tasks.grant_access import (
+    batch_inventory,
+    expand_hosts,
+    group_key_name,
+    push,
+    raise_for_failures,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def revoke(
+    ssh_key: bytes, remote_username: str, revocations: List[Tuple[str, str]]
+) -> Dict[str, Dict[str, any]]:
+    """
+    Removes the CA trust line and key file of every revocation from its hosts in one executor run, the hosts being
+    worked on in parallel. The CA key file of a user's grant of an ip address is shared by the grants of that user and
+    ip address for the other remote users, so it is only removed once the user has none of them left. The grants whose
+    hosts all succeeded are then deleted with a single statement; the others are kept, so that the revocation can be
+    retried.
+
+    Args:
+        ssh_key:
+        remote_username:
+        revocations: list of (username, ip address or network)
+
+    Returns: result of every host, as ok, changed and error
+
+    """
+
+    acl = AccessControlModel()
+    still_granted: Union[Set[Tuple[str, str]], None] = acl.still_granted(
+        revocations=revocations, remote_user=remote_username
+    )
+    if still_granted is None:
+        raise RuntimeError("Could not read the grants left after the revocation")
+
+    host_vars: HostVars = batch_inventory(
+        [revocation for revocation in revocations if revocation not in still_granted]
+    )
+    results: Dict[str, HostResult] = (
+        get_executor().push("revoke", ssh_key, remote_username, host_vars)
+        if host_vars
+        else {}
+    )
+    failed: Set[str] = {host for host, result in results.items() if not result.ok}
+
+    revoked: List[Tuple[str, str]] = [
+        (username, ip_address)
+        for username, ip_address in revocations
+        if failed.isdisjoint(expand_hosts(ip_address))
+    ]
+    if not acl.revoke_access_batch(revocations=revoked, remote_user=remote_username):
+        logger.error("Could not delete %d revoked grants", len(revoked))
+
+    if failed:
+        logger.warning(
+            "Revocation failed on %d of %d hosts: %s",
+            len(failed),
+            len(results),
+            ", ".join(sorted(failed)),
+        )
+
+    return {host: result._asdict() for host, result in results.items()}
+
+
+@app.task
+def revoke_access(
+    username: str, ssh_key: bytes, ip_addresses: List[str], remote_username: str
+):
+    """
+    Celery task for revoking the access of a user to the given ip addresses and networks. It is enqueued directly
+    instead of being coalesced, as revocations are latency sensitive.
+
+    Args:
+        username:
+        ssh_key:
+        ip_addresses:
+        remote_username:
+
+    Returns: result of every host
+
+    """
+
+    return revoke(
+        ssh_key=ssh_key,
+        remote_username=remote_username,
+        revocations=[(username, ip_address) for ip_address in ip_addresses],
+    )
+
+
+@app.task
+def revoke_access_batch(
+    ssh_key: bytes, remote_username: str, revocations: List[Tuple[str, str]]
+):
+    """
+    Celery task for revoking a batch of (username, ip address) sharing the admin key and remote user, as coalesced by
+    the grant coalescer.
+
+    Args:
+        ssh_key:
+        remote_username:
+        revocations: list of (username, ip address or network)
+
+    Returns: result of every host
+
+    """
+
+    return revoke(
+        ssh_key=ssh_key, remote_username=remote_username, revocations=revocations
+    )
 
 
 @app.task
-def revoke_access(ssh_key: bytes, ip_address):
+def revoke_group_access(
+    username: str, ssh_key: bytes, selector: str, remote_username: str
+):
     """
-    Celery task for revoking access to the given ip address.
+    Celery task for removing the CA key file of a group grant from the current members of the group, once the grant
+    was deleted(e.g. by revoke_all). The file is shared by the grants of the selector for all the remote users of the
+    user, so it is removed once for each selector.
 
     Args:
+        username:
         ssh_key:
-        ip_address:
+        selector: canonical selector
+        remote_username: The user to connect as
 
-    Returns:
+    Returns: number of hosts
 
     """
 
-    pass
+    members: Union[List[str], None] = Hosts().members(selector=selector)
+    if members is None:
+        raise RuntimeError("Could not read the members of the group")
+
+    if members:
+        ca_name: str = group_key_name(username, selector)
+        failed: Set[str] = push(
+            "revoke",
+            ssh_key,
+            remote_username,
+            {host: {"ca_name": ca_name} for host in members},
+        )
+        raise_for_failures("revoke", failed)
+
+    return len(members)
@@ -0,0 +1,37 @@
+import time
+
+from ssh_manager_backend.app.models import Sessions
+from ssh_manager_backend.db.database import db_session
+from tasks.celery import app
+
+
+@app.task
+def sweep_sessions(batch_size: int = 500, max_batches: int = 100, pause: float = 0.1):
+    """
+    Celery task for deleting the expired sessions. The sessions are deleted in small batches, each in its own short
+    transaction, with a pause in between so that the sweeper does not compete with the login path for the table.
+
+    Args:
+        batch_size: Number of sessions deleted per transaction.
+        max_batches: Maximum number of batches per run, the rest is left to the next run.
+        pause: Seconds to wait between two batches.
+
+    Returns: number of deleted sessions
+
+    """
+
+    sessions = Sessions()
+    deleted = 0
+
+    try:
+        for _ in range(max_batches):
+            batch_deleted: int = sessions.delete_expired(batch_size=batch_size)
+            deleted += batch_deleted
+            if batch_deleted < batch_size:
+                break
+
+            time.sleep(pause)
+    finally:
+        db_session.remove()
+
+    return deleted
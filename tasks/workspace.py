@@ -0,0 +1,225 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Union
+
+import yaml
+
+
+"""
+Every task builds its inventory, variables and key material in a private workspace, so that any number of tasks can
+run the playbooks at the same time. The workspace is created on tmpfs(/dev/shm) when available, so that the private
+key never reaches a disk, is only readable by the worker's user and is removed when the task completes.
+
+Set ANSIBLE_WORKSPACE_ROOT to create the workspaces in another directory, and ANSIBLE_MAX_FORKS to change the number of
+hosts a batched run works on in parallel.
+"""
+
+ANSIBLE_DIR: str = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "ansible")
+)
+SSH_CA_DIR: str = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "ssh_ca")
+)
+MAX_FORKS: int = int(os.environ.get("ANSIBLE_MAX_FORKS", "50"))
+
+
+class PlaybookError(RuntimeError):
+    pass
+
+
+def workspace_root() -> Union[str, None]:
+    """
+    Returns the directory in which the workspaces are created: ANSIBLE_WORKSPACE_ROOT if set, otherwise /dev/shm if it
+    is writable, otherwise the default temporary directory(None).
+
+    Returns: directory
+
+    """
+
+    root: Union[str, None] = os.environ.get("ANSIBLE_WORKSPACE_ROOT")
+    if root:
+        return root
+
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+
+    return None
+
+
+class AnsibleWorkspace:
+    def __init__(
+        self,
+        root: str = None,
+        ansible_playbook: str = "ansible-playbook",
+        timeout: int = 600,
+    ):
+        self.root = root if root is not None else workspace_root()
+        self.ansible_playbook = ansible_playbook
+        self.timeout = timeout  # (in seconds)
+        self.path: Union[str, None] = None
+
+    def __enter__(self) -> "AnsibleWorkspace":
+        # mkdtemp creates the directory readable by the owner only.
+        self.path = tempfile.mkdtemp(prefix="ansible-", dir=self.root)
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+    def file(self, name: str) -> str:
+        """
+        Returns the path of a file of the workspace.
+
+        Args:
+            name:
+
+        Returns: path
+
+        """
+
+        return os.path.join(self.path, name)
+
+    def write_key(self, ssh_key: Union[bytes, str]) -> str:
+        """
+        Writes the private key used to connect to the hosts, readable by the owner only.
+
+        Args:
+            ssh_key:
+
+        Returns: path of the key file
+
+        """
+
+        key_file: str = self.file("key.pem")
+        descriptor: int = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o400)
+        with os.fdopen(descriptor, "w") as ssh_key_file:
+            ssh_key_file.write(
+                ssh_key.decode() if isinstance(ssh_key, bytes) else ssh_key
+            )
+
+        return key_file
+
+    def write_inventory(
+        self, hosts: List[str], host_vars: Dict[str, Dict[str, str]] = None
+    ) -> str:
+        """
+        Writes the inventory of the hosts, connecting with the key of the workspace. It is written as YAML, so that a
+        host or a value can not add variables of its own.
+
+        Args:
+            hosts:
+            host_vars: Variables of each host, e.g. its ca_name in a batch
+
+        Returns: path of the inventory
+
+        """
+
+        host_vars = host_vars or {}
+        inventory: str = self.file("inventory.yml")
+        with open(inventory, "w") as yaml_file:
+            yaml.safe_dump(
+                {
+                    "host": {
+                        "hosts": {
+                            host: dict(host_vars.get(host, {})) for host in hosts
+                        },
+                        "vars": {"ansible_ssh_private_key_file": self.file("key.pem")},
+                    }
+                },
+                yaml_file,
+            )
+
+        return inventory
+
+    def write_vars(self, remote_username: str, ca_name: str = None) -> str:
+        """
+        Writes the variables of the playbook, on top of the defaults of ansible/vars/params.yml.
+
+        Args:
+            remote_username:
+            ca_name: Name of the CA key of every host, unless the inventory gives one per host
+
+        Returns: path of the variables file
+
+        """
+
+        with open(os.path.join(ANSIBLE_DIR, "vars", "params.yml")) as yaml_file:
+            params: Dict[str, any] = yaml.safe_load(yaml_file) or {}
+
+        params["remote_user"] = remote_username
+        if ca_name is not None:
+            params["ca_name"] = ca_name
+        else:
+            params.pop("ca_name", None)
+        params["ssh_ca_dir"] = SSH_CA_DIR
+
+        params_file: str = self.file("params.yml")
+        with open(params_file, "w") as yaml_file:
+            yaml.safe_dump(params, yaml_file)
+
+        return params_file
+
+    def run_playbook(self, playbook: str, forks: int = None) -> None:
+        """
+        Runs a playbook of ansible/playbooks against the inventory and variables of the workspace.
+
+        Args:
+            playbook: e.g. "grant.yml"
+            forks: Number of hosts worked on in parallel, the ansible default(5) if not given
+
+        Returns:
+
+        """
+
+        environment: Dict[str, str] = dict(
+            os.environ,
+            ANSIBLE_LOCAL_TEMP=self.file("tmp"),
+            ANSIBLE_RETRY_FILES_ENABLED="false",
+        )
+
+        command: List[str] = [
+            self.ansible_playbook,
+            "--inventory",
+            self.file("inventory.yml"),
+            "--extra-vars",
+            f"@{self.file('params.yml')}",
+        ]
+        if forks is not None:
+            command += ["--forks", str(forks)]
+        command.append(os.path.join(ANSIBLE_DIR, "playbooks", playbook))
+
+        try:
+            result = subprocess.run(
+                command,
+                cwd=self.path,
+                env=environment,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=self.timeout,
+            )
+        except (OSError, subprocess.TimeoutExpired) as error:
+            raise PlaybookError(f"{playbook} could not run: {error}") from error
+
+        if result.returncode != 0:
+            raise PlaybookError(
+                f"{playbook} failed with exit code {result.returncode}: "
+                f"{result.stdout.decode(errors='replace')[-2000:]}"
+            )
+
+
+def forks_for(hosts: List[str]) -> int:
+    """
+    Returns the number of forks of a run: one per host, up to MAX_FORKS.
+
+    Args:
+        hosts:
+
+    Returns: number of forks
+
+    """
+
+    return max(1, min(len(hosts), MAX_FORKS))
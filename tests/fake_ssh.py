@@ -0,0 +1,147 @@
+import asyncio
+import itertools
+import shlex
+from typing import Callable, Dict, List, Tuple, Union
+
+from tasks.executors import SSHConnection, asyncssh
+
+
+class FakeSSHServer:
+    """
+    An in-process stand-in for a fleet of SSH servers, which understands the commands of the asyncio executor. Every
+    host has its own files, and each command takes "latency" seconds like a round trip would. An sshd_config containing
+    "invalid_line" fails validation, and the hooks of a command run just before it, e.g. to simulate a concurrent push.
+
+    connect() skips SSH altogether, while listen() serves the same commands over a real asyncssh server on localhost so
+    that asyncssh_connect and AsyncSSHConnection are exercised too.
+    """
+
+    def __init__(self, latency: float = 0.0, sshd_config: str = "PermitRootLogin no\n"):
+        self.latency = latency
+        self.sshd_config = sshd_config
+        self.files: Dict[str, Dict[str, str]] = {}
+        self.modes: Dict[Tuple[str, str], int] = {}
+        self.reloads: Dict[str, int] = {}
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.unreachable: List[str] = []
+        self.invalid_line: Union[str, None] = None
+        self.hooks: Dict[str, Callable[[str], None]] = {}  # command -> hook(host)
+        self._temporary = itertools.count()
+
+    async def connect(
+        self, host: str, remote_user: str, ssh_key: Union[bytes, str]
+    ) -> "FakeConnection":
+        await asyncio.sleep(self.latency)
+        if host in self.unreachable:
+            raise ConnectionRefusedError(f"{host} is unreachable")
+
+        self.connections += 1
+        self.files.setdefault(host, {"/etc/ssh/sshd_config": self.sshd_config})
+        return FakeConnection(server=self, host=host)
+
+    async def listen(self, host_key, client_key):
+        """
+        Starts an asyncssh server on a free port of 127.0.0.1, accepting the client key, and returns it.
+        """
+
+        server = self
+
+        class Server(asyncssh.SSHServer):
+            def connection_made(self, connection):
+                server.connections += 1
+                server.files.setdefault(
+                    "127.0.0.1", {"/etc/ssh/sshd_config": server.sshd_config}
+                )
+
+        async def handle(process) -> None:
+            arguments: List[str] = shlex.split(process.command)
+            # stdin is only closed by the client when it sends an input, which only tee reads.
+            input: Union[str, None] = (
+                await process.stdin.read() if "tee" in arguments else None
+            )
+            status, output = FakeConnection(server=self, host="127.0.0.1").execute(
+                arguments, input
+            )
+            process.stdout.write(output)
+            process.exit(status)
+
+        return await asyncssh.listen(
+            "127.0.0.1",
+            0,
+            server_factory=Server,
+            server_host_keys=[host_key],
+            authorized_client_keys=asyncssh.import_authorized_keys(
+                client_key.export_public_key().decode()
+            ),
+            process_factory=handle,
+        )
+
+
+class FakeConnection(SSHConnection):
+    def __init__(self, server: FakeSSHServer, host: str):
+        self.server = server
+        self.host = host
+
+    async def run(self, command: str, input: str = None) -> Tuple[int, str]:
+        server = self.server
+        server.in_flight += 1
+        server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            await asyncio.sleep(server.latency)
+            return self.execute(shlex.split(command), input)
+        finally:
+            server.in_flight -= 1
+
+    def execute(self, arguments: List[str], input: str = None) -> Tuple[int, str]:
+        files: Dict[str, str] = self.server.files[self.host]
+        if arguments[:2] == ["sudo", "-n"]:
+            arguments = arguments[2:]
+        if arguments[-2:] == [">", "/dev/null"]:
+            arguments = arguments[:-2]
+
+        modes: Dict[Tuple[str, str], int] = self.server.modes
+        command, path = arguments[0], arguments[-1]
+        if command in self.server.hooks:
+            self.server.hooks[command](self.host)
+
+        if command == "cat":
+            return (0, files[path]) if path in files else (1, "")
+        if command == "tee":
+            files[path] = input
+            return 0, ""
+        if command == "mktemp":
+            path = path.replace("XXXXXX", f"{next(self.server._temporary):06d}")
+            files[path] = ""
+            modes[(self.host, path)] = 0o600
+            return 0, f"{path}\n"
+        if command == "chmod":
+            if arguments[1].startswith("--reference="):
+                reference: str = arguments[1][len("--reference=") :]
+                if reference not in files:
+                    return 1, ""
+                modes[(self.host, path)] = modes.get((self.host, reference), 0o644)
+            else:
+                modes[(self.host, path)] = int(arguments[1], 8)
+            return 0, ""
+        if command == "mv":
+            source, target = arguments[-2:]
+            files[target] = files.pop(source)
+            modes[(self.host, target)] = modes.pop((self.host, source), 0o600)
+            return 0, ""
+        if command == "mkdir":
+            return 0, ""
+        if command == "rm":
+            files.pop(path, None)
+            modes.pop((self.host, path), None)
+            return 0, ""
+        if arguments[:3] == ["/usr/sbin/sshd", "-t", "-f"]:
+            invalid_line: Union[str, None] = self.server.invalid_line
+            valid: bool = invalid_line is None or invalid_line not in files[path]
+            return (0, "") if valid else (255, "")
+        if arguments == ["service", "ssh", "reload"]:
+            self.server.reloads[self.host] = self.server.reloads.get(self.host, 0) + 1
+            return 0, ""
+
+        return 127, ""
@@ -2,6 +2,8 @@ from ssh_manager_backend import __version__
 from ssh_manager_backend.db.database import db_session
 
 from ssh_manager_backend.db.schema import (  # AccessControl,; Key,; KeyMapping,
+    Host,
+    Role,
     Session,
     User,
 )
@@ -14,6 +16,8 @@ def test_version():
 def db_cleanup():
     session = db_session()
     session.query(Session).delete()
+    session.query(Host).delete()
+    session.query(Role).delete()
     # session.query(AccessControl).delete()
     # session.query(KeyMapping).delete()
     # session.query(Key).delete()
@@ -0,0 +1,58 @@
+from ssh_manager_backend.app.services.access_matrix import AccessMatrix, bit_positions
+from ssh_manager_backend.app.services.grant_index import GrantIndex
+
+
+class TestAccessMatrix:
+    def test_bit_positions(self):
+        assert bit_positions(0) == []
+        assert bit_positions(0b101001) == [0, 3, 5]
+        assert bit_positions(1 << 1000) == [1000]
+
+    def test_set_operations(self):
+        matrix = AccessMatrix()
+        for username, host in [
+            ("alice", "10.0.0.1"),
+            ("alice", "10.0.0.2"),
+            ("bob", "10.0.0.2"),
+            ("bob", "10.0.1.1"),
+            ("carol", "10.0.1.1"),
+            ("carol", "10.0.0.3"),
+        ]:
+            matrix.set(username, host)
+
+        assert matrix.hosts_reachable(any_of=["alice", "carol"], none_of=["bob"]) == [
+            "10.0.0.1",
+            "10.0.0.3",
+        ]
+        assert matrix.hosts_reachable(any_of=["unknown"]) == []
+
+        prod = ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+        staging = ["10.0.1.1"]
+        assert matrix.users_reaching(host_groups=[prod, staging]) == ["bob", "carol"]
+        assert matrix.users_reaching(
+            host_groups=[prod, staging], excluding=["10.0.0.3"]
+        ) == ["bob"]
+        assert matrix.users_reaching(host_groups=[]) == []
+
+        matrix.clear("bob", "10.0.1.1")
+        assert matrix.users_reaching(host_groups=[prod, staging]) == ["carol"]
+        assert matrix.stats() == {"users": 3, "hosts": 4, "pairs": 5}
+
+    def test_grant_index_keeps_the_matrix(self):
+        grant_index = GrantIndex()
+        grant_index.load([("alice", "10.0.0.1"), ("bob", "10.0.0.1")])
+
+        # The host stays reachable until the last grant(one per remote user) is removed.
+        grant_index.add(username="alice", hosts=["10.0.0.2", "10.0.0.2"])
+        grant_index.remove(username="alice", hosts=["10.0.0.2"])
+        assert grant_index.matrix.hosts_reachable(any_of=["alice"]) == [
+            "10.0.0.1",
+            "10.0.0.2",
+        ]
+
+        grant_index.remove(username="alice", hosts=["10.0.0.2"])
+        grant_index.remove(username="bob", hosts=["10.0.0.1"])
+        assert grant_index.matrix.hosts_reachable(any_of=["alice"]) == ["10.0.0.1"]
+        assert grant_index.matrix.users_reaching(host_groups=[["10.0.0.1"]]) == [
+            "alice"
+        ]
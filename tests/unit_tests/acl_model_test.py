@@ -3,7 +3,8 @@ from typing import List
 import pytest
 
 from ssh_manager_backend.app.models.access_control import AccessControlModel
-from ssh_manager_backend.app.models.user import UserModel
+from ssh_manager_backend.app.models.hosts import Hosts
+from ssh_manager_backend.app.models.user import Users
 from tests.test_ssh_manager_backend import db_cleanup
 
 
@@ -15,7 +16,7 @@ class TestAccessControlModel:
 
     def test_create(self):
         acl: AccessControlModel = AccessControlModel()
-        user: UserModel = UserModel()
+        user: Users = Users()
 
         name: str = "test_user"
         username = "test_username"
@@ -28,7 +29,7 @@ class TestAccessControlModel:
         salt_for_kek: bytes = b"test_salt_for_kek"
         salt_for_password: bytes = b"test_salt_for_password"
 
-        assert acl.create(username=username) is False
+        assert acl.user_id(username=username) is None
 
         assert (
             user.create(
@@ -46,7 +47,7 @@ class TestAccessControlModel:
             is True
         )
 
-        assert acl.create(username=username) is True
+        assert isinstance(acl.user_id(username=username), int)
 
     def test_grant_access(self):
         acl: AccessControlModel = AccessControlModel()
@@ -64,6 +65,229 @@ class TestAccessControlModel:
 
         assert sorted(acl.get_all_ips(username=username)) == sorted(ip_addresses)
 
+    def test_has_access(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert (
+            acl.grant_access(
+                username=username, ip_addresses=["1.1.1.1"], remote_user="ubuntu"
+            )
+            is True
+        )
+        assert (
+            acl.grant_access(
+                username=username, ip_addresses=["1.1.1.1"], remote_user="ubuntu"
+            )
+            is True
+        )
+
+        assert acl.has_access(username=username, ip_address="1.1.1.1") is True
+        assert (
+            acl.has_access(
+                username=username, ip_address="1.1.1.1", remote_user="ubuntu"
+            )
+            is True
+        )
+        assert (
+            acl.has_access(username=username, ip_address="1.1.1.1", remote_user="root")
+            is False
+        )
+        assert acl.has_access(username=username, ip_address="8.8.8.8") is False
+        assert acl.get_grants(username=username) == [
+            ("1.0.0.1", ""),
+            ("1.1.1.1", ""),
+            ("1.1.1.1", "ubuntu"),
+        ]
+
+    def test_has_access_batch(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert acl.has_access_batch(
+            pairs=[
+                (username, "8.8.8.8"),
+                (username, "1.1.1.1"),
+                ("non_existent_username", "1.1.1.1"),
+                (username, "1.0.0.1"),
+            ]
+        ) == [False, True, False, True]
+        assert acl.has_access_batch(pairs=[]) == []
+
+        with pytest.raises(ValueError):
+            acl.has_access_batch(
+                pairs=[(username, "1.1.1.1")] * (acl.max_batch_size + 1)
+            )
+
+    def test_users_with_access(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        first_page = acl.users_with_access(
+            hosts=["1.1.1.1", "1.0.0.1", "8.8.8.8"], limit=1
+        )
+
+        assert first_page["1.0.0.1"] == ([(username, "")], None)
+        assert first_page["8.8.8.8"] == ([], None)
+        assert first_page["1.1.1.1"][0] == [(username, "")]
+
+        second_page = acl.users_with_access(
+            hosts=["1.1.1.1"], limit=1, cursors={"1.1.1.1": first_page["1.1.1.1"][1]}
+        )
+
+        assert second_page["1.1.1.1"] == ([(username, "ubuntu")], None)
+
+    def test_set_operations(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert acl.hosts_reachable(any_of=[username]) == ["1.0.0.1", "1.1.1.1"]
+        assert acl.hosts_reachable(any_of=[username], none_of=[username]) == []
+        assert acl.users_reaching(host_groups=[["1.1.1.1"], ["1.0.0.1"]]) == [username]
+        assert (
+            acl.users_reaching(host_groups=[["1.1.1.1"]], excluding=["1.0.0.1"]) == []
+        )
+
+    def test_group_access(self):
+        acl: AccessControlModel = AccessControlModel()
+        hosts: Hosts = Hosts()
+        username: str = "test_username"
+
+        assert hosts.register(address="10.1.0.1", labels={"role": "db"}, zone="eu-1")
+        assert hosts.register(address="10.1.0.2", labels={"role": "web"}, zone="eu-1")
+        assert hosts.members(selector="zone=eu-1, role=db") == ["10.1.0.1"]
+
+        assert acl.grant_group_access(username=username, selector="zone=eu-1,role=db")
+        assert acl.get_group_grants(username=username) == [("role=db,zone=eu-1", "")]
+        assert acl.has_access(username=username, ip_address="10.1.0.1")
+        assert not acl.has_access(username=username, ip_address="10.1.0.2")
+
+        # A host joining the group is covered by the existing grant.
+        assert hosts.register(address="10.1.0.2", labels={"role": "db"}, zone="eu-1")
+        assert acl.has_access_batch(
+            pairs=[(username, "10.1.0.2"), (username, "10.1.0.3")]
+        ) == [True, False]
+
+        assert acl.revoke_group_access(username=username, selector="role=db,zone=eu-1")
+        assert not acl.has_access(username=username, ip_address="10.1.0.1")
+
+        assert acl.grant_group_access(username=username, selector="role=db")
+        assert acl.grant_group_access(username=username, selector="zone=eu-1")
+        assert acl.revoke_all_group_access(username=username)
+        assert acl.get_group_grants(username=username) == []
+
+    def test_certificate_principals(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.3.0.1"], remote_user="deploy"
+        )
+        assert acl.grant_group_access(
+            username=username, selector="role=db", remote_user="postgres"
+        )
+
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.4.0.0/30"], remote_user="ops"
+        )
+
+        # The principals name the hosts, the ones of a network one by one.
+        principals = acl.certificate_principals(username=username, limit=100)
+        assert "deploy@10.3.0.1" in principals and "postgres@10.1.0.1" in principals
+        assert "ops@10.4.0.1" in principals and "ops@10.4.0.2" in principals
+        assert "deploy" not in principals
+        assert not any(principal.startswith("@") for principal in principals)
+        assert len(acl.certificate_principals(username=username, limit=1)) == 2
+        assert (
+            acl.certificate_principals(username="non_existent_username", limit=100)
+            == []
+        )
+
+        assert acl.revoke_access(
+            username=username, ip_addresses=["10.3.0.1"], remote_user="deploy"
+        )
+        assert acl.revoke_access(
+            username=username, ip_addresses=["10.4.0.0/30"], remote_user="ops"
+        )
+        assert acl.revoke_group_access(username=username, selector="role=db")
+
+    def test_revoke_access_batch(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.2.0.1", "10.2.0.2"], remote_user="ops"
+        )
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.2.0.1"], remote_user="root"
+        )
+
+        assert acl.revoke_access_batch(
+            revocations=[
+                (username, "10.2.0.1"),
+                (username, "10.2.0.2"),
+                ("non_existent_username", "10.2.0.1"),
+            ],
+            remote_user="ops",
+        )
+        assert acl.has_access(username=username, ip_address="10.2.0.1")
+        assert not acl.has_access(username=username, ip_address="10.2.0.2")
+
+        assert acl.revoke_access_batch(revocations=[(username, "10.2.0.1")])
+        assert not acl.has_access(username=username, ip_address="10.2.0.1")
+        assert acl.revoke_access_batch(revocations=[])
+
+    def test_has_access_network(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.9.0.0/24"], remote_user="ops"
+        )
+
+        # A remote user is only matched in the database, which includes the networks.
+        assert acl.has_access(
+            username=username, ip_address="10.9.0.7", remote_user="ops"
+        )
+        assert not acl.has_access(
+            username=username, ip_address="10.9.1.7", remote_user="ops"
+        )
+        assert acl._has_direct_access_batch(
+            pairs=[(username, "10.9.0.7"), (username, "10.9.1.7")]
+        ) == [True, False]
+
+        assert acl.revoke_access(
+            username=username, ip_addresses=["10.9.0.0/24"], remote_user="ops"
+        )
+
+    def test_still_granted(self):
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.5.0.1", "10.5.0.2"], remote_user="ops"
+        )
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.5.0.1"], remote_user="root"
+        )
+
+        # The other remote user keeps the CA key file of 10.5.0.1 on the host.
+        revocations = [(username, "10.5.0.1"), (username, "10.5.0.2")]
+        assert acl.still_granted(revocations=revocations, remote_user="ops") == {
+            (username, "10.5.0.1")
+        }
+        assert acl.still_granted(revocations=revocations) == set()
+
+        # The grants of another user do not keep the file of this user.
+        assert (
+            acl.still_granted(
+                revocations=[("other_username", "10.5.0.1")], remote_user="ops"
+            )
+            == set()
+        )
+
+        assert acl.revoke_access_batch(revocations=revocations)
+
     def test_revoke_access(self, cleanup):
         acl: AccessControlModel = AccessControlModel()
         username: str = "test_username"
@@ -86,3 +310,6 @@ class TestAccessControlModel:
         )
 
         assert acl.get_all_ips(username=username) == [ip_addresses[1]]
+
+        assert acl.revoke_access(username=username, ip_addresses=[], revoke_all=True)
+        assert acl.get_all_ips(username=username) == []
@@ -0,0 +1,75 @@
+import os
+import stat
+
+import pytest
+import yaml
+
+from tasks.workspace import MAX_FORKS, AnsibleWorkspace, PlaybookError, forks_for
+
+
+class TestAnsibleWorkspace:
+    def test_private_files(self, tmp_path):
+        with AnsibleWorkspace(root=str(tmp_path)) as workspace:
+            key_file: str = workspace.write_key(ssh_key=b"test_ssh_key")
+            inventory: str = workspace.write_inventory(hosts=["10.0.0.1", "10.0.0.2"])
+            params_file: str = workspace.write_vars(
+                remote_username="ubuntu", ca_name="admin_10.0.0.1"
+            )
+
+            assert stat.S_IMODE(os.stat(workspace.path).st_mode) == 0o700
+            assert stat.S_IMODE(os.stat(key_file).st_mode) == 0o400
+            with open(inventory) as yaml_file:
+                assert yaml.safe_load(yaml_file)["host"]["vars"] == {
+                    "ansible_ssh_private_key_file": key_file
+                }
+            with open(params_file) as yaml_file:
+                assert "remote_user: ubuntu\n" in yaml_file.read()
+
+            path: str = workspace.path
+
+        assert not os.path.exists(path)
+
+    def test_concurrent_workspaces(self, tmp_path):
+        with AnsibleWorkspace(root=str(tmp_path)) as first:
+            with AnsibleWorkspace(root=str(tmp_path)) as second:
+                first.write_inventory(hosts=["10.0.0.1"])
+                second.write_inventory(hosts=["10.0.0.2"])
+
+                with open(first.file("inventory.yml")) as host_file:
+                    assert "10.0.0.2" not in host_file.read()
+
+    def test_batch_inventory(self, tmp_path):
+        with AnsibleWorkspace(root=str(tmp_path)) as workspace:
+            workspace.write_inventory(
+                hosts=["10.0.0.1", "10.0.0.2"],
+                host_vars={"10.0.0.1": {"ca_name": "admin_10.0.0.1"}},
+            )
+
+            with open(workspace.file("inventory.yml")) as yaml_file:
+                assert yaml.safe_load(yaml_file)["host"]["hosts"] == {
+                    "10.0.0.1": {"ca_name": "admin_10.0.0.1"},
+                    "10.0.0.2": {},
+                }
+
+            # A host or a value can not add variables of its own.
+            workspace.write_inventory(
+                hosts=["10.0.0.1 ansible_ssh_common_args=-oProxyCommand=x"],
+                host_vars={"10.0.0.1": {"ca_name": "a\nansible_user=root"}},
+            )
+            with open(workspace.file("inventory.yml")) as yaml_file:
+                assert list(yaml.safe_load(yaml_file)["host"]["hosts"].values()) == [{}]
+
+        assert forks_for(["10.0.0.1"]) == 1
+        assert (
+            forks_for([f"10.0.{i // 256}.{i % 256}" for i in range(1000)]) == MAX_FORKS
+        )
+
+    def test_run_playbook(self, tmp_path):
+        with AnsibleWorkspace(root=str(tmp_path), ansible_playbook="true") as workspace:
+            workspace.run_playbook(playbook="grant.yml", forks=10)
+
+        with pytest.raises(PlaybookError):
+            with AnsibleWorkspace(
+                root=str(tmp_path), ansible_playbook="false"
+            ) as workspace:
+                workspace.run_playbook(playbook="grant.yml")
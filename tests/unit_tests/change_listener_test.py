@@ -0,0 +1,71 @@
+import time
+
+from sqlalchemy import text
+
+from ssh_manager_backend.app.services.change_listener import CHANNEL, ChangeListener
+from ssh_manager_backend.db.database import engine
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestChangeListener:
+    def test_receive(self):
+        listener = ChangeListener()
+        assert listener.version("grants") is None  # not connected
+
+        listener.connected = True
+        listener.receive("grants:another-worker")
+        listener.receive(listener.payload("grants"))  # sent by this worker
+        listener.receive("unknown:another-worker")
+
+        assert listener.version("grants") == 1
+        assert listener.version("hosts") == 0
+        assert listener.stats()["received"] == 1
+
+    def test_listen(self):
+        def connect():
+            connection = engine.raw_connection()
+            connection.detach()
+            return connection.connection
+
+        listener = ChangeListener(connect=connect, poll_interval=0.05)
+        listener.start_listening()
+        try:
+            assert wait_for(lambda: listener.connected)
+            # A (re)connection counts as a change of every source.
+            generation = listener.version("roles")
+            assert generation == 1
+
+            with engine.begin() as connection:
+                for payload in ("roles:another-worker", listener.payload("roles")):
+                    connection.execute(
+                        text("SELECT pg_notify(:channel, :payload)"),
+                        channel=CHANNEL,
+                        payload=payload,
+                    )
+
+            assert wait_for(lambda: listener.version("roles") == generation + 1)
+            assert listener.version("grants") == 1
+
+            # A rolled back change is never delivered.
+            with engine.connect() as connection:
+                transaction = connection.begin()
+                connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    channel=CHANNEL,
+                    payload="grants:another-worker",
+                )
+                transaction.rollback()
+
+            time.sleep(0.2)
+            assert listener.version("grants") == 1
+        finally:
+            listener.stop_listening()
+            listener._listener.join(5)
+
+        assert not listener.connected
@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+
+from ssh_manager_backend.app.services.crypto_executor import CryptoExecutor
+
+
+class TestCryptoExecutor:
+    def test_run(self):
+        executor = CryptoExecutor(max_workers=2)
+
+        assert executor.run(pow, 2, 10) == 1024
+        assert executor.run(lambda: executor.run(pow, 2, 3)) == 8
+        assert executor.stats()["completed"] == 2
+        assert executor.stats()["queue_depth"] == 0
+
+    def test_rejects_when_queue_is_full(self):
+        executor = CryptoExecutor(max_workers=1, max_queue=0, timeout=0.01)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        worker = threading.Thread(target=executor.run, args=(block,))
+        worker.start()
+        started.wait()
+
+        with pytest.raises(ServiceUnavailable):
+            executor.run(pow, 2, 10)
+
+        release.set()
+        worker.join()
+
+        assert executor.stats()["rejected"] == 1
+        assert executor.run(pow, 2, 10) == 1024
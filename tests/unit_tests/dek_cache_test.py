@@ -0,0 +1,106 @@
+import os
+from types import SimpleNamespace
+
+from ssh_manager_backend.app.controllers.secrets import Secrets, unlock_dek
+from ssh_manager_backend.app.services import utils
+from ssh_manager_backend.app.services.dek_cache import DekCache
+
+
+class TestDekCache:
+    def test_disabled_by_default(self):
+        cache = DekCache()
+        cache.put(user_id=1, password="test_password", wrapped_dek=b"wrapped", dek=b"x")
+
+        assert (
+            cache.get(user_id=1, password="test_password", wrapped_dek=b"wrapped")
+            is None
+        )
+
+    def test_verifier(self):
+        cache = DekCache(enabled=True)
+        dek: bytes = os.urandom(32)
+        cache.put(user_id=1, password="test_password", wrapped_dek=b"wrapped", dek=dek)
+
+        assert (
+            cache.get(user_id=1, password="test_password", wrapped_dek=b"wrapped")
+            == dek
+        )
+        assert (
+            cache.get(user_id=1, password="wrong_password", wrapped_dek=b"wrapped")
+            is None
+        )
+        assert (
+            cache.get(user_id=1, password="test_password", wrapped_dek=b"rewrapped")
+            is None
+        )
+        assert cache.stats()["hits"] == 1
+
+    def test_invalidate_zeroes_dek(self):
+        cache = DekCache(enabled=True)
+        cache.put(
+            user_id=1, password="test_password", wrapped_dek=b"wrapped", dek=b"dek"
+        )
+        stored: bytearray = cache._entries[1][1]
+
+        cache.invalidate(user_id=1)
+
+        assert stored == bytearray(3)
+        assert (
+            cache.get(user_id=1, password="test_password", wrapped_dek=b"wrapped")
+            is None
+        )
+
+    def test_ttl_and_max_entries(self):
+        cache = DekCache(enabled=True, max_entries=1)
+        cache.put(
+            user_id=1, password="test_password", wrapped_dek=b"wrapped", dek=b"dek"
+        )
+        cache.put(
+            user_id=2, password="test_password", wrapped_dek=b"wrapped", dek=b"dek"
+        )
+
+        assert (
+            cache.get(user_id=1, password="test_password", wrapped_dek=b"wrapped")
+            is None
+        )
+        assert cache.stats()["evictions"] == 1
+
+        cache.ttl = -1
+        cache.put(
+            user_id=3, password="test_password", wrapped_dek=b"wrapped", dek=b"dek"
+        )
+
+        assert (
+            cache.get(user_id=3, password="test_password", wrapped_dek=b"wrapped")
+            is None
+        )
+
+    def test_unlock_dek_verifies_password(self, monkeypatch):
+        secrets = Secrets()
+        secrets.generate_secrets(password="test_password")
+        user = SimpleNamespace(
+            id=1,
+            password=utils.hash_data(
+                data="other_password", salt=secrets.salt_for_password
+            ),
+            salt_for_password=secrets.salt_for_password,
+            encrypted_dek=secrets.dek,
+            salt_for_kek=secrets.salt_for_kek,
+            iv_for_kek=secrets.iv_for_kek,
+        )
+        cache = DekCache(enabled=True)
+        monkeypatch.setattr(
+            "ssh_manager_backend.app.controllers.secrets.dek_cache", cache
+        )
+
+        # The dek is decrypted, but the password is not the password of the user.
+        assert unlock_dek(user=user, password="test_password")
+        assert cache.stats()["size"] == 0
+
+        user.password = utils.hash_data(
+            data="test_password", salt=secrets.salt_for_password
+        )
+        dek: bytes = unlock_dek(user=user, password="test_password")
+        assert dek == cache.get(
+            user_id=1, password="test_password", wrapped_dek=secrets.dek
+        )
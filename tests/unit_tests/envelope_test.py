@@ -0,0 +1,139 @@
+import base64
+import json
+import os
+
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, x25519
+from werkzeug.exceptions import BadRequest, Unauthorized
+
+from ssh_manager_backend.app.controllers import api_controller
+from ssh_manager_backend.app.services import envelope, rsa, session_keys
+from ssh_manager_backend.app.services import x25519 as server_x25519
+from ssh_manager_backend.app.services.aes import AES, AESGCM
+
+
+def wrap(plaintext: bytes) -> str:
+    ciphertext: bytes = rsa._public_key.encrypt(
+        plaintext,
+        padding.OAEP(
+            mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+        ),
+    )
+    return base64.encodebytes(ciphertext).decode()
+
+
+class TestEnvelope:
+    @pytest.fixture(autouse=True)
+    def key_pair(self):
+        rsa.ensure_key_pair()
+        server_x25519.ensure_key_pair()
+        yield
+        session_keys.clear()
+
+    def test_v1(self):
+        key: bytes = os.urandom(32)
+        iv: bytes = os.urandom(16)
+        body = {
+            "key": wrap(key),
+            "iv": wrap(iv),
+            "data": base64.encodebytes(
+                AES(key=key, iv=iv).encrypt(json.dumps({"username": "test"}))
+            ).decode(),
+        }
+
+        data, request_key, request_iv = envelope.open_request(body=body)
+
+        assert data == {"username": "test"}
+        assert (request_key, request_iv) == (key, iv)
+        assert "nonce" not in envelope.seal_response(data={}, key=key, iv=iv)
+
+    def test_v2(self):
+        key: bytes = os.urandom(32)
+        nonce, ciphertext = AESGCM(key=key).encrypt(
+            plaintext=json.dumps({"username": "test"}),
+            associated_data=envelope.REQUEST_AAD,
+        )
+        body = {
+            "version": 2,
+            "key": wrap(key),
+            "nonce": base64.encodebytes(nonce).decode(),
+            "data": base64.encodebytes(ciphertext).decode(),
+        }
+
+        data, request_key, request_iv = envelope.open_request(body=body)
+
+        assert data == {"username": "test"}
+        assert request_key == key and request_iv is None
+
+        sealed = envelope.seal_response(data={"success": True}, key=key, iv=None)
+        plaintext: bytes = AESGCM(key=key).decrypt(
+            nonce=base64.decodebytes(bytes(sealed["nonce"], encoding="utf-8")),
+            ciphertext=base64.decodebytes(bytes(sealed["data"], encoding="utf-8")),
+            associated_data=envelope.RESPONSE_AAD,
+        )
+
+        assert sealed["nonce"] != body["nonce"]
+        assert json.loads(plaintext) == {"success": True}
+
+    def test_x25519(self):
+        client_key = x25519.X25519PrivateKey.generate()
+        client_public_key: bytes = client_key.public_key().public_bytes(
+            encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+        )
+        key: bytes = server_x25519.derive_key(peer_public_key=client_public_key)
+        nonce, ciphertext = AESGCM(key=key).encrypt(
+            plaintext=json.dumps({"username": "test"}),
+            associated_data=envelope.REQUEST_AAD,
+        )
+        body = {
+            "version": 2,
+            "ephemeral_public_key": base64.encodebytes(client_public_key).decode(),
+            "nonce": base64.encodebytes(nonce).decode(),
+            "data": base64.encodebytes(ciphertext).decode(),
+        }
+
+        assert envelope.open_request(body=body) == ({"username": "test"}, key, None)
+
+        body.pop("version")
+
+        with pytest.raises(BadRequest):
+            envelope.open_request(body=body)
+
+    def test_session_key_resumption(self):
+        key: bytes = os.urandom(32)
+        nonce, ciphertext = AESGCM(key=key).encrypt(
+            plaintext=json.dumps({}), associated_data=envelope.REQUEST_AAD
+        )
+        body = {
+            "version": 2,
+            "session_key_id": session_keys.put(key=key),
+            "nonce": base64.encodebytes(nonce).decode(),
+            "data": base64.encodebytes(ciphertext).decode(),
+        }
+
+        assert envelope.open_request(body=body) == ({}, key, None)
+
+        # A v1 session is never resumed, as it would reuse the key and iv.
+        with pytest.raises(BadRequest):
+            envelope.open_request(body={**body, "version": 1})
+
+        body["session_key_id"] = "non_existent_key_id"
+
+        with pytest.raises(Unauthorized):
+            envelope.open_request(body=body)
+
+    def test_session_key_id_only_for_v2(self):
+        key: bytes = os.urandom(32)
+
+        v1 = api_controller.response_data(
+            data={}, message="", status_code=200, key=key, iv=os.urandom(16)
+        )
+        v2 = api_controller.response_data(
+            data={}, message="", status_code=200, key=key, iv=None
+        )
+
+        assert "session_key_id" not in json.loads(v1.get_data())
+        assert (
+            session_keys.get(key_id=json.loads(v2.get_data())["session_key_id"]) == key
+        )
@@ -0,0 +1,240 @@
+import functools
+
+import pytest
+
+from tasks import executors
+from tasks.executors import AsyncSSHExecutor, HostResult, asyncssh, asyncssh_connect
+from tasks.grant_access import batch_inventory, key_name
+from tests.fake_ssh import FakeSSHServer
+
+CA_NAME = "test_ca"
+CA_FILE = f"/etc/ssh/{CA_NAME}.pub"
+TRUST_LINE = f"TrustedUserCAKeys {CA_FILE}"
+
+
+class TestAsyncSSHExecutor:
+    @pytest.fixture
+    def ca_key(self, tmp_path, monkeypatch):
+        (tmp_path / f"{CA_NAME}.pub").write_text("ssh-ed25519 AAAA test_ca\n")
+        monkeypatch.setattr(executors, "SSH_CA_DIR", str(tmp_path))
+
+    def host_vars(self, count: int):
+        return {f"10.0.0.{i}": {"ca_name": CA_NAME} for i in range(count)}
+
+    def test_grant_and_revoke(self, ca_key):
+        server = FakeSSHServer()
+        executor = AsyncSSHExecutor(connect=server.connect)
+
+        results = executor.push("grant", b"admin_key", "ubuntu", self.host_vars(3))
+        assert results == {host: HostResult(ok=True, changed=True) for host in results}
+
+        files = server.files["10.0.0.1"]
+        assert files[CA_FILE] == "ssh-ed25519 AAAA test_ca\n"
+        assert files["/etc/ssh/sshd_config"] == f"PermitRootLogin no\n{TRUST_LINE}\n"
+        assert server.modes[("10.0.0.1", CA_FILE)] == 0o600
+        assert server.reloads["10.0.0.1"] == 1
+
+        # A second grant changes nothing and does not reload sshd.
+        results = executor.push("grant", b"admin_key", "ubuntu", self.host_vars(3))
+        assert all(result.ok and not result.changed for result in results.values())
+        assert server.reloads["10.0.0.1"] == 1
+
+        results = executor.push("revoke", b"admin_key", "ubuntu", self.host_vars(3))
+        assert all(result.ok and result.changed for result in results.values())
+        assert CA_FILE not in files
+        assert files["/etc/ssh/sshd_config"] == "PermitRootLogin no\n"
+        assert server.reloads["10.0.0.1"] == 2
+
+        # The connections are pooled across the batches.
+        assert server.connections == 3
+        executor.close()
+
+    def test_several_ca_names(self, ca_key, tmp_path):
+        (tmp_path / "other_ca.pub").write_text("ssh-ed25519 BBBB other_ca\n")
+        server = FakeSSHServer()
+        executor = AsyncSSHExecutor(connect=server.connect)
+
+        host_vars = {"10.0.0.1": {"ca_name": f"{CA_NAME},other_ca"}}
+        assert executor.push("grant", b"admin_key", "ubuntu", host_vars)["10.0.0.1"].ok
+
+        files = server.files["10.0.0.1"]
+        assert files["/etc/ssh/other_ca.pub"] == "ssh-ed25519 BBBB other_ca\n"
+        assert files["/etc/ssh/sshd_config"] == (
+            f"PermitRootLogin no\n{TRUST_LINE}\nTrustedUserCAKeys /etc/ssh/other_ca.pub\n"
+        )
+
+        # Revoking one of the keys leaves the other one trusted.
+        results = executor.push("revoke", b"admin_key", "ubuntu", self.host_vars(2))
+        assert results["10.0.0.1"] == HostResult(ok=True, changed=True)
+        assert CA_FILE not in files and "/etc/ssh/other_ca.pub" in files
+        assert files["/etc/ssh/sshd_config"] == (
+            "PermitRootLogin no\nTrustedUserCAKeys /etc/ssh/other_ca.pub\n"
+        )
+        executor.close()
+
+    def test_invalid_sshd_config(self, ca_key):
+        server = FakeSSHServer()
+        server.invalid_line = TRUST_LINE
+        executor = AsyncSSHExecutor(connect=server.connect)
+
+        results = executor.push("grant", b"admin_key", "ubuntu", self.host_vars(1))
+
+        assert not results["10.0.0.0"].ok
+        files = server.files["10.0.0.0"]
+        assert files["/etc/ssh/sshd_config"] == "PermitRootLogin no\n"
+        # The temporary files are cleaned up and sshd is not reloaded with a config it rejects.
+        assert sorted(files) == ["/etc/ssh/sshd_config", CA_FILE]
+        assert "10.0.0.0" not in server.reloads
+        executor.close()
+
+    def test_concurrent_edit(self, ca_key):
+        server = FakeSSHServer()
+        executor = AsyncSSHExecutor(connect=server.connect)
+        edits = []
+
+        def concurrent_push(host):
+            # Another push adds a line between the read of sshd_config and the move of the new one, once.
+            if not edits:
+                edits.append(host)
+                server.files[host]["/etc/ssh/sshd_config"] += "Banner /etc/issue\n"
+
+        server.hooks["/usr/sbin/sshd"] = concurrent_push
+        results = executor.push("grant", b"admin_key", "ubuntu", self.host_vars(1))
+
+        assert results["10.0.0.0"].ok
+        assert server.files["10.0.0.0"]["/etc/ssh/sshd_config"] == (
+            f"PermitRootLogin no\nBanner /etc/issue\n{TRUST_LINE}\n"
+        )
+        executor.close()
+
+    def test_trust(self, ca_key):
+        server = FakeSSHServer()
+        executor = AsyncSSHExecutor(connect=server.connect)
+        host_vars = {"10.0.0.1": {"ca_name": CA_NAME, "login_users": "deploy,ubuntu"}}
+
+        results = executor.push("trust", b"admin_key", "ubuntu", host_vars)
+        assert results["10.0.0.1"] == HostResult(ok=True, changed=True)
+
+        files = server.files["10.0.0.1"]
+        assert files["/etc/ssh/auth_principals/deploy"] == "deploy@10.0.0.1\ndeploy\n"
+        assert files["/etc/ssh/auth_principals/ubuntu"] == "ubuntu@10.0.0.1\nubuntu\n"
+        assert server.modes[("10.0.0.1", "/etc/ssh/auth_principals/deploy")] == 0o644
+        assert files["/etc/ssh/sshd_config"] == (
+            f"PermitRootLogin no\n{TRUST_LINE}\n"
+            "AuthorizedPrincipalsFile /etc/ssh/auth_principals/%u\n"
+        )
+
+        results = executor.push("trust", b"admin_key", "ubuntu", host_vars)
+        assert results["10.0.0.1"] == HostResult(ok=True, changed=False)
+
+        # Principals files set up by someone else are not taken over.
+        executor.close()
+        server = FakeSSHServer(
+            sshd_config="AuthorizedPrincipalsFile /etc/ssh/principals\n"
+        )
+        executor = AsyncSSHExecutor(connect=server.connect)
+        results = executor.push("trust", b"admin_key", "ubuntu", host_vars)
+        assert not results["10.0.0.1"].ok
+        assert "/etc/ssh/auth_principals/deploy" not in server.files["10.0.0.1"]
+        executor.close()
+
+    def test_max_in_flight(self, ca_key):
+        server = FakeSSHServer(latency=0.001)
+        executor = AsyncSSHExecutor(connect=server.connect, max_in_flight=7)
+
+        results = executor.push("grant", b"admin_key", "ubuntu", self.host_vars(50))
+
+        assert all(result.ok for result in results.values())
+        assert server.max_in_flight == 7
+        executor.close()
+
+    def test_unreachable_host(self, ca_key):
+        server = FakeSSHServer()
+        server.unreachable = ["10.0.0.1"]
+        executor = AsyncSSHExecutor(connect=server.connect)
+
+        results = executor.push("grant", b"admin_key", "ubuntu", self.host_vars(3))
+
+        assert not results["10.0.0.1"].ok
+        assert "unreachable" in results["10.0.0.1"].error
+        assert results["10.0.0.0"].ok and results["10.0.0.2"].ok
+
+        with pytest.raises(ValueError):
+            executor.push("delete", b"admin_key", "ubuntu", self.host_vars(1))
+        executor.close()
+
+
+class TestAsyncSSHConnection:
+    @pytest.fixture(autouse=True)
+    def ca_key(self, tmp_path, monkeypatch):
+        (tmp_path / f"{CA_NAME}.pub").write_text("ssh-ed25519 AAAA test_ca\n")
+        monkeypatch.setattr(executors, "SSH_CA_DIR", str(tmp_path))
+
+    def test_grant_and_revoke(self):
+        host_key = asyncssh.generate_private_key("ssh-ed25519")
+        client_key = asyncssh.generate_private_key("ssh-ed25519")
+        server = FakeSSHServer()
+        executor = AsyncSSHExecutor()
+        acceptor = executor._loop.run_until_complete(
+            server.listen(host_key=host_key, client_key=client_key)
+        )
+        port: int = acceptor.sockets[0].getsockname()[1]
+
+        def connect(host_key):
+            known_hosts: str = (
+                f"[127.0.0.1]:{port} {host_key.export_public_key().decode()}"
+            )
+            return functools.partial(
+                asyncssh_connect,
+                port=port,
+                known_hosts=asyncssh.import_known_hosts(known_hosts),
+                agent_path=None,
+            )
+
+        try:
+            executor.connect = connect(host_key)
+            ssh_key: bytes = client_key.export_private_key()
+            host_vars = {"127.0.0.1": {"ca_name": CA_NAME}}
+
+            results = executor.push("grant", ssh_key, "ubuntu", host_vars)
+            assert results["127.0.0.1"] == HostResult(ok=True, changed=True)
+
+            files = server.files["127.0.0.1"]
+            assert files[CA_FILE] == "ssh-ed25519 AAAA test_ca\n"
+            assert files["/etc/ssh/sshd_config"] == (
+                f"PermitRootLogin no\n{TRUST_LINE}\n"
+            )
+            assert server.reloads["127.0.0.1"] == 1
+
+            results = executor.push("revoke", ssh_key, "ubuntu", host_vars)
+            assert results["127.0.0.1"] == HostResult(ok=True, changed=True)
+            assert files["/etc/ssh/sshd_config"] == "PermitRootLogin no\n"
+            assert server.connections == 1
+
+            # A host key which is not known is rejected, like Ansible does.
+            executor.close()
+            executor.connect = connect(asyncssh.generate_private_key("ssh-ed25519"))
+            results = executor.push("grant", ssh_key, "ubuntu", host_vars)
+            assert not results["127.0.0.1"].ok
+            assert "HostKeyNotVerifiable" in results["127.0.0.1"].error
+            assert CA_FILE not in files
+        finally:
+            executor.close()
+            acceptor.close()
+            executor._loop.run_until_complete(acceptor.wait_closed())
+
+
+class TestBatchInventory:
+    def test_key_file_per_user(self):
+        host_vars = batch_inventory(
+            [("alice", "10.0.0.1"), ("bob", "10.0.0.1"), ("alice", "10.0.0.0/30")]
+        )
+
+        assert host_vars["10.0.0.1"]["ca_name"].split(",") == [
+            key_name("alice", "10.0.0.1"),
+            key_name("bob", "10.0.0.1"),
+            key_name("alice", "10.0.0.0/30"),
+        ]
+        assert host_vars["10.0.0.2"] == {"ca_name": key_name("alice", "10.0.0.0/30")}
+        assert key_name("alice", "10.0.0.0/30").endswith("_10.0.0.0_30")
+        assert key_name("alice", "10.0.0.1") != key_name("bob", "10.0.0.1")
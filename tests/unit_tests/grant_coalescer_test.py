@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from ssh_manager_backend.app.services.grant_coalescer import GrantCoalescer
+
+
+class TestGrantCoalescer:
+    def coalescer(self, **kwargs) -> (GrantCoalescer, list):
+        dispatched = []
+        coalescer = GrantCoalescer(
+            dispatch=lambda *batch: dispatched.append(batch), **kwargs
+        )
+        return coalescer, dispatched
+
+    def test_groups_by_key_and_remote_user(self):
+        coalescer, dispatched = self.coalescer(window=60)
+        for i in range(200):
+            coalescer.submit("grant", b"admin_key", "ubuntu", "alice", f"10.0.0.{i}")
+        coalescer.submit("grant", b"admin_key", "root", "alice", "10.0.1.1")
+        coalescer.submit("grant", b"other_admin_key", "ubuntu", "bob", "10.0.1.2")
+        coalescer.submit("revoke", b"admin_key", "ubuntu", "carol", "10.0.1.3")
+
+        # Nothing is dispatched before the window ends.
+        assert coalescer.flush() == 0
+        assert coalescer.flush(force=True) == 4
+
+        batches = {batch[:3]: batch[3] for batch in dispatched}
+        assert len(batches[("grant", b"admin_key", "ubuntu")]) == 200
+        assert batches[("grant", b"admin_key", "root")] == [("alice", "10.0.1.1")]
+        assert batches[("revoke", b"admin_key", "ubuntu")] == [("carol", "10.0.1.3")]
+        assert coalescer.stats() == {
+            "submitted": 203,
+            "batches": 4,
+            "failures": 0,
+            "pending": 0,
+        }
+
+    def test_max_batch_size(self):
+        coalescer, dispatched = self.coalescer(window=60, max_batch_size=3)
+        for i in range(7):
+            coalescer.submit("grant", b"admin_key", "ubuntu", "alice", f"10.0.0.{i}")
+
+        assert [len(batch[3]) for batch in dispatched] == [3, 3]
+        assert coalescer.stats()["pending"] == 1
+
+    def test_window(self):
+        coalescer, dispatched = self.coalescer(window=0.05)
+        coalescer.start_flush()
+        coalescer.submit("grant", b"admin_key", "ubuntu", "alice", "10.0.0.1")
+        coalescer.submit("grant", b"admin_key", "ubuntu", "bob", "10.0.0.2")
+
+        deadline = time.monotonic() + 5
+        while not dispatched and time.monotonic() < deadline:
+            time.sleep(0.01)
+        coalescer.stop_flush()
+
+        assert dispatched == [
+            (
+                "grant",
+                b"admin_key",
+                "ubuntu",
+                [("alice", "10.0.0.1"), ("bob", "10.0.0.2")],
+            )
+        ]
+
+    def test_failed_dispatch(self):
+        def dispatch(*batch):
+            raise ConnectionError("broker unavailable")
+
+        coalescer = GrantCoalescer(dispatch=dispatch, window=60)
+        coalescer.submit("grant", b"admin_key", "ubuntu", "alice", "10.0.0.1")
+        coalescer.flush(force=True)
+
+        assert coalescer.stats()["failures"] == 1
+
+        with pytest.raises(ValueError):
+            coalescer.submit("delete", b"admin_key", "ubuntu", "alice", "10.0.0.1")
+
+    def test_close(self):
+        coalescer, dispatched = self.coalescer(window=60)
+        coalescer.start_flush()
+        coalescer.submit("grant", b"admin_key", "ubuntu", "alice", "10.0.0.1")
+        coalescer.submit("revoke", b"admin_key", "ubuntu", "bob", "10.0.0.2")
+
+        # The batches still in their window are dispatched, by the thread or by close itself.
+        coalescer.close()
+
+        assert len(dispatched) == 2
+        assert coalescer.stats()["pending"] == 0
+        assert not coalescer._flusher.is_alive()
@@ -0,0 +1,126 @@
+import ipaddress
+
+from ssh_manager_backend.app.services.grant_index import (
+    GrantIndex,
+    PrefixTrie,
+    is_valid_host,
+    normalize_host,
+)
+
+
+class TestGrantIndex:
+    def test_normalize_host(self):
+        assert normalize_host("10.0.1.7") == "10.0.1.7"
+        assert normalize_host("10.0.1.7/32") == "10.0.1.7"
+        assert normalize_host("10.0.1.7/22") == "10.0.0.0/22"
+        assert normalize_host("2001:db8::1/64") == "2001:db8::/64"
+        assert normalize_host("db.internal") == "db.internal"
+
+    def test_is_valid_host(self):
+        for host in ["10.0.1.7", "10.0.0.0/22", "2001:db8::1", "db-1.internal"]:
+            assert is_valid_host(host)
+        for host in [
+            "",
+            "db.internal ansible_user=root",
+            "-db",
+            "db..internal",
+            "a" * 64,
+        ]:
+            assert not is_valid_host(host)
+
+    def test_prefix_trie(self):
+        trie = PrefixTrie()
+        trie.insert(ipaddress.ip_network("10.0.0.0/22"))
+        trie.insert(ipaddress.ip_network("10.0.0.0/8"))
+
+        assert trie.contains(ipaddress.ip_address("10.0.3.255"))
+        assert trie.contains(ipaddress.ip_address("10.200.0.1"))
+        assert not trie.contains(ipaddress.ip_address("11.0.0.1"))
+
+        assert trie.remove(ipaddress.ip_network("10.0.0.0/8"))
+        assert not trie.remove(ipaddress.ip_network("10.0.0.0/8"))
+        assert trie.contains(ipaddress.ip_address("10.0.3.255"))
+        assert not trie.contains(ipaddress.ip_address("10.0.4.0"))
+
+        assert trie.remove(ipaddress.ip_network("10.0.0.0/22"))
+        assert trie.root == [None, None, 0]
+
+    def test_has_access(self):
+        grant_index = GrantIndex()
+        grant_index.load(
+            [
+                ("test_username", "10.0.0.0/22"),
+                ("test_username", "192.168.1.5"),
+                ("test_username", "db.internal"),
+                ("other_username", "2001:db8::/64"),
+            ]
+        )
+
+        assert grant_index.has_access(username="test_username", host="10.0.2.9")
+        assert grant_index.has_access(username="test_username", host="192.168.1.5")
+        assert grant_index.has_access(username="test_username", host="db.internal")
+        assert not grant_index.has_access(username="test_username", host="10.0.4.1")
+        assert not grant_index.has_access(username="test_username", host="2001:db8::1")
+        assert grant_index.has_access(username="other_username", host="2001:db8::1")
+        assert not grant_index.has_access(username="unknown_username", host="10.0.2.9")
+
+    def test_incremental_updates(self):
+        grant_index = GrantIndex()
+        grant_index.load([])
+
+        # One grant per remote user of the same network.
+        grant_index.add(username="test_username", hosts=["10.0.0.0/22", "10.0.0.0/22"])
+        grant_index.remove(username="test_username", hosts=["10.0.0.0/22"])
+        assert grant_index.has_access(username="test_username", host="10.0.1.1")
+
+        grant_index.remove(username="test_username", hosts=["10.0.0.0/22"])
+        assert not grant_index.has_access(username="test_username", host="10.0.1.1")
+        assert grant_index.stats()["users"] == 0
+
+    def test_sync_keeps_concurrent_revocations(self):
+        grant_index = GrantIndex()
+
+        def source():
+            # A revocation committed after the source was read.
+            grant_index.remove(username="test_username", hosts=["10.0.0.0/22"])
+            return [("test_username", "10.0.0.0/22")]
+
+        grant_index.source = source
+        grant_index.sync()
+
+        assert grant_index.loaded
+        assert not grant_index.has_access(username="test_username", host="10.0.1.1")
+
+    def test_failed_sync_keeps_index(self, caplog):
+        grant_index = GrantIndex()
+        grant_index.load([("test_username", "10.0.0.0/22")])
+
+        def source():
+            raise ConnectionError("database is down")
+
+        grant_index.source = source
+        assert grant_index.try_sync() is False
+
+        assert grant_index.stats()["sync_failures"] == 1
+        assert "grant-index-sync failed" in caplog.text
+        assert grant_index.has_access(username="test_username", host="10.0.1.1")
+
+        # A failed read stops recording the concurrent changes.
+        grant_index.remove(username="test_username", hosts=["10.0.0.0/22"])
+        assert grant_index.changes_during_sync() == []
+
+    def test_version(self):
+        grant_index = GrantIndex()
+        grant_index.load([("test_username", "10.0.0.1")])
+        assert not grant_index.is_current(0)  # loaded without a version
+
+        versions = [4]
+        grant_index.source = lambda: [("test_username", "10.0.0.1")]
+        grant_index.version_source = lambda: versions[-1]
+        assert grant_index.try_sync()
+        assert grant_index.is_current(4) and not grant_index.is_current(5)
+
+        # No version is known while the change listener is disconnected.
+        versions.append(None)
+        assert grant_index.try_sync()
+        assert not grant_index.is_current(4)
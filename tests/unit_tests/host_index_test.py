@@ -0,0 +1,97 @@
+import pytest
+
+from ssh_manager_backend.app.services.host_index import (
+    HostIndex,
+    canonical_selector,
+    parse_selector,
+)
+
+
+class TestHostIndex:
+    def test_selectors(self):
+        assert parse_selector("role=db, env=prod") == {"role": "db", "env": "prod"}
+        assert canonical_selector("role=db, env=prod") == "env=prod,role=db"
+        assert canonical_selector({"role": "db", "env": "prod"}) == "env=prod,role=db"
+
+        for selector in ["", "role", "role=", "=db", "role=db,"]:
+            with pytest.raises(ValueError):
+                parse_selector(selector)
+
+        # The selector names a file and may not carry ansible host variables.
+        for selector in [
+            "role=db ansible_ssh_common_args=-oProxyCommand",
+            "role={{x}}",
+        ]:
+            with pytest.raises(ValueError):
+                canonical_selector(selector)
+
+    def test_members(self):
+        host_index = HostIndex()
+        host_index.load(
+            hosts=[
+                ("10.0.0.1", {"env": "prod", "role": "db", "zone": "eu-1"}),
+                ("10.0.0.2", {"env": "prod", "role": "web", "zone": "eu-1"}),
+                ("10.0.0.3", {"env": "staging", "role": "db", "zone": "us-1"}),
+            ],
+            group_grants=[],
+        )
+
+        assert host_index.members("env=prod") == {"10.0.0.1", "10.0.0.2"}
+        assert host_index.members("role=db, env=prod") == {"10.0.0.1"}
+        assert host_index.members("role=db, zone=us-1") == {"10.0.0.3"}
+        assert host_index.members("role=cache") == set()
+
+    def test_has_access(self):
+        host_index = HostIndex()
+        host_index.load(
+            hosts=[
+                ("10.0.0.1", {"env": "prod", "role": "db"}),
+                ("10.0.0.2", {"env": "prod", "role": "web"}),
+            ],
+            group_grants=[("test_username", "env=prod,role=db")],
+        )
+
+        assert host_index.has_access(username="test_username", host="10.0.0.1")
+        assert not host_index.has_access(username="test_username", host="10.0.0.2")
+        assert not host_index.has_access(username="test_username", host="10.0.0.9")
+        assert not host_index.has_access(username="other_username", host="10.0.0.1")
+
+    def test_incremental_updates(self):
+        host_index = HostIndex()
+        host_index.load(hosts=[], group_grants=[])
+        host_index.add_group_grants(username="test_username", selectors=["role=db"])
+
+        # A host joining the group is reachable through the existing grant.
+        host_index.set_host(address="10.0.0.1", labels={"role": "db"})
+        assert host_index.has_access(username="test_username", host="10.0.0.1")
+
+        # Relabelling moves the host out of the group.
+        host_index.set_host(address="10.0.0.1", labels={"role": "web"})
+        assert not host_index.has_access(username="test_username", host="10.0.0.1")
+        assert host_index.members("role=web") == {"10.0.0.1"}
+
+        host_index.remove_host(address="10.0.0.1")
+        assert host_index.stats()["hosts"] == 0
+        assert host_index.stats()["labels"] == 0
+
+        host_index.set_host(address="10.0.0.1", labels={"role": "db"})
+        host_index.remove_group_grants(username="test_username", selectors=["role=db"])
+        assert not host_index.has_access(username="test_username", host="10.0.0.1")
+
+    def test_changes_during_sync_are_kept(self):
+        host_index = HostIndex()
+
+        def hosts_source():
+            # A host is relabelled and a grant revoked while the sync reads the sources.
+            host_index.set_host(address="10.0.0.1", labels={"role": "web"})
+            host_index.remove_group_grants(
+                username="test_username", selectors=["role=db"]
+            )
+            return [("10.0.0.1", {"role": "db"})]
+
+        host_index.hosts_source = hosts_source
+        host_index.grants_source = lambda: [("test_username", "role=db")]
+        host_index.sync()
+
+        assert host_index.members("role=web") == {"10.0.0.1"}
+        assert not host_index.has_access(username="test_username", host="10.0.0.1")
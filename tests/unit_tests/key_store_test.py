@@ -0,0 +1,99 @@
+import os
+
+import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from ssh_manager_backend.app.services.key_store import FileKeyStore
+from ssh_manager_backend.app.services.rsa import RSA
+from ssh_manager_backend.app.services.x25519 import X25519
+
+OAEP = padding.OAEP(
+    mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+)
+
+
+class TestFileKeyStore:
+    @pytest.fixture(autouse=True)
+    def small_keys(self, monkeypatch):
+        monkeypatch.setattr(
+            RSA,
+            "new_private_key",
+            staticmethod(
+                lambda: rsa.generate_private_key(
+                    public_exponent=65537, key_size=2048, backend=default_backend()
+                )
+            ),
+        )
+
+    def test_publish_keeps_newest_keys(self, tmp_path):
+        key_store = FileKeyStore(path=str(tmp_path / "keys.json"))
+
+        for generation_time in range(3):
+            key_store.publish(
+                kind="rsa",
+                key_id=str(generation_time),
+                material=b"material",
+                generation_time=generation_time,
+                keep=2,
+            )
+
+        assert [entry["key_id"] for entry in key_store.load(kind="rsa")] == ["1", "2"]
+        assert key_store.load(kind="x25519") == []
+
+    def test_workers_share_rsa_ring(self, tmp_path):
+        key_store = FileKeyStore(path=str(tmp_path / "keys.json"))
+        first_worker = RSA(key_store=key_store)
+        second_worker = RSA(key_store=key_store)
+        second_worker.sync_interval = 0
+
+        first_worker.ensure_key_pair()
+        second_worker.ensure_key_pair()
+
+        assert first_worker.key_id == second_worker.key_id
+
+        first_worker.expire_time = 0
+        first_worker.refresh_key_pair()
+        ciphertext: bytes = first_worker._public_key.encrypt(b"test_key", OAEP)
+
+        assert first_worker.key_id != second_worker.key_id
+        assert (
+            second_worker.decrypt_cipher(ciphertext, key_id=first_worker.key_id)
+            == b"test_key"
+        )
+
+    def test_workers_share_x25519_key(self, tmp_path):
+        key_store = FileKeyStore(path=str(tmp_path / "keys.json"))
+        first_worker = X25519(key_store=key_store)
+        second_worker = X25519(key_store=key_store)
+
+        first_worker.ensure_key_pair()
+        second_worker.ensure_key_pair()
+
+        assert first_worker.public_key == second_worker.public_key
+
+    def test_refuses_files_other_users_can_reach(self, tmp_path):
+        key_store = FileKeyStore(path=str(tmp_path / "keys.json"))
+        key_store.publish(
+            kind="rsa", key_id="1", material=b"material", generation_time=0, keep=1
+        )
+        assert oct(os.stat(key_store.path).st_mode & 0o777) == oct(0o600)
+
+        os.chmod(key_store.path, 0o644)
+        with pytest.raises(PermissionError):
+            key_store.load(kind="rsa")
+        os.chmod(key_store.path, 0o600)
+
+        # A symlink planted in place of the lock is not followed.
+        os.symlink(str(tmp_path / "elsewhere"), key_store.path + ".lock")
+        with pytest.raises(PermissionError):
+            with key_store.lock():
+                pass
+        os.unlink(key_store.path + ".lock")
+
+        os.chmod(str(tmp_path), 0o777)
+        with pytest.raises(PermissionError):
+            key_store.load(kind="rsa")
+        os.chmod(str(tmp_path), 0o700)
+        assert len(key_store.load(kind="rsa")) == 1
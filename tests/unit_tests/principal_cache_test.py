@@ -0,0 +1,62 @@
+import time
+
+from ssh_manager_backend.app.services.principal_cache import Principal, PrincipalCache
+
+principal = Principal(
+    user_id=1, username="test_username", admin=False, session_active=True
+)
+
+
+class TestPrincipalCache:
+    def test_put_and_get(self):
+        cache = PrincipalCache()
+        cache.put(access_token="test_access_token", principal=principal)
+
+        assert cache.get(access_token="test_access_token") == principal
+        assert cache.get(access_token="non_existent_access_token") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_invalidate(self):
+        cache = PrincipalCache()
+        cache.put(access_token="first_access_token", principal=principal)
+        cache.put(access_token="second_access_token", principal=principal)
+
+        cache.invalidate_token(access_token="first_access_token")
+
+        assert cache.get(access_token="first_access_token") is None
+        assert cache.get(access_token="second_access_token") == principal
+
+        cache.invalidate_username(username="test_username")
+
+        assert cache.get(access_token="second_access_token") is None
+        assert cache.stats()["size"] == 0
+
+    def test_ttl_and_lru_eviction(self):
+        cache = PrincipalCache(max_entries=1)
+        cache.put(access_token="first_access_token", principal=principal)
+        cache.put(access_token="second_access_token", principal=principal)
+
+        assert cache.get(access_token="first_access_token") is None
+        assert cache.get(access_token="second_access_token") == principal
+
+        cache.ttl = -1
+        cache.put(access_token="second_access_token", principal=principal)
+
+        assert cache.get(access_token="second_access_token") is None
+
+    def test_entry_does_not_outlive_session(self):
+        cache = PrincipalCache()
+        cache.put(
+            access_token="first_access_token",
+            principal=principal,
+            expires_at=time.time() - 1,
+        )
+        cache.put(
+            access_token="second_access_token",
+            principal=principal,
+            expires_at=time.time() + 3600,
+        )
+
+        assert cache.get(access_token="first_access_token") is None
+        assert cache.get(access_token="second_access_token") == principal
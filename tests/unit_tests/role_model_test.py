@@ -0,0 +1,95 @@
+import pytest
+
+from ssh_manager_backend.app.models.access_control import AccessControlModel
+from ssh_manager_backend.app.models.hosts import Hosts
+from ssh_manager_backend.app.models.roles import Roles
+from ssh_manager_backend.app.models.user import Users
+from tests.test_ssh_manager_backend import db_cleanup
+
+
+class TestRoles:
+    @pytest.fixture
+    def cleanup(self):
+        yield
+        db_cleanup()
+
+    def test_roles(self, cleanup):
+        roles: Roles = Roles()
+        acl: AccessControlModel = AccessControlModel()
+        username: str = "test_username"
+
+        assert Users().create(
+            name="test_user",
+            username=username,
+            password=b"test_password",
+            admin=False,
+            encrypted_dek=b"test_encrypted_dek",
+            iv_for_dek=b"test_iv_for_dek",
+            salt_for_dek=b"test_salt_for_dek",
+            iv_for_kek=b"test_iv_for_kek",
+            salt_for_kek=b"test_salt_for_kek",
+            salt_for_password=b"test_salt_for_password",
+        )
+
+        assert roles.create(name="employee")
+        assert roles.create(name="engineer")
+        assert roles.add_parent(name="engineer", parent="employee")
+        # A cycle is refused.
+        assert not roles.add_parent(name="employee", parent="engineer")
+        assert not roles.add_parent(name="engineer", parent="non_existent_role")
+
+        assert roles.grant_access(name="employee", ip_addresses=["10.9.0.1"])
+        assert roles.add_member(name="engineer", username=username)
+        assert roles.get_roles(username=username) == ["engineer"]
+
+        assert acl.has_access(username=username, ip_address="10.9.0.1")
+        assert acl.has_access_batch(
+            pairs=[(username, "10.9.0.1"), (username, "10.9.0.2")]
+        ) == [True, False]
+
+        # The users reaching a host through a network, a group or an inherited role grant.
+        assert Hosts().register(address="10.9.0.2", labels={"role": "cache"})
+        assert acl.grant_access(
+            username=username, ip_addresses=["10.9.0.0/30"], remote_user="ops"
+        )
+        assert acl.grant_group_access(
+            username=username, selector="role=cache", remote_user="redis"
+        )
+        assert roles.grant_access(
+            name="employee", ip_addresses=["10.9.0.0/29"], remote_user="deploy"
+        )
+
+        pages = acl.users_with_access(hosts=["10.9.0.1/32", "10.9.0.2"], limit=10)
+        assert pages["10.9.0.1/32"] == (
+            [(username, ""), (username, "deploy"), (username, "ops")],
+            None,
+        )
+        assert pages["10.9.0.2"] == (
+            [(username, "deploy"), (username, "ops"), (username, "redis")],
+            None,
+        )
+
+        first_page = acl.users_with_access(hosts=["10.9.0.2"], limit=2)
+        assert first_page["10.9.0.2"][0] == [(username, "deploy"), (username, "ops")]
+        assert acl.users_with_access(
+            hosts=["10.9.0.2"],
+            limit=2,
+            cursors={"10.9.0.2": first_page["10.9.0.2"][1]},
+        )["10.9.0.2"] == ([(username, "redis")], None)
+
+        assert acl.revoke_access(username=username, ip_addresses=["10.9.0.0/30"])
+        assert acl.revoke_all_group_access(username=username)
+        assert roles.revoke_access(name="employee", ip_addresses=["10.9.0.0/29"])
+
+        assert roles.remove_parent(name="engineer", parent="employee")
+        assert not acl.has_access(username=username, ip_address="10.9.0.1")
+
+        assert roles.remove_member(name="engineer", username=username)
+        assert roles.get_roles(username=username) == []
+
+        assert roles.add_member(name="engineer", username=username)
+        assert roles.add_member(name="employee", username=username)
+        assert roles.remove_all_memberships(username=username)
+        assert roles.get_roles(username=username) == []
+        assert roles.delete(name="engineer")
+        assert roles.delete(name="employee")
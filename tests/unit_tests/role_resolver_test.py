@@ -0,0 +1,85 @@
+from ssh_manager_backend.app.services.role_resolver import RoleResolver
+
+
+class TestRoleResolver:
+    def load(self) -> RoleResolver:
+        role_resolver = RoleResolver()
+        role_resolver.load(
+            parents=[("dba", "engineer"), ("engineer", "employee")],
+            grants=[
+                ("employee", "10.0.0.1", ""),
+                ("engineer", "10.1.0.0/16", "ubuntu"),
+                ("dba", "10.2.0.5", "postgres"),
+            ],
+            members=[("dba", "alice"), ("engineer", "bob")],
+        )
+        return role_resolver
+
+    def test_inherited_grants(self):
+        role_resolver = self.load()
+
+        assert role_resolver.has_access(username="alice", host="10.0.0.1")
+        assert role_resolver.has_access(username="alice", host="10.1.3.4")
+        assert role_resolver.has_access(username="alice", host="10.2.0.5")
+        assert role_resolver.has_access(username="bob", host="10.1.3.4")
+        assert not role_resolver.has_access(username="bob", host="10.2.0.5")
+        assert not role_resolver.has_access(username="carol", host="10.0.0.1")
+
+    def test_memoized_grants(self):
+        role_resolver = self.load()
+
+        for _ in range(3):
+            assert role_resolver.has_access(username="alice", host="10.0.0.1")
+
+        assert role_resolver.stats()["misses"] == 1
+        assert role_resolver.stats()["hits"] == 2
+
+    def test_precise_invalidation(self):
+        role_resolver = self.load()
+        role_resolver.has_access(username="alice", host="10.0.0.1")
+        role_resolver.has_access(username="bob", host="10.0.0.1")
+        role_resolver.has_access(username="carol", host="10.0.0.1")
+
+        # Only the users of dba are affected by a grant of dba.
+        role_resolver.add_grants(role="dba", grants=[("10.3.0.1", "")])
+        assert role_resolver.stats()["invalidations"] == 1
+        assert role_resolver.has_access(username="alice", host="10.3.0.1")
+
+        # A grant of employee reaches the users of every role inheriting from it.
+        role_resolver.remove_grants(role="employee", grants=[("10.0.0.1", "")])
+        assert role_resolver.stats()["invalidations"] == 3
+        assert not role_resolver.has_access(username="alice", host="10.0.0.1")
+        assert not role_resolver.has_access(username="bob", host="10.0.0.1")
+
+        role_resolver.remove_parent(role="dba", parent="engineer")
+        assert not role_resolver.has_access(username="alice", host="10.1.3.4")
+
+        role_resolver.add_member(role="dba", username="carol")
+        assert role_resolver.has_access(username="carol", host="10.2.0.5")
+
+        role_resolver.remove_role(role="dba")
+        assert not role_resolver.has_access(username="carol", host="10.2.0.5")
+        assert not role_resolver.has_access(username="alice", host="10.3.0.1")
+
+    def test_inheritance_cycles_terminate(self):
+        role_resolver = RoleResolver()
+        role_resolver.load(
+            parents=[("a", "b"), ("b", "a")],
+            grants=[("b", "10.0.0.1", "")],
+            members=[("a", "alice")],
+        )
+
+        assert role_resolver.has_access(username="alice", host="10.0.0.1")
+
+    def test_changes_during_sync_are_kept(self):
+        role_resolver = RoleResolver()
+
+        def source():
+            role_resolver.remove_member(role="dba", username="alice")
+            return [], [("dba", "10.2.0.5", "")], [("dba", "alice")]
+
+        role_resolver.source = source
+        role_resolver.sync()
+
+        assert role_resolver.loaded
+        assert not role_resolver.has_access(username="alice", host="10.2.0.5")
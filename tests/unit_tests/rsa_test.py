@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from ssh_manager_backend.app.services.rsa import RSA
+
+OAEP = padding.OAEP(
+    mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+)
+
+
+class TestRSA:
+    @pytest.fixture(autouse=True)
+    def small_keys(self, monkeypatch):
+        generated = []
+
+        def new_private_key():
+            generated.append(1)
+            return rsa.generate_private_key(
+                public_exponent=65537, key_size=2048, backend=default_backend()
+            )
+
+        monkeypatch.setattr(RSA, "new_private_key", staticmethod(new_private_key))
+        yield generated
+
+    def test_ensure_key_pair_is_coalesced(self, small_keys):
+        key_pair = RSA()
+        workers = [threading.Thread(target=key_pair.ensure_key_pair) for _ in range(8)]
+
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert key_pair.is_generated() is True
+        assert len(small_keys) == 1
+
+    def test_rotation_keeps_previous_key(self):
+        key_pair = RSA()
+        key_pair.rotate()
+
+        previous_key_id: str = key_pair.key_id
+        ciphertext: bytes = key_pair._public_key.encrypt(b"test_key", OAEP)
+
+        key_pair.generation_time = 0
+        key_pair.rotate()
+
+        assert key_pair.key_id != previous_key_id
+        assert key_pair._next_private_key is not None
+        assert (
+            key_pair.decrypt_cipher(ciphertext, key_id=previous_key_id) == b"test_key"
+        )
+
+        # A client without a key id may still encrypt with the previous key.
+        assert key_pair.decrypt_cipher(ciphertext) == b"test_key"
+
+        key_pair.refresh_key_pair()
+
+        with pytest.raises(KeyError):
+            key_pair.decrypt_cipher(ciphertext, key_id=previous_key_id)
@@ -0,0 +1,40 @@
+import os
+import time
+
+from ssh_manager_backend.app.services.session_keys import SessionKeyCache
+
+
+class TestSessionKeyCache:
+    def test_put_and_get(self):
+        cache = SessionKeyCache()
+        key: bytes = os.urandom(32)
+
+        key_id: str = cache.put(key=key)
+
+        assert cache.put(key=key) == key_id
+        assert cache.get(key_id=key_id) == key
+        assert cache.get(key_id="non_existent_key_id") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_ttl(self):
+        cache = SessionKeyCache(ttl=0)
+        key_id: str = cache.put(key=os.urandom(32))
+        time.sleep(0.01)
+
+        assert cache.get(key_id=key_id) is None
+        assert cache.stats()["size"] == 0
+
+    def test_lru_eviction(self):
+        cache = SessionKeyCache(max_entries=2)
+        first: str = cache.put(key=os.urandom(32))
+        second: str = cache.put(key=os.urandom(32))
+
+        assert cache.get(key_id=first) is not None
+
+        third: str = cache.put(key=os.urandom(32))
+
+        assert cache.get(key_id=second) is None
+        assert cache.get(key_id=first) is not None
+        assert cache.get(key_id=third) is not None
+        assert cache.stats()["evictions"] == 1
@@ -1,6 +1,6 @@
 import pytest
 
-from ssh_manager_backend.app.models import SessionModel, UserModel
+from ssh_manager_backend.app.models import Sessions, Users
 from tests.test_ssh_manager_backend import db_cleanup
 
 
@@ -11,7 +11,7 @@ class TestSessionModel:
         db_cleanup()
 
     def test_create(self):
-        user = UserModel()
+        user = Users()
         name: str = "test_user"
         username: str = "test_username"
         password: str = b"test_password"
@@ -23,7 +23,7 @@ class TestSessionModel:
         salt_for_kek: bytes = b"test_salt_for_kek"
         salt_for_password: bytes = b"test_salt_for_password"
 
-        session = SessionModel()
+        session = Sessions()
         access_token: str = "test_access_token"
 
         assert session.create(username=username, access_token=access_token) is False
@@ -48,26 +48,64 @@ class TestSessionModel:
 
     def test_exists(self):
         username: str = "test_username"
-        session = SessionModel()
+        session = Sessions()
 
         assert session.exists(username=username) is True
         assert session.exists(username="non_existent_usernmae") is False
 
     def test_activate(self):
         username: str = "test_username"
-        session = SessionModel()
+        session = Sessions()
 
         assert session.activate_session(username=username) is True
 
     def test_deactivate(self):
         username: str = "test_username"
-        session = SessionModel()
+        session = Sessions()
 
         assert session.deactivate_session(username=username) is True
 
-    def test_access_token(self, cleanup):
+    def test_refresh_and_delete_expired(self):
         username: str = "test_username"
-        session = SessionModel()
+        session = Sessions()
+        row = session.validate(access_token="test_access_token")
 
-        assert isinstance(session.access_token(username=username), str)
-        assert session.access_token(username="non_existent_usernmae") is False
+        assert row.username == username
+        assert (
+            session.refresh(session_id=row.session_id, expires_at=row.expires_at)
+            is False
+        )
+        assert (
+            session.refresh(
+                session_id=row.session_id,
+                expires_at=row.expires_at - Sessions.ttl,
+            )
+            is False
+        )
+        assert session.delete_expired() == 0
+        assert session.exists(username=username) is True
+
+    def test_replace_token(self, cleanup):
+        username: str = "test_username"
+        session = Sessions()
+
+        # A logged out session is not replaced.
+        assert not session.replace_token(username=username, access_token="new_token")
+        assert session.activate_session(username=username)
+
+        assert session.replace_token(username=username, access_token="new_token")
+        assert session.validate(access_token="test_access_token") is None
+        assert session.validate(access_token="new_token").username == username
+        assert not session.replace_token(
+            username="non_existent_usernmae", access_token="new_token"
+        )
+
+        # Only the newest active session gets the new token.
+        assert session.create(username=username, access_token="other_token")
+        assert session.replace_token(username=username, access_token="newest_token")
+        assert session.validate(access_token="other_token") is None
+        assert session.validate(access_token="new_token").username == username
+        assert session.validate(access_token="newest_token").username == username
+
+        assert session.deactivate_session(username=username)
+        assert not session.replace_token(username=username, access_token="token")
@@ -0,0 +1,111 @@
+import time
+
+from ssh_manager_backend.app.services.key_store import FileKeyStore
+from ssh_manager_backend.app.services.revocation_filter import (
+    BloomFilter,
+    RevocationFilter,
+)
+from ssh_manager_backend.app.services.signed_tokens import SignedTokens
+
+
+class TestSignedTokens:
+    def test_issue_and_verify(self):
+        signed_tokens = SignedTokens(enabled=True)
+        access_token, expires_at = signed_tokens.issue(
+            user_id=1, username="test_username", admin=True
+        )
+        claims = signed_tokens.verify(access_token)
+
+        assert signed_tokens.is_signed(access_token)
+        assert claims["uid"] == 1
+        assert claims["sub"] == "test_username"
+        assert claims["adm"] is True
+        assert claims["exp"] == expires_at > time.time()
+
+    def test_tampered_token_is_rejected(self):
+        signed_tokens = SignedTokens(enabled=True)
+        access_token, _ = signed_tokens.issue(
+            user_id=1, username="test_username", admin=False
+        )
+        prefix, key_id, claims, signature = access_token.split(".")
+        other_token, _ = signed_tokens.issue(
+            user_id=2, username="admin_username", admin=True
+        )
+
+        assert signed_tokens.verify(access_token[:-2]) is None
+        assert (
+            signed_tokens.verify(
+                ".".join([prefix, key_id, other_token.split(".")[2], signature])
+            )
+            is None
+        )
+        assert signed_tokens.verify("dGVzdF90b2tlbg==") is None
+        assert SignedTokens().verify(access_token) is None
+
+    def test_rotation_keeps_previous_key(self):
+        signed_tokens = SignedTokens(enabled=True)
+        access_token, _ = signed_tokens.issue(
+            user_id=1, username="test_username", admin=False
+        )
+        first_key_id = signed_tokens.key_id
+
+        signed_tokens.generation_time = 0
+        signed_tokens.issue(user_id=1, username="test_username", admin=False)
+        assert signed_tokens.key_id != first_key_id
+        assert signed_tokens.verify(access_token) is not None
+
+        signed_tokens.generation_time = 0
+        signed_tokens.issue(user_id=1, username="test_username", admin=False)
+        assert signed_tokens.verify(access_token) is None
+
+    def test_workers_share_keys_through_store(self, tmp_path):
+        key_store = FileKeyStore(path=str(tmp_path / "keys.json"))
+        first_worker = SignedTokens(enabled=True, key_store=key_store)
+        second_worker = SignedTokens(enabled=True, key_store=key_store)
+        second_worker.sync_interval = 0
+
+        access_token, _ = first_worker.issue(
+            user_id=1, username="test_username", admin=False
+        )
+
+        assert second_worker.verify(access_token)["sub"] == "test_username"
+
+
+class TestRevocationFilter:
+    def test_revoke(self):
+        revocations = RevocationFilter()
+        revocations.revoke(access_token="first_access_token")
+
+        assert revocations.is_revoked(access_token="first_access_token")
+        assert not revocations.is_revoked(access_token="second_access_token")
+
+    def test_sync_replaces_hashes_and_keeps_recent_local_revocations(self):
+        source = [RevocationFilter.token_hash("first_access_token")]
+        revocations = RevocationFilter(source=lambda: source)
+        revocations.revoke(access_token="second_access_token")
+
+        revocations.sync()
+        assert revocations.is_revoked(access_token="first_access_token")
+        assert revocations.is_revoked(access_token="second_access_token")
+
+        source.clear()
+        revocations.sync_interval = -1
+        revocations.sync()
+        assert not revocations.is_revoked(access_token="first_access_token")
+        assert not revocations.is_revoked(access_token="second_access_token")
+        assert revocations.stats()["size"] == 0
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+        digests = [
+            bytes.fromhex(RevocationFilter.token_hash(str(i))) for i in range(1000)
+        ]
+        for digest in digests:
+            bloom_filter.add(digest)
+
+        assert all(digest in bloom_filter for digest in digests)
+        false_positives = sum(
+            bytes.fromhex(RevocationFilter.token_hash(str(i))) in bloom_filter
+            for i in range(1000, 11000)
+        )
+        assert false_positives < 300
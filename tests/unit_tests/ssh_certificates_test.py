@@ -0,0 +1,116 @@
+import shutil
+import subprocess
+
+import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from ssh_manager_backend.app.services.key_store import FileKeyStore
+from ssh_manager_backend.app.services.ssh_certificates import SSHCertificateAuthority
+
+
+def openssh_public_key(private_key) -> str:
+    return (
+        private_key.public_key()
+        .public_bytes(
+            encoding=serialization.Encoding.OpenSSH,
+            format=serialization.PublicFormat.OpenSSH,
+        )
+        .decode()
+    )
+
+
+class TestSSHCertificateAuthority:
+    @pytest.mark.parametrize(
+        "private_key",
+        [
+            ed25519.Ed25519PrivateKey.generate(),
+            rsa.generate_private_key(65537, 2048, default_backend()),
+            ec.generate_private_key(ec.SECP256R1(), default_backend()),
+        ],
+    )
+    def test_issue(self, private_key, tmp_path):
+        ca = SSHCertificateAuthority(max_validity=600)
+        assert ca.is_generated() is False
+
+        certificate, expires_at = ca.issue(
+            public_key=openssh_public_key(private_key),
+            key_id="test_username",
+            principals=["ubuntu@10.0.0.1", "deploy@10.0.0.1"],
+            validity=3600,
+        )
+        assert ca.is_generated() is True
+        assert ca.public_key.startswith("ssh-ed25519 ")
+        assert certificate.split()[0].endswith("-cert-v01@openssh.com")
+        assert certificate.split()[2] == "test_username"
+        assert ca.stats()["issued"] == 1
+
+        if shutil.which("ssh-keygen") is None:
+            return
+
+        # ssh-keygen verifies the signature of the CA when it reads the certificate.
+        certificate_file = tmp_path / "id-cert.pub"
+        certificate_file.write_text(certificate + "\n")
+        listing: str = subprocess.run(
+            ["ssh-keygen", "-L", "-f", str(certificate_file)],
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout.decode()
+
+        assert "user certificate" in listing
+        assert 'Key ID: "test_username"' in listing
+        assert "ubuntu@10.0.0.1" in listing and "deploy@10.0.0.1" in listing
+        assert "permit-pty" in listing
+
+    def test_encrypted_key_store(self, tmp_path):
+        key_store = FileKeyStore(path=str(tmp_path / "keys.json"))
+
+        with pytest.raises(RuntimeError):
+            SSHCertificateAuthority(key_store=key_store).ensure_key_pair()
+
+        ca = SSHCertificateAuthority(key_store=key_store, passphrase=b"test_passphrase")
+        ca.ensure_key_pair()
+        material: bytes = key_store.load(kind=ca.kind)[0]["material"]
+        assert b"ENCRYPTED" in material
+
+        # Another worker adopts the stored key-pair with the passphrase only.
+        other = SSHCertificateAuthority(
+            key_store=key_store, passphrase=b"test_passphrase"
+        )
+        other.ensure_key_pair()
+        assert other.public_key == ca.public_key
+
+        with pytest.raises(ValueError):
+            SSHCertificateAuthority(
+                key_store=key_store, passphrase=b"wrong_passphrase"
+            ).ensure_key_pair()
+
+    def test_invalid_requests(self):
+        ca = SSHCertificateAuthority()
+        public_key: str = openssh_public_key(ed25519.Ed25519PrivateKey.generate())
+
+        with pytest.raises(ValueError):
+            ca.issue(public_key=public_key, key_id="test_username", principals=[])
+
+        with pytest.raises(ValueError):
+            ca.issue(public_key="ssh-ed25519 !!!", key_id="a", principals=["ubuntu"])
+
+        with pytest.raises(ValueError):
+            ca.issue(
+                public_key="ssh-dss AAAAB3NzaC1kc3M=", key_id="a", principals=["ubuntu"]
+            )
+
+        # PEM public keys are converted to the OpenSSH format.
+        pem_public_key: bytes = (
+            ed25519.Ed25519PrivateKey.generate()
+            .public_key()
+            .public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+        )
+        certificate, _ = ca.issue(
+            public_key=pem_public_key, key_id="a", principals=["ubuntu"]
+        )
+        assert certificate.startswith("ssh-ed25519-cert-v01@openssh.com ")
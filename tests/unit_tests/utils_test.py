@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from ssh_manager_backend.app.services import utils
+
+
+class TestKeyDerivation:
+    def test_versions(self):
+        dek: bytes = os.urandom(32)
+        salt: bytes = os.urandom(32)
+
+        assert utils.derive_dek_key(dek=dek, salt=salt, kdf_version=None) == (
+            utils.pbkdf(data=dek, salt=salt)
+        )
+        assert utils.derive_dek_key(
+            dek=dek, salt=salt, kdf_version=utils.KDF_HKDF
+        ) == utils.hkdf(data=dek, salt=salt)
+        assert utils.hkdf(data=dek, salt=salt) != utils.pbkdf(data=dek, salt=salt)
+
+        with pytest.raises(ValueError):
+            utils.derive_dek_key(dek=dek, salt=salt, kdf_version=0)
+
+    def test_encrypt_and_decrypt_with_dek(self):
+        dek: bytes = os.urandom(32)
+        salt: bytes = os.urandom(32)
+        iv: bytes = os.urandom(16)
+
+        ciphertext: bytes = utils.encrypt_with_dek(
+            plaintext="test_ssh_key", dek=dek, salt=salt, iv=iv
+        )
+
+        assert (
+            utils.decrypt_with_dek(
+                ciphertext=ciphertext,
+                dek=dek,
+                salt=salt,
+                iv=iv,
+                kdf_version=utils.CURRENT_KDF_VERSION,
+            )
+            == b"test_ssh_key"
+        )
+
+    def test_matches_hash(self):
+        key_hash: str = utils.hash_data(data="test_ssh_key", salt=b"").hex()
+
+        assert utils.matches_hash(data=b"test_ssh_key", hashed=key_hash)
+        assert not utils.matches_hash(data=b"other_ssh_key", hashed=key_hash)
+        assert not utils.matches_hash(data=False, hashed=key_hash)  # failed decryption
+        assert not utils.matches_hash(data=b"test_ssh_key", hashed=None)
@@ -0,0 +1,37 @@
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from ssh_manager_backend.app.services.x25519 import X25519
+
+
+class TestX25519:
+    def test_derive_key(self):
+        server = X25519()
+        assert server.is_generated() is False
+
+        server.generate_key_pair()
+        assert server.is_generated() is True
+        assert server.public_key.startswith("-----BEGIN PUBLIC KEY-----")
+
+        client_key = x25519.X25519PrivateKey.generate()
+        client_public_key: bytes = client_key.public_key().public_bytes(
+            encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+        )
+        server_public_key = serialization.load_pem_public_key(
+            data=bytes(server.public_key, encoding="utf-8"), backend=default_backend()
+        )
+        client_derived_key: bytes = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"ssh-key-manager request key"
+            + client_public_key
+            + server.public_key_bytes(),
+            backend=default_backend(),
+        ).derive(client_key.exchange(server_public_key))
+
+        assert (
+            server.derive_key(peer_public_key=client_public_key) == client_derived_key
+        )